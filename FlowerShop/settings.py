@@ -32,6 +32,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'backend.middleware.StaticFilesMiddleware',
+    'backend.middleware.RequestTimingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -44,7 +46,8 @@ ROOT_URLCONF = 'FlowerShop.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Шаблонизатор Django с замером времени отрисовки для Server-Timing
+        'BACKEND': 'backend.request_timing.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -60,16 +63,74 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'FlowerShop.wsgi.application'
 
+# Замер SQL, шаблонов и view в заголовке Server-Timing: доля замеряемых
+# запросов (0 - выключено), порог медленного запроса в мс для записи в лог
+# и сколько одинаковых SQL за запрос считать признаком N+1
+REQUEST_TIMING_SAMPLE_RATE = env.float('REQUEST_TIMING_SAMPLE_RATE', default=0.1)
+SLOW_REQUEST_THRESHOLD = env.int('SLOW_REQUEST_THRESHOLD', default=500)
+REPEATED_QUERY_THRESHOLD = 5
+# Адреса, которым Server-Timing отдаётся без входа в админку
+INTERNAL_IPS = env.list('INTERNAL_IPS', default=[])
+
+# Метрики для Prometheus на /metrics: счётчики всех процессов сервера
+# складываются в общий файл SQLite. /metrics отдаётся только с заголовком
+# Authorization: Bearer <токен>; без токена эндпоинт выключен
+METRICS_DB_PATH = env('METRICS_DB_PATH', default=str(BASE_DIR / 'metrics.sqlite3'))
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+# Тесты пишут метрики во временный файл, а не в METRICS_DB_PATH
+TEST_RUNNER = 'backend.test_runner.TestRunner'
+
 
 # Database
 
+# Настройки соединения с SQLite для параллельной записи:
+# - WAL: чтение не ждёт записи, а запись не ждёт чтения;
+# - synchronous=NORMAL: в режиме WAL безопасно при сбое приложения,
+#   при отключении питания можно потерять последние транзакции;
+# - busy_timeout: сколько миллисекунд ждать, пока база занята другой записью;
+# - cache_size (отрицательное значение - в КиБ) и mmap_size ускоряют чтение.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': env('SQLITE_SYNCHRONOUS', default='NORMAL'),
+    'busy_timeout': env.int('SQLITE_BUSY_TIMEOUT', default=20000),
+    'cache_size': env.int('SQLITE_CACHE_SIZE', default=-32000),
+    'mmap_size': env.int('SQLITE_MMAP_SIZE', default=128 * 1024 * 1024),
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(
+                f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()
+            ),
+            # Транзакция сразу берёт блокировку записи: параллельные записи
+            # выстраиваются в очередь по busy_timeout, а не падают при попытке
+            # перейти от чтения к записи
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # Тестовая база в файле, а не в памяти: общая in-memory база SQLite
+        # не ждёт снятия блокировки, и тесты параллельных заказов падают
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Сколько секунд неоплаченный заказ держит элементы на складе
+ORDER_PAYMENT_TIMEOUT = env.int('ORDER_PAYMENT_TIMEOUT', default=30 * 60)
+
+
+# Cache
+# По умолчанию кеш в памяти процесса. Если сервер запущен в несколько
+# процессов, нужен общий кеш, например файловый:
+# CACHE_URL=filecache:///var/tmp/flowershop_cache
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+PAGE_CACHE_TIMEOUT = env.int('PAGE_CACHE_TIMEOUT', default=600)
+
 
 # Password validation
 
@@ -104,6 +165,18 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # collectstatic пережимает изображения, добавляет хеш к именам файлов
+    # и готовит gzip/brotli копии
+    'staticfiles': {
+        'BACKEND': 'backend.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 # MEDIA files
 MEDIA_URL = '/media/'
@@ -118,5 +191,6 @@ SESSION_COOKIE_SECURE = True
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 YOOKASSA_SHOP_ID = env.int('YOOKASSA_SHOP_ID')
 YOOKASSA_SECRET_KEY = env.str('YOOKASSA_SECRET_KEY')
+YOOKASSA_API_URL = env.str('YOOKASSA_API_URL', default='https://api.yookassa.ru/v3')
 TG_BOT_TOKEN = env.str("TG_BOT_TOKEN")
 TG_CHAT_ID = env.str("TG_CHAT_ID")
\ No newline at end of file
@@ -1,3 +1,6 @@
+import re
+
+import phonenumbers
 from django.contrib import admin
 from .models import (
     Staff,
@@ -9,11 +12,71 @@ from .models import (
     Event,
     PriceRange,
     Consultation,
+    Notification,
+    StockReservation,
 )
+from django.core.paginator import Paginator
+from django.db.models import Max, Prefetch
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django.contrib.admin import action
 
 
+from .availability import get_buildable_counts
+from .stock import cancel_orders
+from .thumbnails import get_derivative_name
+
+
+PHONE_SEARCH = re.compile(r"\+?\d{10,15}")
+# Регион для номеров, введённых без кода страны: 9001234567, 89001234567
+PHONE_SEARCH_REGION = "RU"
+
+
+def get_phone_variants(term):
+    """Номер как введён и в формате +7…, в котором телефоны сохраняет форма"""
+    variants = {term}
+    try:
+        number = phonenumbers.parse(term, PHONE_SEARCH_REGION)
+    except phonenumbers.NumberParseException:
+        return variants
+    if phonenumbers.is_valid_number(number):
+        variants.add(phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164))
+    return variants
+
+
+def render_image_preview(image):
+    if not image:
+        return "No Image"
+    return format_html(
+        '<img src="{url}" srcset="{url} 1x, {url_2x} 2x" style="max-width: {max_width}px; max-height: {max_height}px; width: auto; height: auto;"/>',
+        max_width=200,
+        max_height=200,
+        url=image.storage.url(get_derivative_name(image.name, 200, "JPEG")),
+        url_2x=image.storage.url(get_derivative_name(image.name, 400, "JPEG")),
+    )
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, который не считает COUNT(*) по большим таблицам.
+
+    Для списка без фильтров число строк оценивается по максимальному id:
+    это одно чтение индекса вместо полного прохода по таблице. Удалённые
+    строки оценку завышают, поэтому точный COUNT(*) остаётся для небольших
+    таблиц и для отфильтрованных списков.
+    """
+
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = queryset.aggregate(estimate=Max("pk"))["estimate"] or 0
+            if estimate > self.exact_count_limit:
+                return estimate
+        return super().count
+
+
 # Register your models here.
 @admin.register(Staff)
 class StaffAdmin(admin.ModelAdmin):
@@ -25,9 +88,11 @@ class StaffAdmin(admin.ModelAdmin):
 
 @admin.register(Consultation)
 class ConsultationAdmin(admin.ModelAdmin):
-    list_display = ["name", "phone"]
+    list_display = ["name", "phone", "created_at"]
     list_filter = ["created_at"]
-    search_fields = ["created_at"]
+    search_fields = ["name", "phone"]
+    date_hierarchy = "created_at"
+    ordering = ["-created_at"]
 
 
 @admin.register(Customer)
@@ -45,14 +110,7 @@ class ComponentAdmin(admin.ModelAdmin):
     readonly_fields = ["image_preview"]
 
     def image_preview(self, obj):
-        if obj.image:
-            return format_html(
-                '<img src="{url}" style="max-width: {max_width}px; max-height: {max_height}px; width: auto; height: auto;"/>',
-                max_width=200,
-                max_height=200,
-                url=obj.image.url,
-            )
-        return "No Image"
+        return render_image_preview(obj.image)
 
     image_preview.short_description = "Превью изображения"
 
@@ -62,6 +120,9 @@ class BouquetComponentInline(admin.TabularInline):
     extra = 0
     fields = ("component", "quantity")
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("bouquet", "component")
+
 
 @admin.register(Bouquet)
 class BouquetAdmin(admin.ModelAdmin):
@@ -69,18 +130,35 @@ class BouquetAdmin(admin.ModelAdmin):
     list_display = [
         "name",
         "total_price",
+        "buildable",
         "view_composition",
         "view_events",
     ]
     list_filter = ["events"]
     readonly_fields = ["image_preview", "view_composition", "total_price"]
-    search_fields = ["name", "events", "total_price"]
+    search_fields = ["name", "events__name"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
-    def save_related(self, request, form, formsets, change):
-        super().save_related(request, form, formsets, change)
-        bouquet = form.instance
-        bouquet.total_price = bouquet.get_price()
-        bouquet.save(update_fields=["total_price"])
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            "events",
+            Prefetch(
+                "components",
+                queryset=BouquetComponent.objects.select_related("component"),
+            ),
+        )
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        counts = get_buildable_counts()
+        for bouquet in changelist.result_list:
+            bouquet.buildable = counts.get(bouquet.pk)
+        return changelist
+
+    @admin.display(description="Можно собрать")
+    def buildable(self, obj):
+        return "—" if obj.buildable is None else obj.buildable
 
     def view_events(self, obj):
         return ", ".join(f"{event}" for event in obj.events.all())
@@ -93,36 +171,77 @@ class BouquetAdmin(admin.ModelAdmin):
     view_composition.short_description = "Состав композиции"
 
     def image_preview(self, obj):
-        if obj.image:
-            return format_html(
-                '<img src="{url}" style="max-width: {max_width}px; max-height: {max_height}px; width: auto; height: auto;"/>',
-                max_width=200,
-                max_height=200,
-                url=obj.image.url,
-            )
-        return "No Image"
+        return render_image_preview(obj.image)
 
     image_preview.short_description = "Превью изображения"
 
 
+class StockReservationInline(admin.TabularInline):
+    model = StockReservation
+    extra = 0
+    fields = ("component", "quantity")
+    readonly_fields = ("component", "quantity")
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("component")
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    inlines = [StockReservationInline]
     list_display = [
         "customer_name",
         "customer_phone",
         "delivery_address",
         "delivery_time",
         "bouquet",
+        "status",
         "created_at",
     ]
+    list_filter = ["status"]
+    list_select_related = ["bouquet"]
+    readonly_fields = ["payment_id"]
+    actions = ["mark_assembled", "mark_delivered", "cancel"]
     search_fields = [
         "customer_name",
         "customer_phone",
         "delivery_address",
         "delivery_time",
-        "bouquet",
-        "created_at",
+        "bouquet__name",
     ]
+    date_hierarchy = "created_at"
+    ordering = ["-created_at"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Телефон сначала ищется точным совпадением по индексу; если так
+        # ничего не нашлось, работает обычный поиск по подстроке
+        term = search_term.strip()
+        if PHONE_SEARCH.fullmatch(term):
+            found = queryset.filter(customer_phone__in=get_phone_variants(term))
+            if found.exists():
+                return found, False
+        return super().get_search_results(request, queryset, search_term)
+
+    @action(description="Отметить как собранные")
+    def mark_assembled(self, request, queryset):
+        updated = queryset.move_to("assembled")
+        self.message_user(request, f"Собрано заказов: {updated}")
+
+    @action(description="Отметить как доставленные")
+    def mark_delivered(self, request, queryset):
+        updated = queryset.move_to("delivered")
+        self.message_user(request, f"Доставлено заказов: {updated}")
+
+    @action(description="Отменить и вернуть элементы на склад")
+    def cancel(self, request, queryset):
+        canceled = cancel_orders(queryset)
+        self.message_user(request, f"Отменено заказов: {canceled}")
 
 
 @admin.register(Event)
@@ -135,3 +254,10 @@ class EventAdmin(admin.ModelAdmin):
 class PriceRangeAdmin(admin.ModelAdmin):
     list_display = ["name", "min_price", "max_price"]
     search_fields = ["name"]
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ["pk", "status", "attempts", "created_at", "sent_at"]
+    list_filter = ["status"]
+    readonly_fields = ["created_at", "sent_at", "last_error"]
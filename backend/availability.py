@@ -0,0 +1,88 @@
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import BouquetComponent, buildable_count_expression
+from .page_cache import bump_storefront_version
+
+
+BUILDABLE_COUNTS_KEY = "stock:buildable"
+# Частичные обновления из разных процессов могут затереть друг друга, поэтому
+# полный пересчёт всё равно выполняется не реже раза в BUILDABLE_COUNTS_TIMEOUT
+BUILDABLE_COUNTS_TIMEOUT = 5 * 60
+
+
+def compute_buildable_counts(component_ids=None):
+    """Сколько экземпляров каждого букета можно собрать из остатков склада.
+
+    Считается одним агрегирующим запросом по составам: минимум
+    stock // quantity по элементам букета. Букетов без состава в ответе нет.
+    С component_ids считаются только букеты, в которые входят эти элементы.
+    """
+    compositions = BouquetComponent.objects.all()
+    if component_ids is not None:
+        compositions = compositions.filter(
+            bouquet_id__in=BouquetComponent.objects.filter(
+                component_id__in=component_ids
+            ).values("bouquet_id")
+        )
+    return dict(
+        compositions.values("bouquet_id")
+        .annotate(buildable=buildable_count_expression())
+        .values_list("bouquet_id", "buildable")
+    )
+
+
+def get_buildable_counts():
+    """{id букета: сколько можно собрать}, из кеша или свежим подсчётом"""
+    counts = cache.get(BUILDABLE_COUNTS_KEY)
+    if counts is None:
+        counts = compute_buildable_counts()
+        cache.set(BUILDABLE_COUNTS_KEY, counts, timeout=BUILDABLE_COUNTS_TIMEOUT)
+    return counts
+
+
+def get_unavailable_ids(counts):
+    return {bouquet_id for bouquet_id, buildable in counts.items() if buildable == 0}
+
+
+def refresh_buildable_counts(component_ids=None):
+    """Пересчитывает остатки; витрина сбрасывается, только если какой-то
+    букет закончился или снова появился в наличии.
+
+    С component_ids пересчитываются только букеты с этими элементами, и
+    результат дописывается в закешированные числа: заказ не запускает
+    агрегат по всему каталогу.
+    """
+    previous = cache.get(BUILDABLE_COUNTS_KEY)
+    if previous is None or component_ids is None:
+        counts = compute_buildable_counts()
+    else:
+        counts = {**previous, **compute_buildable_counts(component_ids)}
+    cache.set(BUILDABLE_COUNTS_KEY, counts, timeout=BUILDABLE_COUNTS_TIMEOUT)
+    if previous is None or get_unavailable_ids(previous) != get_unavailable_ids(counts):
+        bump_storefront_version()
+
+
+def invalidate_buildable_counts(component_ids=None):
+    """Пересчитывает остатки после коммита: до него изменения склада не видны
+    другим соединениям, и прежние числа в кеше остаются верными.
+
+    component_ids — элементы, остаток которых изменился; без них после
+    изменения составов пересчитывается весь каталог.
+    """
+    transaction.on_commit(partial(refresh_buildable_counts, component_ids))
+
+
+def mark_availability(bouquets):
+    """Проставляет букетам признак is_available; букеты без состава доступны"""
+    counts = get_buildable_counts()
+    for bouquet in bouquets:
+        bouquet.is_available = counts.get(bouquet.pk) != 0
+    return bouquets
+
+
+def exclude_unavailable(bouquets):
+    counts = get_buildable_counts()
+    return [bouquet for bouquet in bouquets if counts.get(bouquet.pk) != 0]
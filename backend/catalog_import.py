@@ -0,0 +1,520 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+
+from django.core.files import File
+from django.db import transaction
+
+from .models import Bouquet, BouquetComponent, Component, Event, PriceRange
+from .availability import invalidate_buildable_counts
+from .page_cache import invalidate_storefront
+from .quiz_index import rebuild_quiz_index, update_quiz_index
+from .search import rebuild_search_index, update_search_index
+from .thumbnails import generate_derivatives
+
+
+BouquetEvent = Bouquet.events.through
+
+
+class JsonStreamReader:
+    """Читает JSON-файл кусками, не загружая его в память целиком"""
+
+    def __init__(self, file, chunk_size=1 << 16):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder(parse_float=Decimal)
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Возвращает следующий значимый символ, пропуская пробелы"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Ожидался символ {char!r} в позиции {self.pos}")
+        self.pos += 1
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # Число на границе куска могло прочитаться не полностью
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_sections(file, chunk_size=1 << 16):
+    """Перебирает элементы массивов верхнего уровня JSON-объекта.
+
+    Возвращает пары (ключ, элемент) в порядке следования в файле. Значения
+    верхнего уровня, не являющиеся массивами, пропускаются.
+    """
+    reader = JsonStreamReader(file, chunk_size)
+    reader.expect("{")
+    while True:
+        char = reader.peek()
+        if char == "}":
+            return
+        if char == ",":
+            reader.pos += 1
+            continue
+        key = reader.decode()
+        reader.expect(":")
+        if reader.peek() != "[":
+            reader.decode()
+            continue
+        reader.pos += 1
+        while True:
+            char = reader.peek()
+            if char == "]":
+                reader.pos += 1
+                break
+            if char == ",":
+                reader.pos += 1
+                continue
+            yield key, reader.decode()
+
+
+class BulkCatalogImporter:
+    """Пакетная загрузка каталога из JSON.
+
+    Существующие ключи каждой модели загружаются одним запросом, новые строки
+    вставляются через bulk_create пачками по batch_size. Как и построчная
+    загрузка, существующие элементы и букеты не перезаписываются; количество
+    элемента в букете обновляется.
+    """
+
+    def __init__(self, media_root=None, batch_size=500, log=None, image_workers=8):
+        self.media_root = Path(media_root) if media_root else None
+        self.batch_size = batch_size
+        self.image_workers = image_workers
+        self.image_futures = {}
+        self.queued_images = []
+        self.log = log or (lambda message: None)
+        self.stats = dict.fromkeys(
+            [
+                "prices",
+                "components",
+                "bouquets",
+                "events",
+                "bouquet_components",
+                "updated_quantities",
+                "missing_components",
+            ],
+            0,
+        )
+        self.pending = {"prices": [], "components": [], "bouquets": []}
+
+    def load_existing(self):
+        self.price_keys = set(PriceRange.objects.values_list("min_price", "max_price"))
+        self.component_ids = dict(Component.objects.values_list("name", "pk"))
+        self.bouquet_ids = dict(Bouquet.objects.values_list("name", "pk"))
+        self.event_ids = dict(Event.objects.values_list("name", "pk"))
+        self.bouquet_events = set(BouquetEvent.objects.values_list("bouquet_id", "event_id"))
+        self.bouquet_components = {
+            (bouquet_id, component_id): (pk, quantity)
+            for pk, bouquet_id, component_id, quantity in BouquetComponent.objects.values_list(
+                "pk", "bouquet_id", "component_id", "quantity"
+            )
+        }
+
+    def run(self, json_file):
+        with (
+            open(json_file, "r", encoding="utf-8") as jfile,
+            ThreadPoolExecutor(max_workers=self.image_workers) as self.executor,
+            transaction.atomic(),
+        ):
+            self.load_existing()
+            # Букетам нужны id элементов. Пока раздел элементов не прочитан
+            # целиком (например, в файле он идёт после букетов), букеты
+            # копятся в памяти и загружаются после элементов
+            read_sections, current = set(), None
+            for section, item in iter_json_sections(jfile):
+                if section not in self.pending:
+                    continue
+                if section != current:
+                    read_sections.add(current)
+                    current = section
+                components_read = "components" in read_sections
+                if section == "bouquets":
+                    self.flush("prices")
+                    self.flush("components")
+                self.pending[section].append(item)
+                if len(self.pending[section]) >= self.batch_size and (
+                    section != "bouquets" or components_read
+                ):
+                    self.flush(section)
+            for section in self.pending:
+                self.flush(section)
+            self.finish()
+            # bulk_create и update() не вызывают сигналы моделей
+            invalidate_storefront()
+            invalidate_buildable_counts()
+        return self.stats
+
+    def finish(self):
+        rebuild_quiz_index()
+        rebuild_search_index()
+
+    def flush(self, section):
+        items = self.pending[section]
+        if not items:
+            return
+        getattr(self, f"import_{section}")(items)
+        self.pending[section] = []
+        self.log(
+            ", ".join(f"{name}: {count}" for name, count in self.stats.items())
+        )
+
+    def store_image(self, field, name, source_path):
+        with open(source_path, "rb") as img_file:
+            stored_name = field.storage.save(
+                field.generate_filename(None, name), File(img_file)
+            )
+        generate_derivatives(stored_name, field.storage)
+        return stored_name
+
+    def queue_image(self, instance, name, source_path):
+        """Ставит копирование изображения и создание его копий в пул потоков.
+
+        Каждый исходный файл хешируется и копируется один раз за загрузку,
+        сколько бы записей на него ни ссылалось.
+        """
+        future = self.image_futures.get(source_path)
+        if future is None:
+            field = instance._meta.get_field("image")
+            future = self.executor.submit(self.store_image, field, name, source_path)
+            self.image_futures[source_path] = future
+        self.queued_images.append((instance, future))
+
+    def resolve_images(self):
+        for instance, future in self.queued_images:
+            instance.image = future.result()
+        self.queued_images = []
+
+    def import_prices(self, items):
+        new_ranges = []
+        for price_item in items:
+            key = (
+                Decimal(price_item.get("min_price", 0)),
+                Decimal(price_item.get("max_price", 0)),
+            )
+            if key in self.price_keys:
+                continue
+            self.price_keys.add(key)
+            price_range = PriceRange(min_price=key[0], max_price=key[1])
+            price_range.name = price_range.get_name()
+            new_ranges.append(price_range)
+        PriceRange.objects.bulk_create(new_ranges)
+        self.stats["prices"] += len(new_ranges)
+
+    def build_component(self, component_data):
+        component = Component(
+            name=component_data["name"],
+            type=component_data["type"],
+            price=Decimal(component_data["price"]),
+            note=component_data.get("note", ""),
+            stock=int(component_data.get("stock", 0)),
+        )
+        if component_data.get("image") and self.media_root:
+            image_path = self.media_root / component_data["image"]
+            if image_path.exists():
+                self.queue_image(component, component_data["image"], image_path)
+        return component
+
+    def import_components(self, items):
+        new_components = []
+        for component_data in items:
+            if component_data["name"] in self.component_ids:
+                continue
+            component = self.build_component(component_data)
+            self.component_ids[component.name] = None
+            new_components.append(component)
+        self.resolve_images()
+        Component.objects.bulk_create(new_components)
+        for component in new_components:
+            self.component_ids[component.name] = component.pk
+        self.stats["components"] += len(new_components)
+
+    def build_bouquet(self, bouquet_data):
+        bouquet = Bouquet(
+            name=bouquet_data["name"],
+            base_price=Decimal(bouquet_data.get("base_price")),
+            description=bouquet_data.get("description"),
+        )
+        if bouquet_data.get("image") and self.media_root:
+            image_path = self.media_root / bouquet_data["image"]
+            if not image_path.exists():
+                image_path = self.media_root / "images/default.jpg"
+            self.queue_image(bouquet, bouquet_data["image"], image_path)
+        return bouquet
+
+    def import_bouquets(self, items):
+        new_bouquets = []
+        for bouquet_data in items:
+            if bouquet_data["name"] in self.bouquet_ids:
+                continue
+            bouquet = self.build_bouquet(bouquet_data)
+            self.bouquet_ids[bouquet.name] = None
+            new_bouquets.append(bouquet)
+        self.resolve_images()
+        Bouquet.objects.bulk_create(new_bouquets)
+        for bouquet in new_bouquets:
+            self.bouquet_ids[bouquet.name] = bouquet.pk
+        self.stats["bouquets"] += len(new_bouquets)
+
+        self.import_bouquet_events(items)
+        self.import_bouquet_components(items)
+        Bouquet.objects.filter(
+            pk__in=[self.bouquet_ids[item["name"]] for item in items]
+        ).update_total_prices()
+
+    def import_bouquet_events(self, items):
+        new_events = []
+        for bouquet_data in items:
+            for event_name in bouquet_data.get("events", []):
+                if event_name not in self.event_ids:
+                    self.event_ids[event_name] = None
+                    new_events.append(Event(name=event_name))
+        Event.objects.bulk_create(new_events)
+        for event in new_events:
+            self.event_ids[event.name] = event.pk
+        self.stats["events"] += len(new_events)
+
+        new_links = []
+        for bouquet_data in items:
+            bouquet_id = self.bouquet_ids[bouquet_data["name"]]
+            for event_name in bouquet_data.get("events", []):
+                key = (bouquet_id, self.event_ids[event_name])
+                if key not in self.bouquet_events:
+                    self.bouquet_events.add(key)
+                    new_links.append(BouquetEvent(bouquet_id=key[0], event_id=key[1]))
+        BouquetEvent.objects.bulk_create(new_links)
+
+    def import_bouquet_components(self, items):
+        new_items, changed_items = [], []
+        for bouquet_data in items:
+            bouquet_id = self.bouquet_ids[bouquet_data["name"]]
+            for component_item in bouquet_data.get("components", []):
+                component_id = self.component_ids.get(component_item["name"])
+                if component_id is None:
+                    self.stats["missing_components"] += 1
+                    continue
+                quantity = component_item.get("quantity", 1)
+                existing = self.bouquet_components.get((bouquet_id, component_id))
+                if existing is None:
+                    new_items.append(
+                        BouquetComponent(
+                            bouquet_id=bouquet_id,
+                            component_id=component_id,
+                            quantity=quantity,
+                        )
+                    )
+                    self.bouquet_components[bouquet_id, component_id] = (None, quantity)
+                elif existing[0] is not None and existing[1] != quantity:
+                    changed_items.append(BouquetComponent(pk=existing[0], quantity=quantity))
+                    self.bouquet_components[bouquet_id, component_id] = (existing[0], quantity)
+        BouquetComponent.objects.bulk_create(new_items)
+        BouquetComponent.objects.bulk_update(changed_items, ["quantity"])
+        self.stats["bouquet_components"] += len(new_items)
+        self.stats["updated_quantities"] += len(changed_items)
+
+
+
+def fingerprint(record):
+    """Хеш содержимого записи фида, не зависящий от порядка ключей"""
+    payload = json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CatalogSyncImporter(BulkCatalogImporter):
+    """Инкрементальная синхронизация каталога с фидом поставщика.
+
+    Для каждого элемента и букета хранится хеш последней импортированной
+    записи; обновляются только записи, содержимое которых изменилось.
+    Переоцениваются только букеты, затронутые изменёнными элементами.
+    """
+
+    def __init__(self, delete_missing=False, **kwargs):
+        super().__init__(**kwargs)
+        self.delete_missing = delete_missing
+        self.stats.update(
+            updated_components=0,
+            updated_bouquets=0,
+            deleted_components=0,
+            deleted_bouquets=0,
+        )
+        self.seen_components = set()
+        self.seen_bouquets = set()
+        self.changed_components = set()
+        self.affected_bouquets = set()
+        self.unlinked_events = set()
+
+    def load_existing(self):
+        super().load_existing()
+        self.component_hashes = dict(Component.objects.values_list("name", "import_hash"))
+        self.bouquet_hashes = dict(Bouquet.objects.values_list("name", "import_hash"))
+
+    def build_component(self, component_data):
+        component = super().build_component(component_data)
+        component.import_hash = fingerprint(component_data)
+        return component
+
+    def build_bouquet(self, bouquet_data):
+        bouquet = super().build_bouquet(bouquet_data)
+        bouquet.import_hash = fingerprint(bouquet_data)
+        return bouquet
+
+    def import_components(self, items):
+        changed = []
+        for component_data in items:
+            name = component_data["name"]
+            self.seen_components.add(name)
+            if name not in self.component_ids:
+                continue
+            if self.component_hashes.get(name) == fingerprint(component_data):
+                continue
+            component = self.build_component(component_data)
+            component.pk = self.component_ids[name]
+            self.component_hashes[name] = component.import_hash
+            changed.append(component)
+        self.resolve_images()
+        Component.objects.bulk_update(
+            changed, ["type", "price", "note", "stock", "import_hash"]
+        )
+        # Изображение заменяется, только если оно есть в фиде
+        Component.objects.bulk_update(
+            [component for component in changed if component.image], ["image"]
+        )
+        self.changed_components.update(component.pk for component in changed)
+        self.stats["updated_components"] += len(changed)
+        super().import_components(items)
+
+    def import_bouquets(self, items):
+        new_items, changed_items = [], []
+        for bouquet_data in items:
+            name = bouquet_data["name"]
+            self.seen_bouquets.add(name)
+            if name not in self.bouquet_ids:
+                new_items.append(bouquet_data)
+            elif self.bouquet_hashes.get(name) != fingerprint(bouquet_data):
+                changed_items.append(bouquet_data)
+        super().import_bouquets(new_items)
+        self.affected_bouquets.update(self.bouquet_ids[item["name"]] for item in new_items)
+        if changed_items:
+            self.update_bouquets(changed_items)
+
+    def update_bouquets(self, items):
+        bouquets = []
+        for bouquet_data in items:
+            bouquet = self.build_bouquet(bouquet_data)
+            bouquet.pk = self.bouquet_ids[bouquet.name]
+            self.bouquet_hashes[bouquet.name] = bouquet.import_hash
+            bouquets.append(bouquet)
+        self.resolve_images()
+        Bouquet.objects.bulk_update(bouquets, ["base_price", "description", "import_hash"])
+        Bouquet.objects.bulk_update([bouquet for bouquet in bouquets if bouquet.image], ["image"])
+
+        bouquet_ids = [bouquet.pk for bouquet in bouquets]
+        self.remove_stale_links(items)
+        self.import_bouquet_events(items)
+        self.import_bouquet_components(items)
+        Bouquet.objects.filter(pk__in=bouquet_ids).update_total_prices()
+        self.affected_bouquets.update(bouquet_ids)
+        self.stats["updated_bouquets"] += len(bouquets)
+
+    def remove_stale_links(self, items):
+        """Отвязывает события и элементы, которых больше нет в записях букетов"""
+        wanted_events, wanted_components = set(), set()
+        for bouquet_data in items:
+            bouquet_id = self.bouquet_ids[bouquet_data["name"]]
+            wanted_events.update(
+                (bouquet_id, self.event_ids.get(name)) for name in bouquet_data.get("events", [])
+            )
+            wanted_components.update(
+                (bouquet_id, self.component_ids.get(item["name"]))
+                for item in bouquet_data.get("components", [])
+            )
+        bouquet_ids = [self.bouquet_ids[item["name"]] for item in items]
+
+        stale_events = [
+            (pk, bouquet_id, event_id)
+            for pk, bouquet_id, event_id in BouquetEvent.objects.filter(
+                bouquet_id__in=bouquet_ids
+            ).values_list("pk", "bouquet_id", "event_id")
+            if (bouquet_id, event_id) not in wanted_events
+        ]
+        BouquetEvent.objects.filter(pk__in=[pk for pk, *_ in stale_events]).delete()
+        for _, bouquet_id, event_id in stale_events:
+            self.bouquet_events.discard((bouquet_id, event_id))
+            self.unlinked_events.add(event_id)
+
+        stale_components = [
+            (pk, bouquet_id, component_id)
+            for pk, bouquet_id, component_id in BouquetComponent.objects.filter(
+                bouquet_id__in=bouquet_ids
+            ).values_list("pk", "bouquet_id", "component_id")
+            if (bouquet_id, component_id) not in wanted_components
+        ]
+        BouquetComponent.objects.filter(pk__in=[pk for pk, *_ in stale_components]).delete()
+        for _, bouquet_id, component_id in stale_components:
+            del self.bouquet_components[bouquet_id, component_id]
+
+    def finish(self):
+        if self.delete_missing:
+            self.delete_vanished()
+        changed_components = list(self.changed_components)
+        for start in range(0, len(changed_components), self.batch_size):
+            repriced = set(
+                BouquetComponent.objects.filter(
+                    component_id__in=changed_components[start:start + self.batch_size]
+                ).values_list("bouquet_id", flat=True)
+            )
+            Bouquet.objects.filter(pk__in=repriced).update_total_prices()
+            self.affected_bouquets |= repriced
+        update_quiz_index(self.affected_bouquets, self.unlinked_events)
+        update_search_index(self.affected_bouquets)
+
+    def delete_vanished(self):
+        """Удаляет элементы и букеты, исчезнувшие из фида"""
+        vanished_components = [
+            pk for name, pk in self.component_ids.items() if name not in self.seen_components
+        ]
+        vanished_bouquets = [
+            pk for name, pk in self.bouquet_ids.items() if name not in self.seen_bouquets
+        ]
+        for model, ids in [(Component, vanished_components), (Bouquet, vanished_bouquets)]:
+            for start in range(0, len(ids), self.batch_size):
+                model.objects.filter(pk__in=ids[start:start + self.batch_size]).delete()
+        self.changed_components.difference_update(vanished_components)
+        self.affected_bouquets.difference_update(vanished_bouquets)
+        self.stats["deleted_components"] = len(vanished_components)
+        self.stats["deleted_bouquets"] = len(vanished_bouquets)
@@ -0,0 +1,252 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Bouquet,
+    BouquetComponent,
+    Component,
+    Consultation,
+    Customer,
+    Event,
+    Order,
+    PriceRange,
+)
+from .quiz_index import rebuild_quiz_index
+from .search import rebuild_search_index
+
+
+# Синтетические данные для бенчмарков: одинаковый seed даёт одинаковую базу
+FLOWERS = [
+    "Роза", "Пион", "Тюльпан", "Лилия", "Хризантема", "Ромашка", "Гортензия",
+    "Орхидея", "Эустома", "Гербера", "Ирис", "Альстромерия", "Гвоздика", "Фрезия",
+]
+COLORS = ["белая", "красная", "розовая", "жёлтая", "кремовая", "сиреневая", "синяя"]
+ACCESSORIES = ["Лента атласная", "Упаковка крафт", "Упаковка плёнка", "Эвкалипт", "Открытка"]
+EVENTS = [
+    "День рождения", "Свадьба", "Юбилей", "8 Марта", "14 Февраля",
+    "Выпускной", "1 Сентября", "Рождение ребёнка", "Извинение", "Без повода",
+]
+ADJECTIVES = ["Нежный", "Яркий", "Весенний", "Летний", "Праздничный", "Воздушный", "Сказочный"]
+NOUNS = ["букет", "микс", "сюрприз", "вальс", "рассвет", "сад", "каприз"]
+# Границы ценовых диапазонов квиза: «До 1000», «От 1000 до 3000», …; если
+# диапазонов нужно больше, следующие границы идут с шагом PRICE_RANGE_STEP.
+# Бюджеты bench_storefront замерены на диапазонах по умолчанию
+PRICE_RANGE_BOUNDS = [1000, 3000, 6000]
+PRICE_RANGE_STEP = 3000
+# Размер состава: чаще 3–6 позиций, реже крупные композиции
+COMPOSITION_SIZES = [3, 4, 4, 5, 5, 6, 6, 7, 9, 12]
+BATCH_SIZE = 5000
+FIRST_NAMES = ["Анна", "Мария", "Елена", "Ольга", "Иван", "Алексей", "Дмитрий", "Сергей"]
+LAST_NAMES = ["Иванова", "Смирнова", "Кузнецова", "Попов", "Васильев", "Соколов", "Морозова"]
+STREETS = ["Пушкинская", "Ленина", "Садовая", "Гагарина", "Мира", "Советская", "Лесная"]
+DELIVERY_TIMES = [
+    "Как можно скорее", "с 10:00 до 12:00", "с 12:00 до 14:00",
+    "с 14:00 до 16:00", "с 16:00 до 18:00", "с 18:00 до 20:00",
+]
+# Доля статусов в истории заказов: большинство старых заказов доставлено
+ORDER_STATUSES = (
+    ["delivered"] * 80 + ["canceled"] * 8 + ["assembled"] * 4 + ["paid"] * 4 + ["pending"] * 4
+)
+
+
+def generate_names(rng, prefixes, count):
+    """count уникальных названий: варианты из prefixes, дальше с номером"""
+    names = list(prefixes)
+    rng.shuffle(names)
+    return [
+        names[number] if number < len(names) else f"{names[number % len(names)]} {number}"
+        for number in range(count)
+    ]
+
+
+def get_price_bounds(count):
+    extra = range(1, max(count - len(PRICE_RANGE_BOUNDS), 0) + 1)
+    bounds = PRICE_RANGE_BOUNDS + [
+        PRICE_RANGE_BOUNDS[-1] + PRICE_RANGE_STEP * number for number in extra
+    ]
+    return bounds[:count]
+
+
+def generate_catalog(components=300, bouquets=1000, events=len(EVENTS), price_ranges=4, seed=0):
+    """Создаёт каталог пакетными вставками и возвращает созданные букеты"""
+    rng = random.Random(seed)
+    created_events = Event.objects.bulk_create(
+        Event(name=name) for name in generate_names(rng, EVENTS, events)
+    )
+    bounds = [None] + get_price_bounds(price_ranges - 1) + [None]
+    for min_price, max_price in zip(bounds, bounds[1:]):
+        PriceRange(
+            min_price=None if min_price is None else Decimal(min_price),
+            max_price=None if max_price is None else Decimal(max_price),
+        ).save()
+
+    variants = [f"{flower} {color}" for flower in FLOWERS for color in COLORS]
+    flower_names = generate_names(rng, variants, max(components - len(ACCESSORIES), 0))
+    created_components = Component.objects.bulk_create(
+        [
+            Component(
+                type="flower",
+                name=name,
+                price=Decimal(rng.randint(40, 400)),
+                stock=rng.randint(200, 5000),
+            )
+            for name in flower_names
+        ]
+        + [
+            Component(
+                type="accessory",
+                name=name,
+                price=Decimal(rng.randint(20, 150)),
+                stock=rng.randint(1000, 10000),
+            )
+            for name in ACCESSORIES[:components]
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    bouquet_names = [
+        f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {number}" for number in range(bouquets)
+    ]
+    created_bouquets = Bouquet.objects.bulk_create(
+        (
+            Bouquet(
+                name=name,
+                base_price=Decimal(rng.randint(100, 800)),
+                description=f"{name}: сезонные цветы в авторской упаковке",
+            )
+            for name in bouquet_names
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    BouquetComponent.objects.bulk_create(
+        (
+            BouquetComponent(bouquet=bouquet, component=component, quantity=rng.randint(1, 11))
+            for bouquet in created_bouquets
+            for component in rng.sample(
+                created_components, min(rng.choice(COMPOSITION_SIZES), len(created_components))
+            )
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    Bouquet.events.through.objects.bulk_create(
+        (
+            Bouquet.events.through(bouquet=bouquet, event=event)
+            for bouquet in created_bouquets
+            for event in rng.sample(created_events, min(rng.randint(1, 3), len(created_events)))
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    # Пакетные вставки не вызывают сигналы: производные данные считаются здесь
+    Bouquet.objects.update_total_prices()
+    rebuild_quiz_index()
+    rebuild_search_index()
+    return created_bouquets
+
+
+@contextmanager
+def explicit_created_at(*models):
+    """auto_now_add подставляет текущее время при вставке; генератору нужны
+    даты в прошлом, поэтому на время генерации оно отключается"""
+    fields = [model._meta.get_field("created_at") for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def bulk_insert(model, objects, batch_size=BATCH_SIZE, progress=None):
+    """Вставляет объекты из генератора пачками, не держа их все в памяти"""
+    objects = iter(objects)
+    inserted = 0
+    while batch := list(islice(objects, batch_size)):
+        model.objects.bulk_create(batch)
+        inserted += len(batch)
+        if progress:
+            progress(model, inserted)
+    return inserted
+
+
+def generate_people(rng, count, phone_prefix):
+    """Пары (имя, телефон); телефоны уникальны"""
+    for number in range(count):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        yield name, f"+7{phone_prefix}{number:07d}"
+
+
+def spread_dates(rng, count, days):
+    """Возрастающие даты за последние days дней, как при реальном потоке"""
+    start = timezone.now() - timedelta(days=days)
+    step = timedelta(days=days) / max(count, 1)
+    for number in range(count):
+        yield start + step * number + timedelta(seconds=rng.randint(0, 59))
+
+
+def generate_customers(count, seed=0, progress=None):
+    rng = random.Random(seed)
+    with transaction.atomic():
+        return bulk_insert(
+            Customer,
+            (
+                Customer(name=f"{name} {number}", phone=phone)
+                for number, (name, phone) in enumerate(generate_people(rng, count, "900"))
+            ),
+            progress=progress,
+        )
+
+
+def generate_orders(count, days=365, seed=0, progress=None):
+    """Создаёт историю заказов; постоянные клиенты заказывают повторно.
+
+    Заказы ссылаются на имеющиеся букеты и клиентов, поэтому каталог и
+    клиенты создаются раньше.
+    """
+    rng = random.Random(seed)
+    bouquet_ids = list(Bouquet.objects.values_list("pk", flat=True))
+    # Телефоны форматируются один раз: str() у PhoneNumber заново проверяет номер
+    customers = [
+        (name, str(phone)) for name, phone in Customer.objects.values_list("name", "phone")
+    ]
+    if not customers:
+        customers = list(generate_people(rng, 1000, "900"))
+
+    def orders():
+        for number, created_at in enumerate(spread_dates(rng, count, days)):
+            name, phone = rng.choice(customers)
+            status = rng.choice(ORDER_STATUSES)
+            yield Order(
+                customer_name=name,
+                customer_phone=phone,
+                delivery_address=f"ул. {rng.choice(STREETS)}, {rng.randint(1, 150)}",
+                delivery_time=rng.choice(DELIVERY_TIMES),
+                bouquet_id=rng.choice(bouquet_ids) if bouquet_ids else None,
+                created_at=created_at,
+                status=status,
+                payment_id=None if status == "pending" else f"synthetic-{seed}-{number}",
+            )
+
+    with transaction.atomic(), explicit_created_at(Order):
+        return bulk_insert(Order, orders(), progress=progress)
+
+
+def generate_consultations(count, days=365, seed=0, progress=None):
+    rng = random.Random(seed)
+    with transaction.atomic(), explicit_created_at(Consultation):
+        return bulk_insert(
+            Consultation,
+            (
+                Consultation(name=name, phone=phone, agreed_to_privacy=True, created_at=created_at)
+                for (name, phone), created_at in zip(
+                    generate_people(rng, count, "901"), spread_dates(rng, count, days)
+                )
+            ),
+            progress=progress,
+        )
@@ -0,0 +1,42 @@
+import random
+import time
+from functools import wraps
+
+from django.db import OperationalError, connection
+
+
+LOCK_ERRORS = ("database is locked", "database table is locked")
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and any(
+        message in str(error) for message in LOCK_ERRORS
+    )
+
+
+def retry_on_lock(attempts=4, delay=0.05):
+    """Повторяет короткую транзакцию записи, если SQLite не дождалась блокировки.
+
+    Функция должна сама открывать транзакцию. Внутри внешней транзакции
+    повтора нет: ошибка откатила бы и её, поэтому она пробрасывается выше.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(1, attempts + 1):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as error:
+                    if (
+                        attempt == attempts
+                        or connection.in_atomic_block
+                        or not is_lock_error(error)
+                    ):
+                        raise
+                # Случайная добавка разводит повторы конкурирующих запросов
+                time.sleep(delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+        return wrapper
+
+    return decorator
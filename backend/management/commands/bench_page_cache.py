@@ -0,0 +1,71 @@
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from backend.models import Bouquet, BouquetComponent, Component
+from backend.test_runner import temporary_metrics_db
+
+
+def create_catalog(bouquets, components_per_bouquet=5):
+    components = Component.objects.bulk_create(
+        Component(type="flower", name=f"Элемент {number}", price=Decimal("100.00"))
+        for number in range(components_per_bouquet)
+    )
+    created = Bouquet.objects.bulk_create(
+        Bouquet(
+            name=f"Букет {number}",
+            base_price=Decimal("500.00"),
+            description="Синтетический букет",
+            image="images/default.jpg",
+        )
+        for number in range(bouquets)
+    )
+    BouquetComponent.objects.bulk_create(
+        BouquetComponent(bouquet=bouquet, component=component, quantity=3)
+        for bouquet in created
+        for component in components
+    )
+    Bouquet.objects.update_total_prices()
+    return created
+
+
+class Command(BaseCommand):
+    help = "Сравнивает число запросов в секунду к витрине с кешем страниц и без него"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--bouquets", type=int, default=50)
+
+    @temporary_metrics_db()
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            bouquets = create_catalog(options["bouquets"])
+            urls = [
+                reverse("home"),
+                reverse("catalog"),
+                reverse("bouquet_detail", args=[bouquets[0].pk]),
+            ]
+            for url in urls:
+                for mode, enabled in [("без кеша", False), ("с кешем", True)]:
+                    cache.clear()
+                    with override_settings(PAGE_CACHE_ENABLED=enabled):
+                        client = Client()
+                        client.get(url)
+                        started = time.perf_counter()
+                        for _ in range(options["requests"]):
+                            client.get(url)
+                        elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"{url} {mode}: {options['requests'] / elapsed:.0f} запросов/с"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
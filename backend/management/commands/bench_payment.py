@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from backend import payments
+from backend.models import Bouquet
+from backend.test_runner import temporary_metrics_db
+from backend.yookassa_stub import start_stub_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Измеряет пропускную способность цепочки заказ → оплата при "
+        "конкурентных клиентах на тестовой БД и заглушке ЮKassa"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=50, help="Число клиентов")
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            nargs="+",
+            default=[1, 10, 50],
+            help="Сколько клиентов работают одновременно",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.2,
+            help="Задержка ответа заглушки ЮKassa, в секундах",
+        )
+
+    @temporary_metrics_db()
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        server = start_stub_server(latency=options["latency"])
+        try:
+            with override_settings(YOOKASSA_API_URL=server.api_url):
+                payments._client = None
+                bouquet = Bouquet.objects.create(
+                    name="Тестовый букет",
+                    base_price=1500,
+                    description="Для нагрузочного теста",
+                )
+                for concurrency in options["concurrency"]:
+                    elapsed = asyncio.run(
+                        self.run_clients(bouquet.pk, options["clients"], concurrency)
+                    )
+                    self.stdout.write(
+                        f"concurrency={concurrency}: {options['clients']} оплат "
+                        f"за {elapsed:.2f} с, {options['clients'] / elapsed:.1f} оплат/с"
+                    )
+        finally:
+            payments._client = None
+            server.shutdown()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    async def run_clients(self, bouquet_id, clients, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def checkout(number):
+            async with semaphore:
+                client = AsyncClient()
+                response = await client.post(
+                    reverse("create_order"),
+                    {
+                        "fname": f"Клиент {number}",
+                        "tel": "+79990000000",
+                        "adres": "ул. Пушкинская, 69",
+                        "orderTime": "Как можно скорее",
+                        "bouquet_id": bouquet_id,
+                    },
+                )
+                assert response.status_code == 302, response.status_code
+                response = await client.get(reverse("payment"))
+                assert response.status_code == 302, response.status_code
+
+        started = time.perf_counter()
+        await asyncio.gather(*(checkout(number) for number in range(clients)))
+        return time.perf_counter() - started
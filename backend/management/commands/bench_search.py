@@ -0,0 +1,76 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from backend.models import Bouquet, BouquetComponent, Component
+from backend.search import rebuild_search_index, search_bouquets
+from backend.test_runner import temporary_metrics_db
+
+
+FLOWERS = [
+    "Роза белая", "Роза красная", "Пион розовый", "Тюльпан жёлтый", "Лилия",
+    "Хризантема", "Ромашка", "Гортензия синяя", "Орхидея", "Эвкалипт",
+]
+ADJECTIVES = ["Нежный", "Яркий", "Весенний", "Летний", "Праздничный", "Воздушный"]
+NOUNS = ["букет", "микс", "сюрприз", "вальс", "рассвет", "сад"]
+QUERIES = ["белые розы", "пион", "весенний букет", "орхидеи", "хризантемы сюрприз", "гортенз"]
+
+
+class Command(BaseCommand):
+    help = "Измеряет время полнотекстового поиска букетов на тестовой БД"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bouquets", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    @temporary_metrics_db()
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            components = Component.objects.bulk_create(
+                Component(type="flower", name=name, price=Decimal("100.00"))
+                for name in FLOWERS
+            )
+            bouquets = Bouquet.objects.bulk_create(
+                (
+                    Bouquet(
+                        name=f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {number}",
+                        base_price=Decimal("500.00"),
+                        description="Синтетический букет",
+                    )
+                    for number in range(options["bouquets"])
+                ),
+                batch_size=5000,
+            )
+            BouquetComponent.objects.bulk_create(
+                (
+                    BouquetComponent(bouquet=bouquet, component=component)
+                    for bouquet in bouquets
+                    for component in rng.sample(components, 3)
+                ),
+                batch_size=5000,
+            )
+            started = time.perf_counter()
+            rebuild_search_index()
+            self.stdout.write(f"Индексация: {time.perf_counter() - started:.2f} с")
+
+            for query in QUERIES:
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    found = search_bouquets(query)
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f"«{query}»: найдено {len(found)}, медиана "
+                    f"{statistics.median(timings):.1f} мс, максимум {max(timings):.1f} мс"
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
@@ -0,0 +1,186 @@
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from backend.availability import compute_buildable_counts
+from backend.datagen import generate_catalog
+from backend.models import Bouquet, PriceRange
+from backend.test_runner import temporary_metrics_db
+
+
+BUDGETS_PATH = Path(__file__).resolve().parents[2] / "benchmarks" / "storefront.json"
+
+
+def get_scenarios(bouquet, event, price_range):
+    """Запросы витрины по шагам пользователя: имя -> функция от клиента"""
+    order_form = {
+        "fname": "Иван",
+        "tel": "+79990000000",
+        "adres": "ул. Пушкинская, 69",
+        "orderTime": "Как можно скорее",
+        "bouquet_id": bouquet.pk,
+    }
+    return {
+        "home": lambda client: client.get(reverse("home")),
+        "catalog": lambda client: client.get(reverse("catalog")),
+        "bouquet_detail": lambda client: client.get(
+            reverse("bouquet_detail", args=[bouquet.pk])
+        ),
+        "quiz_event": lambda client: client.get(reverse("quiz_1")),
+        "quiz_event_submit": lambda client: client.post(
+            reverse("quiz_1"), {"event": event.name}
+        ),
+        "quiz_budget": lambda client: client.get(reverse("quiz_2")),
+        "quiz_budget_submit": lambda client: client.post(
+            reverse("quiz_2"), {"budget": price_range.name}
+        ),
+        "quiz_results": lambda client: client.get(reverse("result")),
+        "order_form": lambda client: client.get(
+            reverse("create_order"), {"bouquet_id": bouquet.pk}
+        ),
+        "order_submit": lambda client: client.post(reverse("create_order"), order_form),
+    }
+
+
+def check_quiz_results(scenarios, bouquet):
+    """Квиз в бенчмарке должен находить букеты: на пустой странице
+    результатов N+1 в шаблоне не видно"""
+    client = Client()
+    scenarios["quiz_event_submit"](client)
+    scenarios["quiz_budget_submit"](client)
+    response = scenarios["quiz_results"](client)
+    if bouquet.name not in response.content.decode():
+        raise CommandError(f"Квиз не нашёл букет «{bouquet.name}»: бенчмарк результатов пустой")
+
+
+def measure(scenario, client, requests, warm_cache=False):
+    """Замеряет запросы к странице.
+
+    По умолчанию кеш очищается перед каждым запросом: кеш фрагментов не
+    скрывает N+1 в шаблонах. С warm_cache замеряется путь попадания в кеш.
+    """
+    cache.clear()
+    scenario(client)
+    timings = []
+    queries = 0
+    for _ in range(requests):
+        if not warm_cache:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = scenario(client)
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise CommandError(f"{response.request['PATH_INFO']}: {response.status_code}")
+        queries = max(queries, len(captured))
+    return {
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(statistics.quantiles(timings, n=20)[-1], 2),
+        "queries": queries,
+    }
+
+
+def check_budget(result, budget):
+    """Список превышений: по числу запросов и по p95"""
+    exceeded = []
+    if "queries" in budget and result["queries"] > budget["queries"]:
+        exceeded.append(f"запросов {result['queries']} > {budget['queries']}")
+    if "p95_ms" in budget and result["p95_ms"] > budget["p95_ms"]:
+        exceeded.append(f"p95 {result['p95_ms']} мс > {budget['p95_ms']} мс")
+    return exceeded
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет страницы витрины, квиза и оформления заказа на синтетическом "
+        "каталоге, сравнивает p50/p95 и число SQL-запросов с бюджетами и "
+        "завершается с ошибкой, если бюджет превышен"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bouquets", type=int, default=2000)
+        parser.add_argument("--components", type=int, default=300)
+        parser.add_argument("--requests", type=int, default=50, help="замеров на страницу")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--budgets", default=str(BUDGETS_PATH))
+        parser.add_argument("--output", default="bench_storefront.json")
+        parser.add_argument(
+            "--warm-cache",
+            action="store_true",
+            help="не очищать кеш страниц и фрагментов между запросами",
+        )
+
+    @temporary_metrics_db()
+    def handle(self, *args, **options):
+        budgets = json.loads(Path(options["budgets"]).read_text(encoding="utf-8"))
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            generate_catalog(
+                components=options["components"],
+                bouquets=options["bouquets"],
+                seed=options["seed"],
+            )
+            counts = compute_buildable_counts()
+            # Заказы в бенчмарке оформляются на букет с наибольшим запасом
+            bouquet = Bouquet.objects.get(pk=max(counts, key=counts.get))
+            # Событие и бюджет квиза берутся от этого букета, чтобы страница
+            # результатов была не пустой
+            price_range = next(
+                price_range
+                for price_range in PriceRange.objects.all()
+                if price_range.contains(bouquet.total_price)
+            )
+            scenarios = get_scenarios(bouquet, bouquet.events.first(), price_range)
+            check_quiz_results(scenarios, bouquet)
+            client = Client()
+            results = {
+                name: measure(scenario, client, options["requests"], options["warm_cache"])
+                for name, scenario in scenarios.items()
+            }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        failures = []
+        for name, result in results.items():
+            exceeded = check_budget(result, budgets.get(name, {}))
+            result["budget"] = budgets.get(name)
+            result["ok"] = not exceeded
+            if exceeded:
+                failures.append(f"{name}: {', '.join(exceeded)}")
+            self.stdout.write(
+                f"{name}: p50 {result['p50_ms']} мс, p95 {result['p95_ms']} мс, "
+                f"запросов {result['queries']}"
+                + (f" — превышен бюджет: {', '.join(exceeded)}" if exceeded else "")
+            )
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "dataset": {
+                "bouquets": options["bouquets"],
+                "components": options["components"],
+                "seed": options["seed"],
+            },
+            "warm_cache": options["warm_cache"],
+            "requests": options["requests"],
+            "views": results,
+        }
+        Path(options["output"]).write_text(
+            json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+        if failures:
+            raise CommandError("Превышены бюджеты:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS(f"Все страницы в бюджете, отчёт: {options['output']}"))
@@ -0,0 +1,84 @@
+import io
+import json
+import random
+import tempfile
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from backend.test_runner import temporary_metrics_db
+
+
+def build_catalog(components, bouquets, events, seed=0):
+    rng = random.Random(seed)
+    event_names = [f"Событие {number}" for number in range(events)]
+    return {
+        "components": [
+            {
+                "type": rng.choice(["flower", "accessory"]),
+                "name": f"Элемент {number}",
+                "price": f"{rng.randint(10, 500)}.00",
+                "note": "Синтетический",
+                "stock": rng.randint(0, 1000),
+            }
+            for number in range(components)
+        ],
+        "bouquets": [
+            {
+                "name": f"Букет {number}",
+                "base_price": f"{rng.randint(100, 1000)}.00",
+                "description": "Синтетический букет",
+                "events": rng.sample(event_names, min(2, events)),
+                "components": [
+                    {"name": f"Элемент {index}", "quantity": rng.randint(1, 15)}
+                    for index in rng.sample(range(components), min(5, components))
+                ],
+            }
+            for number in range(bouquets)
+        ],
+        "prices": [
+            {"min_price": 0, "max_price": 1000},
+            {"min_price": 1000, "max_price": 5000},
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = "Сравнивает время построчной и пакетной загрузки upload_data на тестовой БД"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--components", type=int, default=5000)
+        parser.add_argument("--bouquets", type=int, default=2000)
+        parser.add_argument("--events", type=int, default=10)
+
+    @temporary_metrics_db()
+    def handle(self, *args, **options):
+        catalog = build_catalog(
+            options["components"], options["bouquets"], options["events"]
+        )
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            with tempfile.NamedTemporaryFile(
+                "w", suffix=".json", encoding="utf-8"
+            ) as json_file:
+                json.dump(catalog, json_file, ensure_ascii=False)
+                json_file.flush()
+                for mode, bulk in [("построчно", False), ("пакетно", True)]:
+                    call_command("flush", interactive=False, verbosity=0)
+                    started = time.perf_counter()
+                    call_command(
+                        "upload_data",
+                        json_file.name,
+                        media_root="",
+                        bulk=bulk,
+                        stdout=io.StringIO(),
+                    )
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f"{mode}: {elapsed:.2f} с")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
@@ -0,0 +1,114 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from backend.db import is_lock_error, retry_on_lock
+from backend.models import Bouquet, Consultation, Order
+from backend.test_runner import temporary_metrics_db
+
+
+# Настройки Django по умолчанию: журнал отката, отложенные транзакции и
+# пять секунд ожидания блокировки. Режим журнала хранится в файле базы,
+# поэтому его нужно вернуть явно
+DEFAULT_OPTIONS = {"init_command": "PRAGMA journal_mode=DELETE"}
+
+
+def place_order(bouquet_id, number):
+    # Как в обработчике заказа и при сохранении сессии: в одной транзакции
+    # сначала чтение, затем запись
+    with transaction.atomic():
+        bouquet = Bouquet.objects.get(pk=bouquet_id)
+        Order.objects.create(
+            customer_name=f"Клиент {number}",
+            customer_phone=f"+7900{number:07d}",
+            delivery_address="ул. Пушкинская, 69",
+            bouquet=bouquet,
+        )
+
+
+def request_consultation(number):
+    with transaction.atomic():
+        phone = f"+7901{number:07d}"
+        if not Consultation.objects.filter(phone=phone).exists():
+            Consultation.objects.create(name=f"Клиент {number}", phone=phone)
+
+
+class Command(BaseCommand):
+    help = (
+        "Параллельно создаёт заказы и заявки на консультацию и сравнивает "
+        "пропускную способность и ошибки блокировки SQLite до и после настройки"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--writes", type=int, default=50, help="записей на поток")
+
+    @temporary_metrics_db()
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            bouquet = Bouquet.objects.create(
+                name="Букет", base_price=Decimal("500.00"), description=""
+            )
+            modes = [
+                ("по умолчанию", DEFAULT_OPTIONS, False),
+                ("WAL + IMMEDIATE", settings.DATABASES["default"]["OPTIONS"], False),
+                ("WAL + IMMEDIATE + повтор", settings.DATABASES["default"]["OPTIONS"], True),
+            ]
+            for mode, database_options, retry in modes:
+                self.run_mode(mode, database_options, retry, bouquet.pk, **options)
+        finally:
+            connection.settings_dict["OPTIONS"] = settings.DATABASES["default"]["OPTIONS"]
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run_mode(self, mode, database_options, retry, bouquet_id, threads, writes, **options):
+        # Новые соединения потоков создаются с этими параметрами
+        connections.close_all()
+        connection.settings_dict["OPTIONS"] = dict(database_options)
+        Order.objects.all().delete()
+        Consultation.objects.all().delete()
+        order = retry_on_lock()(place_order) if retry else place_order
+        consultation = retry_on_lock()(request_consultation) if retry else request_consultation
+        lock = threading.Lock()
+        stats = {"ok": 0, "locked": 0}
+
+        def writer(offset):
+            try:
+                for number in range(offset, offset + writes):
+                    try:
+                        if number % 2:
+                            order(bouquet_id, number)
+                        else:
+                            consultation(number)
+                        outcome = "ok"
+                    except OperationalError as error:
+                        if not is_lock_error(error):
+                            raise
+                        outcome = "locked"
+                    with lock:
+                        stats[outcome] += 1
+            finally:
+                connections.close_all()
+
+        workers = [
+            threading.Thread(target=writer, args=(index * writes,))
+            for index in range(threads)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{mode}: {stats['ok'] / elapsed:.0f} записей/с, "
+            f"успешно {stats['ok']}, ошибок блокировки {stats['locked']}"
+        )
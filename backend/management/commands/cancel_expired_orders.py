@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from backend.stock import cancel_expired_orders, get_payment_timeout
+
+
+class Command(BaseCommand):
+    help = (
+        "Отменяет заказы, не перешедшие к оплате за ORDER_PAYMENT_TIMEOUT секунд, "
+        "и возвращает их элементы на склад. Заказы с созданным платежом "
+        "отменяет уведомление ЮKassa. Запускается по расписанию"
+    )
+
+    def handle(self, *args, **options):
+        canceled = cancel_expired_orders()
+        self.stdout.write(self.style.SUCCESS(
+            f"Отменено заказов старше {get_payment_timeout()}: {canceled}"
+        ))
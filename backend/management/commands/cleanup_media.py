@@ -0,0 +1,62 @@
+import os
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from backend.models import Bouquet, Component
+from backend.storage import CONTENT_ADDRESSED_NAME, get_image_storage
+
+
+def get_referenced_images():
+    referenced = set()
+    for model in (Component, Bouquet):
+        referenced.update(
+            model.objects.exclude(image="")
+            .exclude(image__isnull=True)
+            .values_list("image", flat=True)
+            .iterator(chunk_size=5000)
+        )
+    return referenced
+
+
+class Command(BaseCommand):
+    help = "Удаляет изображения из хранилища, на которые не ссылается ни одна запись"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать файлы, которые будут удалены",
+        )
+
+    def handle(self, *args, **options):
+        storage = get_image_storage()
+        root = Path(storage.location)
+        # Вместе с изображением сохраняются и его уменьшенные копии
+        referenced = {
+            match.group("stem")
+            for match in map(CONTENT_ADDRESSED_NAME.match, get_referenced_images())
+            if match
+        }
+        removed = freed = 0
+        for directory, _, files in os.walk(root):
+            for file_name in files:
+                path = Path(directory) / file_name
+                name = path.relative_to(root).as_posix()
+                # Файлы, положенные в MEDIA_ROOT вручную, не трогаем
+                match = CONTENT_ADDRESSED_NAME.match(name)
+                if not match or match.group("stem") in referenced:
+                    continue
+                removed += 1
+                freed += path.stat().st_size
+                if options["dry_run"]:
+                    self.stdout.write(name)
+                else:
+                    storage.delete(name)
+
+        verb = "Будет удалено" if options["dry_run"] else "Удалено"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} файлов: {removed}, освобождено {freed / 1024 / 1024:.1f} МБ"
+            )
+        )
@@ -0,0 +1,82 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from backend.availability import invalidate_buildable_counts
+from backend.datagen import (
+    EVENTS,
+    generate_catalog,
+    generate_consultations,
+    generate_customers,
+    generate_orders,
+)
+from backend.models import Bouquet
+from backend.page_cache import invalidate_storefront
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими данными для нагрузочного тестирования: "
+        "каталог, клиенты, заказы и консультации. Одинаковый --seed даёт "
+        "одинаковые данные"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--components", type=int, default=300)
+        parser.add_argument("--bouquets", type=int, default=1000)
+        parser.add_argument("--events", type=int, default=len(EVENTS))
+        parser.add_argument("--price-ranges", type=int, default=4)
+        parser.add_argument("--customers", type=int, default=10_000)
+        parser.add_argument("--orders", type=int, default=100_000)
+        parser.add_argument("--consultations", type=int, default=10_000)
+        parser.add_argument("--days", type=int, default=365, help="за сколько дней история заказов")
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="предварительно очистить базу (удаляет все данные, включая пользователей)",
+        )
+
+    def handle(self, *args, **options):
+        if options["flush"]:
+            call_command("flush", interactive=False, verbosity=0)
+        elif Bouquet.objects.exists():
+            raise CommandError("В базе уже есть каталог. Запустите с --flush, чтобы очистить её")
+
+        started = time.perf_counter()
+        seed = options["seed"]
+        self.step("Каталог", lambda: len(generate_catalog(
+            components=options["components"],
+            bouquets=options["bouquets"],
+            events=options["events"],
+            price_ranges=options["price_ranges"],
+            seed=seed,
+        )))
+        self.step("Клиенты", lambda: generate_customers(
+            options["customers"], seed=seed, progress=self.progress
+        ))
+        self.step("Заказы", lambda: generate_orders(
+            options["orders"], days=options["days"], seed=seed, progress=self.progress
+        ))
+        self.step("Консультации", lambda: generate_consultations(
+            options["consultations"], days=options["days"], seed=seed, progress=self.progress
+        ))
+        # Статистика нужна планировщику SQLite, чтобы выбирать индексы
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        invalidate_storefront()
+        invalidate_buildable_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {time.perf_counter() - started:.1f} с"
+        ))
+
+    def step(self, title, generate):
+        started = time.perf_counter()
+        count = generate()
+        self.stdout.write(f"{title}: {count} за {time.perf_counter() - started:.1f} с")
+
+    def progress(self, model, inserted):
+        if inserted % 100_000 == 0:
+            self.stdout.write(f"  {model._meta.verbose_name_plural}: {inserted}")
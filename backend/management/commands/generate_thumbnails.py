@@ -0,0 +1,31 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from backend.management.commands.cleanup_media import get_referenced_images
+from backend.thumbnails import generate_derivatives
+
+
+class Command(BaseCommand):
+    help = "Создаёт уменьшенные копии (WebP и JPEG) для всех изображений каталога"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Пересоздать уже существующие копии",
+        )
+        parser.add_argument("--workers", type=int, default=None)
+
+    def handle(self, *args, **options):
+        names = sorted(get_referenced_images())
+        generate = partial(generate_derivatives, force=options["force"])
+        # Пережатие упирается в процессор, поэтому работают отдельные процессы
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            created = sum(executor.map(generate, names, chunksize=16))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Изображений: {len(names)}, создано копий: {created}"
+            )
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.quiz_index import check_quiz_index, rebuild_quiz_index
+
+
+class Command(BaseCommand):
+    help = "Перестраивает с нуля предрасчитанную выдачу квиза"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только сверить индекс с данными, ничего не перестраивая",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            mismatches = check_quiz_index()
+            for event_id, price_range_id in mismatches:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Расхождение: событие {event_id}, диапазон {price_range_id}"
+                    )
+                )
+            if mismatches:
+                raise CommandError(f"Индекс квиза устарел: {len(mismatches)} расхождений")
+            self.stdout.write(self.style.SUCCESS("Индекс квиза актуален"))
+            return
+
+        count = rebuild_quiz_index()
+        self.stdout.write(self.style.SUCCESS(f"Индекс квиза перестроен: {count} подборок"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from backend.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Перестраивает с нуля полнотекстовый индекс букетов"
+
+    def handle(self, *args, **options):
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Поисковый индекс перестроен: {count} букетов"))
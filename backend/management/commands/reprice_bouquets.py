@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.models import Component
+from backend.pricing import recalculate_total_prices
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает общую стоимость букетов по текущим ценам элементов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--component",
+            action="append",
+            dest="components",
+            metavar="NAME",
+            help="Пересчитать только букеты с этим элементом (можно указать несколько раз)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать расхождения, не записывая их в БД",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Размер пачки для чтения и записи",
+        )
+        parser.add_argument(
+            "--report-limit",
+            type=int,
+            default=20,
+            help="Сколько букетов с наибольшим расхождением вывести",
+        )
+
+    def handle(self, *args, **options):
+        components = None
+        if options["components"]:
+            names = set(options["components"])
+            components = list(Component.objects.filter(name__in=names))
+            missing = names - {component.name for component in components}
+            if missing:
+                raise CommandError(f"Элементы не найдены: {', '.join(sorted(missing))}")
+
+        drift = recalculate_total_prices(
+            components=components,
+            dry_run=options["dry_run"],
+            batch_size=options["batch_size"],
+        )
+
+        largest = sorted(
+            drift,
+            key=lambda item: abs(item.actual_price - item.stored_price),
+            reverse=True,
+        )
+        for item in largest[: options["report_limit"]]:
+            self.stdout.write(
+                f"{item.name}: {item.stored_price} -> {item.actual_price} "
+                f"({item.actual_price - item.stored_price:+})"
+            )
+
+        if options["dry_run"]:
+            self.stdout.write(
+                self.style.WARNING(f"Расхождений найдено: {len(drift)} (без записи)")
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Пересчитано букетов: {len(drift)}"))
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from backend.notifications import RateLimiter, deliver_notifications, get_bot
+
+
+class Command(BaseCommand):
+    help = "Отправляет накопившиеся уведомления в Telegram; работает непрерывно"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Отправить одну пачку и завершиться",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Пауза между проверками очереди, в секундах",
+        )
+
+    def handle(self, *args, **options):
+        bot = get_bot()
+        rate_limiter = RateLimiter()
+        while True:
+            sent, failed = deliver_notifications(
+                bot, settings.TG_CHAT_ID, rate_limiter=rate_limiter
+            )
+            if sent or failed:
+                self.stdout.write(f"Отправлено: {sent}, отложено: {failed}")
+            if options["once"]:
+                return
+            if not sent:
+                time.sleep(options["poll_interval"])
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 import json
+from backend.catalog_import import BulkCatalogImporter, CatalogSyncImporter
 from backend.models import Component, Bouquet, BouquetComponent, Event, PriceRange
 from django.db import transaction
 from django.core.files import File
@@ -21,11 +22,60 @@ class Command(BaseCommand):
             help="Путь к папке с изображениями",
             default=settings.MEDIA_ROOT,
         )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="Пакетная загрузка: потоковое чтение JSON и bulk_create пачками",
+        )
+        parser.add_argument(
+            "--sync",
+            action="store_true",
+            help="Инкрементальная синхронизация: обновить только изменившиеся записи",
+        )
+        parser.add_argument(
+            "--delete-missing",
+            action="store_true",
+            help="В режиме --sync удалить элементы и букеты, которых нет в файле",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Размер пачки в пакетном режиме",
+        )
 
     def handle(self, *args, **options):
         json_file = options["bouquet_json"]
         media_root = options.get("media_root", "")
 
+        if options["sync"]:
+            importer = CatalogSyncImporter(
+                delete_missing=options["delete_missing"],
+                media_root=media_root,
+                batch_size=options["batch_size"],
+                log=self.stdout.write,
+            )
+        elif options["bulk"]:
+            importer = BulkCatalogImporter(
+                media_root=media_root,
+                batch_size=options["batch_size"],
+                log=self.stdout.write,
+            )
+        else:
+            importer = None
+
+        if importer is not None:
+            stats = importer.run(json_file)
+            if stats["missing_components"]:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Пропущено компонентов букетов, которых нет в базе: "
+                        f"{stats['missing_components']}"
+                    )
+                )
+            self.stdout.write(self.style.SUCCESS("Загрузка данных завершена!"))
+            return
+
         try:
             with open(json_file, "r", encoding="utf-8") as jfile:
                 data = json.load(jfile)
@@ -141,9 +191,6 @@ class Command(BaseCommand):
                             self.style.SUCCESS(f"Добавлен букет: {bouquet_name}")
                         )
 
-                    bouquet.total_price = bouquet.get_price()
-                    bouquet.save()
-
             self.stdout.write(self.style.SUCCESS("Загрузка данных завершена!"))
 
         except Exception as e:
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from backend.yookassa_stub import YooKassaStubServer
+
+
+class Command(BaseCommand):
+    help = "Запускает локальную заглушку API ЮKassa для нагрузочных тестов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.2,
+            help="Имитируемая задержка ответа, в секундах",
+        )
+
+    def handle(self, *args, **options):
+        server = YooKassaStubServer(
+            (options["host"], options["port"]), latency=options["latency"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Заглушка ЮKassa: {server.api_url} (укажите её в YOOKASSA_API_URL)"
+            )
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
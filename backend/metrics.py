@@ -0,0 +1,220 @@
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+# Метрики в текстовом формате Prometheus. Значения лежат в отдельном файле
+# SQLite, общем для всех процессов сервера: каждый процесс прибавляет свои
+# изменения UPSERT'ом, и /metrics в любом процессе отдаёт сумму по всем
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class MetricsStore:
+    """Счётчики в файле SQLite: (имя, метки) -> значение"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.pid = os.getpid()
+        self.local = threading.local()
+
+    def get_connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # Потеря последних приращений при сбое питания для метрик допустима
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS metrics ("
+                "name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, "
+                "PRIMARY KEY (name, labels))"
+            )
+            self.local.connection = connection
+        return connection
+
+    def add(self, samples):
+        """Прибавляет значения одной транзакцией: [(имя, метки, приращение)]"""
+        try:
+            connection = self.get_connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(
+                    "INSERT INTO metrics (name, labels, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value",
+                    samples,
+                )
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            # Сбой записи метрик не должен ломать оформление заказа
+            logger.exception("Не удалось записать метрики в %s", self.path)
+
+    def read(self):
+        return self.get_connection().execute(
+            "SELECT name, labels, value FROM metrics ORDER BY name, labels"
+        ).fetchall()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def is_current(store, path):
+    # Соединения SQLite нельзя передавать в процесс, созданный fork
+    return store is not None and store.path == path and store.pid == os.getpid()
+
+
+def get_store():
+    global _store
+    path = str(settings.METRICS_DB_PATH)
+    if not is_current(_store, path):
+        with _store_lock:
+            if not is_current(_store, path):
+                _store = MetricsStore(path)
+    return _store
+
+
+def format_labels(labels):
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in sorted(labels.items())
+    )
+    return ",".join(f'{name}="{value}"' for name, value in escaped)
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(int(value)) if value == int(value) else repr(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+    def get_labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}")
+        return labels
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        get_store().add([(self.name, format_labels(self.get_labels(labels)), amount)])
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        labels = self.get_labels(labels)
+        # Корзины хранятся сразу накопленными, как их отдаёт Prometheus;
+        # пустые тоже записываются, чтобы в выводе были все границы
+        samples = [
+            (
+                f"{self.name}_bucket",
+                format_labels({**labels, "le": format_value(bound)}),
+                int(value <= bound),
+            )
+            for bound in self.buckets
+        ]
+        samples.append((f"{self.name}_sum", format_labels(labels), value))
+        samples.append((f"{self.name}_count", format_labels(labels), 1))
+        get_store().add(samples)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+REGISTRY = {}
+
+
+def get_metric_name(sample_name):
+    if sample_name in REGISTRY:
+        return sample_name
+    for suffix in ("_bucket", "_sum", "_count"):
+        if sample_name.endswith(suffix) and sample_name[: -len(suffix)] in REGISTRY:
+            return sample_name[: -len(suffix)]
+    return None
+
+
+def get_sort_key(sample):
+    """Порядок строк: корзины гистограммы по возрастанию границы"""
+    name, labels, _ = sample
+    bound = re.search(r'(?:^|,)le="([^"]+)"', labels)
+    if bound is None:
+        return name, labels, 0.0
+    return name, re.sub(r'(?:^|,)le="[^"]+"', "", labels), float(bound.group(1))
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus"""
+    samples = {}
+    for name, labels, value in get_store().read():
+        metric_name = get_metric_name(name)
+        if metric_name is not None:
+            samples.setdefault(metric_name, []).append((name, labels, value))
+    lines = []
+    for name, metric in sorted(REGISTRY.items()):
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for sample_name, labels, value in sorted(samples.get(name, []), key=get_sort_key):
+            sample = f"{sample_name}{{{labels}}}" if labels else sample_name
+            lines.append(f"{sample} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+ORDERS = Counter(
+    "flowershop_orders_total", "Оформленные заказы", ["result"]
+)
+CONSULTATIONS = Counter(
+    "flowershop_consultations_total", "Заявки на консультацию"
+)
+QUIZ_STEPS = Counter(
+    "flowershop_quiz_steps_total", "Прохождение шагов квиза", ["step"]
+)
+PAYMENT_CREATE_SECONDS = Histogram(
+    "flowershop_payment_create_seconds", "Время создания платежа в ЮKassa", ["result"]
+)
+PAYMENT_NOTIFICATIONS = Counter(
+    "flowershop_payment_events_total", "Уведомления ЮKassa о платежах", ["event"]
+)
+NOTIFICATIONS_ENQUEUED = Counter(
+    "flowershop_notifications_enqueued_total", "Уведомления, поставленные в очередь", ["kind"]
+)
+NOTIFICATIONS_DELIVERED = Counter(
+    "flowershop_notifications_delivered_total",
+    "Результат отправки уведомлений в Telegram",
+    ["result"],
+)
+NOTIFICATION_SEND_SECONDS = Histogram(
+    "flowershop_notification_send_seconds", "Время отправки сообщения в Telegram"
+)
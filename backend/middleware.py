@@ -0,0 +1,232 @@
+import logging
+import mimetypes
+import posixpath
+import random
+import time
+from pathlib import Path
+from urllib.parse import unquote
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .request_timing import RequestTiming, current_timing, enable_query_timing
+
+
+logger = logging.getLogger(__name__)
+
+# Файлы с хешем в имени никогда не меняются: кешируются браузером на год
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=60"
+# Кодировка -> суффикс заранее сжатой копии, в порядке предпочтения
+PRECOMPRESSED_VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def get_accepted_encodings(header):
+    accepted = set()
+    for item in header.split(","):
+        encoding, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(encoding.strip().lower())
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """Отдаёт собранную collectstatic статику из STATIC_ROOT.
+
+    Выбирает br/gzip копию по Accept-Encoding и ставит долгий Cache-Control
+    файлам, имена которых содержат хеш содержимого. Под ASGI работает
+    асинхронно: синхронный middleware первым в цепочке заставил бы Django
+    выполнять все запросы в одном потоке.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.root = Path(settings.STATIC_ROOT)
+        self.prefix = "/" + settings.STATIC_URL.lstrip("/")
+        hashed_files = getattr(staticfiles_storage, "hashed_files", {})
+        self.immutable_names = set(hashed_files.values())
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.is_static(request):
+            response = self.serve(request, request.path_info[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.is_static(request):
+            # Проверка файла на диске не должна блокировать event loop
+            response = await sync_to_async(self.serve, thread_sensitive=False)(
+                request, request.path_info[len(self.prefix):]
+            )
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def is_static(self, request):
+        return request.method in ("GET", "HEAD") and request.path_info.startswith(
+            self.prefix
+        )
+
+    def serve(self, request, path):
+        name = posixpath.normpath(unquote(path)).lstrip("/")
+        try:
+            full_path = Path(safe_join(self.root, name))
+        except SuspiciousFileOperation:
+            return None
+        if not full_path.is_file():
+            return None
+
+        stat = full_path.stat()
+        if not was_modified_since(
+            request.META.get("HTTP_IF_MODIFIED_SINCE"), stat.st_mtime
+        ):
+            return HttpResponseNotModified()
+
+        content_type, _ = mimetypes.guess_type(name)
+        accepted = get_accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        served_path, encoding = full_path, None
+        for variant_encoding, suffix in PRECOMPRESSED_VARIANTS:
+            variant_path = full_path.with_name(full_path.name + suffix)
+            if variant_encoding in accepted and variant_path.is_file():
+                served_path, encoding = variant_path, variant_encoding
+                break
+
+        response = FileResponse(
+            served_path.open("rb"),
+            content_type=content_type or "application/octet-stream",
+        )
+        response.headers.pop("Content-Disposition", None)
+        if encoding:
+            response["Content-Encoding"] = encoding
+        response["Vary"] = "Accept-Encoding"
+        response["Last-Modified"] = http_date(stat.st_mtime)
+        response["Cache-Control"] = (
+            IMMUTABLE_CACHE_CONTROL
+            if name in self.immutable_names
+            else DEFAULT_CACHE_CONTROL
+        )
+        return response
+
+
+class RequestTimingMiddleware:
+    """Замеряет SQL, шаблоны и код view и отдаёт их в заголовке Server-Timing.
+
+    Замеряется доля запросов REQUEST_TIMING_SAMPLE_RATE, остальные проходят
+    без накладных расходов. Заголовок получают только сотрудники и адреса из
+    INTERNAL_IPS: посетителям внутренние тайминги не показываются. Запросы
+    дольше SLOW_REQUEST_THRESHOLD мс пишутся в лог вместе с самыми
+    медленными и повторяющимися (N+1) SQL, чьи бы они ни были.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, "REQUEST_TIMING_SAMPLE_RATE", 0)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_threshold = getattr(settings, "SLOW_REQUEST_THRESHOLD", 500) / 1000
+        self.repeated_threshold = getattr(settings, "REPEATED_QUERY_THRESHOLD", 5)
+        enable_query_timing()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_sampled():
+            return self.get_response(request)
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        total = time.perf_counter() - timing.started
+        self.finish(request, response, timing, total, self.shows_timing(request))
+        return response
+
+    async def __acall__(self, request):
+        if not self.is_sampled():
+            return await self.get_response(request)
+        # sync_to_async копирует контекст, поэтому запросы к БД из потоков
+        # пула попадают в тот же RequestTiming через current_timing
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        total = time.perf_counter() - timing.started
+        self.finish(request, response, timing, total, await self.ashows_timing(request))
+        return response
+
+    def is_sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def finish(self, request, response, timing, total, show_timing):
+        if show_timing:
+            view_time = max(total - timing.db_time - timing.template_time, 0)
+            response["Server-Timing"] = ", ".join([
+                f'db;dur={timing.db_time * 1000:.1f};desc="SQL x {len(timing.queries)}"',
+                f"tpl;dur={timing.template_time * 1000:.1f}",
+                f"view;dur={view_time * 1000:.1f}",
+                f"total;dur={total * 1000:.1f}",
+            ])
+        if total >= self.slow_threshold:
+            self.log_slow_request(request, response, timing, total)
+
+    def shows_timing(self, request):
+        # request.user появляется в AuthenticationMiddleware, ниже по цепочке
+        user = getattr(request, "user", None)
+        return request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS or bool(
+            user and user.is_staff
+        )
+
+    async def ashows_timing(self, request):
+        if request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS:
+            return True
+        # В async-цепочке request.user вызвал бы синхронный запрос к БД
+        auser = getattr(request, "auser", None)
+        user = await auser() if auser else None
+        return bool(user and user.is_staff)
+
+    def log_slow_request(self, request, response, timing, total):
+        lines = [
+            f"Медленный запрос {request.method} {request.get_full_path()} "
+            f"({response.status_code}): {total * 1000:.0f} мс, "
+            f"SQL {len(timing.queries)} за {timing.db_time * 1000:.0f} мс, "
+            f"шаблоны {timing.template_time * 1000:.0f} мс"
+        ]
+        lines.extend(
+            f"  медленный SQL {duration * 1000:.1f} мс: {sql[:300]}"
+            for sql, duration in timing.get_slowest()
+        )
+        lines.extend(
+            f"  повторён {count} раз, {duration * 1000:.1f} мс: {sql[:300]}"
+            for sql, count, duration in timing.get_repeated(self.repeated_threshold)
+        )
+        logger.warning("\n".join(lines))
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:51
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_quiz_index(apps, schema_editor):
+    # Повторяет backend.quiz_index.build_matches на исторических моделях:
+    # без этого квиз после migrate ничего не находит до rebuild_quiz_index
+    db = schema_editor.connection.alias
+    Bouquet = apps.get_model('backend', 'Bouquet')
+    PriceRange = apps.get_model('backend', 'PriceRange')
+    QuizMatch = apps.get_model('backend', 'QuizMatch')
+    price_ranges = list(
+        PriceRange.objects.using(db).values_list('pk', 'min_price', 'max_price')
+    )
+    matches = defaultdict(list)
+    memberships = Bouquet.events.through.objects.using(db).order_by('bouquet_id').values_list(
+        'event_id', 'bouquet_id', 'bouquet__total_price'
+    )
+    for event_id, bouquet_id, total_price in memberships.iterator(chunk_size=5000):
+        for price_range_id, min_price, max_price in price_ranges:
+            if (min_price is None or total_price >= min_price) and (
+                max_price is None or total_price <= max_price
+            ):
+                matches[event_id, price_range_id].append(bouquet_id)
+    QuizMatch.objects.using(db).bulk_create(
+        [
+            QuizMatch(event_id=event_id, price_range_id=price_range_id, bouquet_ids=ids)
+            for (event_id, price_range_id), ids in matches.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0002_consultation_customer_event_pricerange_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bouquet_ids', models.JSONField(default=list, verbose_name='Букеты')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_matches', to='backend.event')),
+                ('price_range', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_matches', to='backend.pricerange')),
+            ],
+            options={
+                'verbose_name': 'Подборка квиза',
+                'verbose_name_plural': 'Подборки квиза',
+                'unique_together': {('event', 'price_range')},
+            },
+        ),
+        migrations.RunPython(build_quiz_index, migrations.RunPython.noop),
+    ]
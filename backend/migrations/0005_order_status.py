@@ -0,0 +1,52 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+def close_existing_orders(apps, schema_editor):
+    # Заказы, оформленные до появления статусов, уже обработаны вручную;
+    # со статусом по умолчанию их отменила бы первая же cancel_expired_orders
+    Order = apps.get_model('backend', 'Order')
+    Order.objects.using(schema_editor.connection.alias).update(status='delivered')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_id', models.CharField(max_length=64, verbose_name='ID платежа')),
+                ('event', models.CharField(max_length=50, verbose_name='Событие')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Получено')),
+            ],
+            options={
+                'verbose_name': 'Уведомление об оплате',
+                'verbose_name_plural': 'Уведомления об оплате',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='payment_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='ID платежа'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Ожидает оплаты'), ('paid', 'Оплачен'), ('assembled', 'Собран'), ('delivered', 'Доставлен'), ('canceled', 'Отменён')], default='pending', max_length=20, verbose_name='Статус'),
+        ),
+        migrations.RunPython(close_existing_orders, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='backend_ord_status_54a137_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='paymentevent',
+            unique_together={('payment_id', 'event')},
+        ),
+    ]
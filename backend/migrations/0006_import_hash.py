@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_order_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bouquet',
+            name='import_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Хеш импорта'),
+        ),
+        migrations.AddField(
+            model_name='component',
+            name='import_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Хеш импорта'),
+        ),
+    ]
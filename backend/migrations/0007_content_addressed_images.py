@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:59
+
+import backend.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_import_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bouquet',
+            name='image',
+            field=models.ImageField(null=True, storage=backend.storage.get_image_storage, upload_to='', verbose_name='Изображение'),
+        ),
+        migrations.AlterField(
+            model_name='component',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=backend.storage.get_image_storage, upload_to='', verbose_name='Изображение'),
+        ),
+    ]
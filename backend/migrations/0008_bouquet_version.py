@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bouquet',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_bouquet_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bouquet',
+            index=models.Index(fields=['total_price'], name='backend_bou_total_p_a56c6c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['created_at'], name='backend_con_created_dbe09c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='backend_ord_created_6ca72e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer_phone', 'created_at'], name='backend_ord_custome_62f6d6_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_query_indexes'),
+    ]
+
+    operations = [
+        # Полнотекстовый индекс букетов. rowid совпадает с id букета,
+        # префиксные индексы ускоряют поиск по началу слова
+        migrations.RunSQL(
+            sql="""
+                CREATE VIRTUAL TABLE backend_bouquet_search USING fts5(
+                    name, description, components, events,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3 4'
+                )
+            """,
+            reverse_sql="DROP TABLE backend_bouquet_search",
+        ),
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO backend_bouquet_search(rowid, name, description, components, events)
+                SELECT
+                    bouquet.id,
+                    replace(replace(bouquet.name, 'ё', 'е'), 'Ё', 'Е'),
+                    replace(replace(bouquet.description, 'ё', 'е'), 'Ё', 'Е'),
+                    (
+                        SELECT replace(replace(group_concat(component.name, ' '), 'ё', 'е'), 'Ё', 'Е')
+                        FROM backend_bouquetcomponent item
+                        JOIN backend_component component ON component.id = item.component_id
+                        WHERE item.bouquet_id = bouquet.id
+                    ),
+                    (
+                        SELECT replace(replace(group_concat(event.name, ' '), 'ё', 'е'), 'Ё', 'Е')
+                        FROM backend_bouquet_events link
+                        JOIN backend_event event ON event.id = link.event_id
+                        WHERE link.bouquet_id = bouquet.id
+                    )
+                FROM backend_bouquet bouquet
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_bouquet_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('component', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='backend.component')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='backend.order')),
+            ],
+            options={
+                'verbose_name': 'Резерв склада',
+                'verbose_name_plural': 'Резервы склада',
+            },
+        ),
+    ]
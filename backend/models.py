@@ -1,9 +1,16 @@
+from decimal import Decimal
+
 from django.db import models
+from django.utils import timezone
+from django.db.models import F, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from phonenumber_field.modelfields import PhoneNumberField
 from django.utils.text import slugify
 from django.utils.crypto import get_random_string
 from django.core.validators import MinValueValidator
 
+from .storage import get_image_storage
+
 
 class Staff(models.Model):
     """Модель персонала, связанная с пользователями Django"""
@@ -70,13 +77,18 @@ class Component(models.Model):
     price = models.DecimalField(
         max_digits=10, decimal_places=2, default=1.00, verbose_name="Стоимость (руб.)"
     )
-    image = models.ImageField(verbose_name="Изображение", blank=True, null=True)
+    image = models.ImageField(
+        verbose_name="Изображение", blank=True, null=True, storage=get_image_storage
+    )
     note = models.CharField(
         verbose_name="Примечания",
         max_length=100,
         blank=True,
     )
     stock = models.PositiveIntegerField(default=0, verbose_name="Стоковое количество")
+    import_hash = models.CharField(
+        max_length=64, blank=True, editable=False, verbose_name="Хеш импорта"
+    )
 
     def __str__(self):
         return self.name
@@ -88,6 +100,40 @@ class Component(models.Model):
         ordering = ["type"]
 
 
+def components_price_subquery():
+    """Подзапрос: сумма стоимости компонентов букета (цена × количество)"""
+    return Subquery(
+        BouquetComponent.objects.filter(bouquet=OuterRef("pk"))
+        .values("bouquet")
+        .annotate(
+            total=Sum(
+                F("component__price") * F("quantity"),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            )
+        )
+        .values("total"),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def buildable_count_expression():
+    """Агрегат по составу: сколько букетов собирается из остатков склада"""
+    # Деление целых полей в SQL целочисленное: 7 роз по 3 дают 2 букета
+    return Min(F("component__stock") / F("quantity"))
+
+
+class BouquetQuerySet(models.QuerySet):
+    def update_total_prices(self):
+        """Пересчитывает total_price одним UPDATE без загрузки букетов в память.
+
+        Версия букетов увеличивается: закешированные карточки перерисуются.
+        """
+        return self.update(
+            total_price=F("base_price") + Coalesce(components_price_subquery(), Value(0)),
+            version=F("version") + 1,
+        )
+
+
 class Bouquet(models.Model):
     """Модель букета"""
 
@@ -98,7 +144,9 @@ class Bouquet(models.Model):
         default=0.00,
         verbose_name="Стоимость оформления (руб.)",
     )
-    image = models.ImageField(verbose_name="Изображение", null=True)
+    image = models.ImageField(
+        verbose_name="Изображение", null=True, storage=get_image_storage
+    )
     description = models.CharField(verbose_name="описание", max_length=100)
     events = models.ManyToManyField(
         "Event", related_name="bouquets", verbose_name="События", blank=True
@@ -106,24 +154,45 @@ class Bouquet(models.Model):
     total_price = models.DecimalField(
         max_digits=10, decimal_places=2, default=0, verbose_name="Общая стоимость"
     )
+    import_hash = models.CharField(
+        max_length=64, blank=True, editable=False, verbose_name="Хеш импорта"
+    )
+    # Ключ кеша карточек букета: увеличивается при любом изменении букета
+    # или его состава
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    objects = BouquetQuerySet.as_manager()
 
     def get_price(self):
-        total_price = self.base_price
-        for bouquet_component in self.components.all():
-            total_price += (
-                bouquet_component.component.price * bouquet_component.quantity
+        if not self.pk:
+            return Decimal(str(self.base_price))
+        components_price = self.components.aggregate(
+            total=Sum(
+                F("component__price") * F("quantity"),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
             )
-        return total_price
+        )["total"]
+        return Decimal(str(self.base_price)) + (components_price or 0)
 
     def composition(self):
         return [(item.component, item.quantity) for item in self.components.all()]
 
+    def save(self, *args, **kwargs):
+        # Итоговая цена и версия выставляются в pre_save; при сохранении
+        # отдельных полей они тоже должны попасть в UPDATE, иначе карточка
+        # в кеше останется прежней
+        if kwargs.get("update_fields"):
+            kwargs["update_fields"] = {*kwargs["update_fields"], "total_price", "version"}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
     class Meta:
         verbose_name = "Букет"
         verbose_name_plural = "Букеты"
+        # Подбор букетов по бюджету в квизе
+        indexes = [models.Index(fields=["total_price"])]
 
 
 class BouquetComponent(models.Model):
@@ -146,7 +215,30 @@ class BouquetComponent(models.Model):
         unique_together = ["bouquet", "component"]
 
 
+class OrderQuerySet(models.QuerySet):
+    def move_to(self, status):
+        """Переводит заказы в статус, если переход допустим; возвращает число заказов"""
+        return self.filter(status__in=Order.STATUS_TRANSITIONS[status]).update(
+            status=status
+        )
+
+
 class Order(models.Model):
+    STATUS_CHOICES = [
+        ("pending", "Ожидает оплаты"),
+        ("paid", "Оплачен"),
+        ("assembled", "Собран"),
+        ("delivered", "Доставлен"),
+        ("canceled", "Отменён"),
+    ]
+    # Допустимые переходы: целевой статус -> статусы, из которых в него можно перейти
+    STATUS_TRANSITIONS = {
+        "paid": ["pending"],
+        "assembled": ["paid"],
+        "delivered": ["assembled"],
+        "canceled": ["pending"],
+    }
+
     customer_name = models.CharField(max_length=255, blank=True)
     customer_phone = models.CharField(max_length=15, blank=True)
     delivery_address = models.TextField(blank=True)
@@ -155,10 +247,67 @@ class Order(models.Model):
         Bouquet, on_delete=models.SET_NULL, null=True, blank=True, related_name="orders"
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default="pending",
+        verbose_name="Статус",
+    )
+    payment_id = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name="ID платежа",
+    )
+
+    objects = OrderQuerySet.as_manager()
 
     def __str__(self):
         return f"Заказ #{self.id} от {self.customer_name}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+            # Список заказов в админке: сортировка и фильтр по дате
+            models.Index(fields=["created_at"]),
+            # Заказы клиента по телефону, новые первыми
+            models.Index(fields=["customer_phone", "created_at"]),
+        ]
+
+
+class StockReservation(models.Model):
+    """Элементы, списанные со склада под заказ до его оплаты или отмены"""
+
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name="reservations"
+    )
+    component = models.ForeignKey(Component, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(verbose_name="Количество")
+
+    def __str__(self):
+        return f"{self.order_id}: {self.component_id} x {self.quantity}"
+
+    class Meta:
+        verbose_name = "Резерв склада"
+        verbose_name_plural = "Резервы склада"
+
+
+class PaymentEvent(models.Model):
+    """Принятое уведомление ЮKassa; повторы одного события отбрасываются"""
+
+    payment_id = models.CharField(max_length=64, verbose_name="ID платежа")
+    event = models.CharField(max_length=50, verbose_name="Событие")
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name="Получено")
+
+    def __str__(self):
+        return f"{self.event}: {self.payment_id}"
+
+    class Meta:
+        unique_together = ["payment_id", "event"]
+        verbose_name = "Уведомление об оплате"
+        verbose_name_plural = "Уведомления об оплате"
+
 
 class Event(models.Model):
 
@@ -202,6 +351,13 @@ class PriceRange(models.Model):
             return f"До {int(self.max_price)} руб."
         return
 
+    def contains(self, price):
+        if self.min_price is not None and price < self.min_price:
+            return False
+        if self.max_price is not None and price > self.max_price:
+            return False
+        return True
+
     def __str__(self):
         return self.name
 
@@ -211,6 +367,26 @@ class PriceRange(models.Model):
         super().save(*args, **kwargs)
 
 
+class QuizMatch(models.Model):
+    """Предрасчитанная выдача квиза: id букетов для события и ценового диапазона"""
+
+    event = models.ForeignKey(
+        Event, on_delete=models.CASCADE, related_name="quiz_matches"
+    )
+    price_range = models.ForeignKey(
+        PriceRange, on_delete=models.CASCADE, related_name="quiz_matches"
+    )
+    bouquet_ids = models.JSONField(default=list, verbose_name="Букеты")
+
+    def __str__(self):
+        return f"{self.event_id}: {self.price_range_id}"
+
+    class Meta:
+        unique_together = ["event", "price_range"]
+        verbose_name = "Подборка квиза"
+        verbose_name_plural = "Подборки квиза"
+
+
 class Consultation(models.Model):
     """Модель консультации"""
 
@@ -227,3 +403,35 @@ class Consultation(models.Model):
     class Meta:
         verbose_name = "Консультация"
         verbose_name_plural = "Консультации"
+        indexes = [models.Index(fields=["created_at"])]
+
+
+class Notification(models.Model):
+    """Исходящее уведомление в Telegram, ожидающее отправки воркером"""
+
+    STATUS_CHOICES = [
+        ("pending", "Ожидает отправки"),
+        ("sending", "Отправляется"),
+        ("sent", "Отправлено"),
+        ("failed", "Не удалось отправить"),
+    ]
+
+    text = models.TextField(verbose_name="Текст")
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default="pending", verbose_name="Статус"
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток")
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Следующая попытка"
+    )
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата отправки")
+
+    def __str__(self):
+        return f"Уведомление #{self.pk} ({self.status})"
+
+    class Meta:
+        verbose_name = "Уведомление"
+        verbose_name_plural = "Уведомления"
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
@@ -0,0 +1,165 @@
+import time
+from datetime import timedelta
+
+import telegram
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .metrics import NOTIFICATION_SEND_SECONDS, NOTIFICATIONS_DELIVERED
+from .models import Notification
+
+
+# Ограничение Telegram на длину одного сообщения
+MESSAGE_LIMIT = 4096
+MESSAGE_SEPARATOR = "\n\n"
+
+BATCH_SIZE = getattr(settings, "NOTIFICATIONS_BATCH_SIZE", 50)
+MAX_ATTEMPTS = getattr(settings, "NOTIFICATIONS_MAX_ATTEMPTS", 10)
+BACKOFF_BASE = getattr(settings, "NOTIFICATIONS_BACKOFF_BASE", 5)
+BACKOFF_MAX = getattr(settings, "NOTIFICATIONS_BACKOFF_MAX", 3600)
+# Минимальная пауза между сообщениями в чат, в секундах
+MIN_SEND_INTERVAL = getattr(settings, "NOTIFICATIONS_MIN_SEND_INTERVAL", 3)
+# Сколько секунд пачка закреплена за воркером. Если он упал, не отправив
+# её, по истечении срока пачку заберёт другой воркер
+CLAIM_TIMEOUT = getattr(settings, "NOTIFICATIONS_CLAIM_TIMEOUT", 10 * 60)
+
+
+def enqueue_notification(text):
+    """Ставит уведомление в очередь в текущей транзакции"""
+    return Notification.objects.create(text=text)
+
+
+def get_bot():
+    return telegram.Bot(token=settings.TG_BOT_TOKEN)
+
+
+def coalesce(notifications, limit=MESSAGE_LIMIT):
+    """Склеивает уведомления в сообщения не длиннее limit символов.
+
+    Возвращает список пар (текст сообщения, уведомления в нём).
+    """
+    messages = []
+    text, group = "", []
+    for notification in notifications:
+        candidate = f"{text}{MESSAGE_SEPARATOR}{notification.text}" if group else notification.text
+        if group and len(candidate) > limit:
+            messages.append((text, group))
+            text, group = notification.text[:limit], [notification]
+        else:
+            text, group = candidate[:limit], group + [notification]
+    if group:
+        messages.append((text, group))
+    return messages
+
+
+def get_backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+class RateLimiter:
+    """Выдерживает минимальный интервал между отправками"""
+
+    def __init__(self, interval=MIN_SEND_INTERVAL, clock=time.monotonic, sleep=time.sleep):
+        self.interval = interval
+        self.clock = clock
+        self.sleep = sleep
+        self.last_call = None
+
+    def wait(self):
+        if self.last_call is not None:
+            delay = self.last_call + self.interval - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+        self.last_call = self.clock()
+
+
+def mark_failed(notifications, error, retry_after=None):
+    now = timezone.now()
+    for notification in notifications:
+        notification.attempts += 1
+        notification.last_error = str(error)
+        notification.status = "failed" if notification.attempts >= MAX_ATTEMPTS else "pending"
+        delay = (
+            timedelta(seconds=retry_after)
+            if retry_after is not None
+            else get_backoff(notification.attempts)
+        )
+        notification.next_attempt_at = now + delay
+    Notification.objects.bulk_update(
+        notifications, ["attempts", "last_error", "status", "next_attempt_at"]
+    )
+
+
+def claim_notifications(batch_size=BATCH_SIZE):
+    """Закрепляет за воркером пачку уведомлений, которые пора отправить.
+
+    Каждая строка забирается условным UPDATE по прочитанным статусу и сроку:
+    если её уже забрал другой воркер, UPDATE ничего не изменит, и второй раз
+    она не отправится.
+    """
+    now = timezone.now()
+    due = list(
+        Notification.objects.filter(
+            status__in=["pending", "sending"], next_attempt_at__lte=now
+        ).order_by("next_attempt_at", "pk")[:batch_size]
+    )
+    claimed_until = now + timedelta(seconds=CLAIM_TIMEOUT)
+    claimed = []
+    with transaction.atomic():
+        for notification in due:
+            if Notification.objects.filter(
+                pk=notification.pk,
+                status=notification.status,
+                next_attempt_at=notification.next_attempt_at,
+            ).update(status="sending", next_attempt_at=claimed_until):
+                notification.status = "sending"
+                notification.next_attempt_at = claimed_until
+                claimed.append(notification)
+    return claimed
+
+
+def release_notifications(notifications, next_attempt_at):
+    """Возвращает в очередь закреплённые, но не отправленные уведомления"""
+    Notification.objects.filter(
+        pk__in=[notification.pk for notification in notifications], status="sending"
+    ).update(status="pending", next_attempt_at=next_attempt_at)
+
+
+def deliver_notifications(bot, chat_id, rate_limiter=None, batch_size=BATCH_SIZE):
+    """Отправляет одну пачку накопившихся уведомлений.
+
+    Пачка сначала закрепляется за воркером, поэтому параллельные воркеры
+    не отправляют одно уведомление дважды. Уведомления, пришедшие пачкой,
+    уходят одним сообщением. При ошибке
+    отправки попытка откладывается с экспоненциальной задержкой. Возвращает
+    пару (отправлено, не отправлено) в штуках уведомлений.
+    """
+    rate_limiter = rate_limiter or RateLimiter()
+    messages = coalesce(claim_notifications(batch_size))
+    sent = failed = 0
+    for number, (text, group) in enumerate(messages):
+        rate_limiter.wait()
+        try:
+            with NOTIFICATION_SEND_SECONDS.time():
+                bot.send_message(chat_id=chat_id, text=text)
+        except telegram.error.RetryAfter as error:
+            mark_failed(group, error, retry_after=error.retry_after)
+            NOTIFICATIONS_DELIVERED.inc(len(group), result="failed")
+            failed += len(group)
+            release_notifications(
+                [item for _, rest in messages[number + 1:] for item in rest],
+                timezone.now() + timedelta(seconds=error.retry_after),
+            )
+            break
+        except Exception as error:
+            mark_failed(group, error)
+            NOTIFICATIONS_DELIVERED.inc(len(group), result="failed")
+            failed += len(group)
+            continue
+        Notification.objects.filter(pk__in=[item.pk for item in group]).update(
+            status="sent", sent_at=timezone.now()
+        )
+        NOTIFICATIONS_DELIVERED.inc(len(group), result="sent")
+        sent += len(group)
+    return sent, failed
@@ -0,0 +1,86 @@
+import hashlib
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+
+STOREFRONT_VERSION_KEY = "storefront:version"
+CSRF_PLACEHOLDER = "__CSRF_TOKEN__"
+CSRF_INPUT = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def get_storefront_version():
+    version = cache.get(STOREFRONT_VERSION_KEY)
+    if version is None:
+        # Начальное значение берётся из времени: если ключ версии вытеснен
+        # из кеша, старые страницы не совпадут с новой версией
+        cache.add(STOREFRONT_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(STOREFRONT_VERSION_KEY)
+    return version
+
+
+def bump_storefront_version():
+    try:
+        cache.incr(STOREFRONT_VERSION_KEY)
+    except ValueError:
+        cache.set(STOREFRONT_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_storefront():
+    """Сбрасывает закешированные страницы витрины.
+
+    Версия меняется сразу и ещё раз после коммита: страница, отрисованная
+    параллельным запросом по данным до коммита, не переживёт транзакцию.
+    """
+    bump_storefront_version()
+    transaction.on_commit(bump_storefront_version)
+
+
+def get_page_cache_key(request, version):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"storefront:page:{version}:{path}"
+
+
+def cache_storefront_page(view):
+    """Кеширует страницу витрины целиком.
+
+    Кешируются только успешные GET-ответы. CSRF-токен в форме заменяется
+    заглушкой и при каждой выдаче подставляется токен текущего посетителя.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD") or not getattr(
+            settings, "PAGE_CACHE_ENABLED", True
+        ):
+            return view(request, *args, **kwargs)
+        key = get_page_cache_key(request, get_storefront_version())
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(
+                content.replace(CSRF_PLACEHOLDER, get_token(request)),
+                content_type=content_type,
+            )
+
+        response = view(request, *args, **kwargs)
+        if hasattr(response, "render"):
+            response.render()
+        if response.status_code == 200 and not response.streaming:
+            content = CSRF_INPUT.sub(
+                rf"\g<1>{CSRF_PLACEHOLDER}\g<2>", response.content.decode(response.charset)
+            )
+            cache.set(
+                key,
+                (content, response["Content-Type"]),
+                getattr(settings, "PAGE_CACHE_TIMEOUT", 600),
+            )
+        return response
+
+    return wrapper
@@ -0,0 +1,103 @@
+import threading
+import uuid
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
+from yookassa.domain.exceptions import ApiError
+from yookassa.domain.request import PaymentRequest
+from yookassa.domain.response import PaymentResponse
+
+
+def raise_api_error(response):
+    """ApiError по ответу с ошибкой; прокси и балансировщики отдают 502 в HTML"""
+    try:
+        content = response.json()
+    except ValueError:
+        content = None
+    if not isinstance(content, dict):
+        content = {
+            "type": "error",
+            "code": str(response.status_code),
+            "description": response.text[:500],
+        }
+    raise ApiError(content)
+
+
+class YooKassaClient:
+    """HTTP-клиент ЮKassa с пулом keep-alive соединений.
+
+    SDK открывает новую сессию (и TLS-соединение) на каждый запрос, поэтому
+    платежи создаются через этот клиент: он настраивается один раз на процесс
+    и безопасно используется из нескольких потоков.
+    """
+
+    def __init__(self, shop_id, secret_key, api_url, timeout=10, pool_size=32):
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.auth = (str(shop_id), secret_key)
+        # Повтор POST безопасен: ЮKassa не создаст второй платёж с тем же ключом
+        retries = Retry(
+            total=3,
+            backoff_factor=0.3,
+            allowed_methods=["GET", "POST"],
+            status_forcelist=[202, 500, 502, 503, 504],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retries
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def create_payment(self, params, idempotency_key):
+        payment_request = PaymentRequest(params)
+        payment_request.validate()
+        response = self.session.post(
+            f"{self.api_url}/payments",
+            json=dict(payment_request),
+            headers={"Idempotence-Key": str(idempotency_key)},
+            timeout=self.timeout,
+        )
+        if response.status_code != 200:
+            raise_api_error(response)
+        return PaymentResponse(response.json())
+
+    def get_payment(self, payment_id):
+        response = self.session.get(
+            f"{self.api_url}/payments/{payment_id}", timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise_api_error(response)
+        return PaymentResponse(response.json())
+
+
+# Событие ЮKassa -> (статус платежа у провайдера, статус заказа)
+PAYMENT_EVENTS = {
+    "payment.succeeded": ("succeeded", "paid"),
+    "payment.canceled": ("canceled", "canceled"),
+}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_payment_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = YooKassaClient(
+                    settings.YOOKASSA_SHOP_ID,
+                    settings.YOOKASSA_SECRET_KEY,
+                    settings.YOOKASSA_API_URL,
+                )
+    return _client
+
+
+def get_idempotency_key(order):
+    """Ключ идемпотентности платежа: один и тот же для повторов по заказу"""
+    return uuid.uuid5(uuid.NAMESPACE_URL, f"flowershop/orders/{order.pk}")
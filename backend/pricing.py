@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+from django.db import models, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Bouquet, BouquetComponent
+from .page_cache import invalidate_storefront
+from .quiz_index import update_quiz_index
+
+
+PriceDrift = namedtuple("PriceDrift", ["bouquet_id", "name", "stored_price", "actual_price"])
+
+
+def find_price_drift(components=None, batch_size=2000):
+    """Находит букеты, у которых сохранённый total_price расходится с составом.
+
+    Стоимость всех букетов считается одним агрегирующим запросом по
+    BouquetComponent. Если переданы components, проверяются только букеты,
+    в состав которых они входят.
+    """
+    bouquets = Bouquet.objects.all()
+    if components is not None:
+        bouquets = bouquets.filter(
+            pk__in=BouquetComponent.objects.filter(component__in=components).values(
+                "bouquet"
+            )
+        )
+    price_field = models.DecimalField(max_digits=10, decimal_places=2)
+    rows = (
+        bouquets.annotate(
+            actual_price=F("base_price")
+            + Coalesce(
+                Sum(
+                    F("components__component__price") * F("components__quantity"),
+                    output_field=price_field,
+                ),
+                Value(0),
+                output_field=price_field,
+            )
+        )
+        .order_by("pk")
+        .values_list("pk", "name", "total_price", "actual_price")
+    )
+    return [
+        PriceDrift(*row)
+        for row in rows.iterator(chunk_size=batch_size)
+        if row[2] != row[3]
+    ]
+
+
+def recalculate_total_prices(components=None, dry_run=False, batch_size=2000):
+    """Пересчитывает total_price букетов и записывает изменения пачками.
+
+    Записываются только букеты с расхождением: каждая пачка обновляется
+    одним UPDATE по списку id. Возвращает список расхождений; при dry_run
+    ничего не записывает.
+    """
+    drift = find_price_drift(components=components, batch_size=batch_size)
+    if dry_run or not drift:
+        return drift
+    with transaction.atomic():
+        for start in range(0, len(drift), batch_size):
+            bouquet_ids = [item.bouquet_id for item in drift[start:start + batch_size]]
+            Bouquet.objects.filter(pk__in=bouquet_ids).update_total_prices()
+        update_quiz_index(item.bouquet_id for item in drift)
+        invalidate_storefront()
+    return drift
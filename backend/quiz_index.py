@@ -0,0 +1,127 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Bouquet, PriceRange, QuizMatch
+
+
+BouquetEvent = Bouquet.events.through
+
+# При большем числе изменённых букетов дешевле перестроить индекс целиком
+INCREMENTAL_UPDATE_LIMIT = 500
+
+
+def build_matches():
+    """Считает выдачу квиза для всех пар (событие, диапазон) с нуля.
+
+    Возвращает словарь {(event_id, price_range_id): [bouquet_id, ...]},
+    списки отсортированы по id букета. Пары без букетов не попадают в словарь.
+    """
+    price_ranges = list(PriceRange.objects.all())
+    matches = defaultdict(list)
+    memberships = BouquetEvent.objects.order_by("bouquet_id").values_list(
+        "event_id", "bouquet_id", "bouquet__total_price"
+    )
+    for event_id, bouquet_id, total_price in memberships.iterator(chunk_size=5000):
+        for price_range in price_ranges:
+            if price_range.contains(total_price):
+                matches[event_id, price_range.pk].append(bouquet_id)
+    return matches
+
+
+def rebuild_quiz_index():
+    """Полностью перестраивает таблицу QuizMatch"""
+    matches = build_matches()
+    with transaction.atomic():
+        QuizMatch.objects.all().delete()
+        QuizMatch.objects.bulk_create(
+            [
+                QuizMatch(event_id=event_id, price_range_id=price_range_id, bouquet_ids=ids)
+                for (event_id, price_range_id), ids in matches.items()
+            ],
+            batch_size=500,
+        )
+    return len(matches)
+
+
+def update_quiz_index(bouquet_ids, event_ids=()):
+    """Обновляет позиции букетов в индексе, не пересчитывая его целиком.
+
+    Затрагиваются только строки событий, к которым букеты относятся сейчас,
+    и событий из event_ids — тех, от которых букеты только что отвязали.
+    """
+    bouquet_ids = set(bouquet_ids)
+    if not bouquet_ids:
+        return
+    if len(bouquet_ids) > INCREMENTAL_UPDATE_LIMIT:
+        rebuild_quiz_index()
+        return
+    bouquet_events = defaultdict(set)
+    bouquet_prices = dict(
+        Bouquet.objects.filter(pk__in=bouquet_ids).values_list("pk", "total_price")
+    )
+    memberships = BouquetEvent.objects.filter(bouquet_id__in=bouquet_ids).values_list(
+        "bouquet_id", "event_id"
+    )
+    for bouquet_id, event_id in memberships:
+        bouquet_events[bouquet_id].add(event_id)
+
+    touched_events = set(event_ids).union(*bouquet_events.values())
+    if not touched_events:
+        return
+    price_ranges = list(PriceRange.objects.all())
+
+    with transaction.atomic():
+        existing = {
+            (match.event_id, match.price_range_id): match
+            for match in QuizMatch.objects.select_for_update().filter(
+                event_id__in=touched_events
+            )
+        }
+        to_create, to_update = [], []
+        for event_id in touched_events:
+            for price_range in price_ranges:
+                match = existing.get((event_id, price_range.pk))
+                current = match.bouquet_ids if match else []
+                ids = [pk for pk in current if pk not in bouquet_ids]
+                ids.extend(
+                    pk
+                    for pk in bouquet_ids
+                    if event_id in bouquet_events[pk]
+                    and price_range.contains(bouquet_prices[pk])
+                )
+                ids.sort()
+                if match is None:
+                    if ids:
+                        to_create.append(
+                            QuizMatch(
+                                event_id=event_id,
+                                price_range_id=price_range.pk,
+                                bouquet_ids=ids,
+                            )
+                        )
+                elif ids != current:
+                    match.bouquet_ids = ids
+                    to_update.append(match)
+        QuizMatch.objects.bulk_create(to_create, batch_size=500)
+        QuizMatch.objects.bulk_update(to_update, ["bouquet_ids"], batch_size=500)
+
+
+def check_quiz_index():
+    """Сверяет таблицу QuizMatch с выдачей, посчитанной с нуля.
+
+    Возвращает отсортированный список пар (event_id, price_range_id),
+    для которых сохранённая выдача расходится с ожидаемой.
+    """
+    expected = build_matches()
+    stored = {
+        (event_id, price_range_id): ids
+        for event_id, price_range_id, ids in QuizMatch.objects.values_list(
+            "event_id", "price_range_id", "bouquet_ids"
+        )
+    }
+    return sorted(
+        key
+        for key in expected.keys() | stored.keys()
+        if expected.get(key, []) != stored.get(key, [])
+    )
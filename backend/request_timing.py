@@ -0,0 +1,89 @@
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends import django as django_backend
+
+
+# Замеры текущего запроса; None, если запрос не попал в выборку
+current_timing = ContextVar("current_timing", default=None)
+
+
+class RequestTiming:
+    """Время SQL и шаблонов одного запроса"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.queries = []
+
+    def add_query(self, sql, duration):
+        self.db_time += duration
+        self.queries.append((sql, duration))
+
+    def get_slowest(self, limit=3):
+        return sorted(self.queries, key=lambda query: query[1], reverse=True)[:limit]
+
+    def get_repeated(self, threshold):
+        """Запросы, повторённые не меньше threshold раз: (sql, раз, суммарное время)"""
+        counts = Counter(sql for sql, _ in self.queries)
+        durations = defaultdict(float)
+        for sql, duration in self.queries:
+            durations[sql] += duration
+        return [
+            (sql, count, durations[sql])
+            for sql, count in counts.most_common()
+            if count >= threshold
+        ]
+
+
+def time_query(execute, sql, params, many, context):
+    timing = current_timing.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_timer(sender=None, connection=None, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def enable_query_timing():
+    """Подключает замер SQL ко всем соединениям, в том числе будущим"""
+    connection_created.connect(install_query_timer, dispatch_uid="backend.request_timing")
+    for connection in connections.all(initialized_only=True):
+        install_query_timer(connection=connection)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        timing = current_timing.get()
+        if timing is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        db_time = timing.db_time
+        try:
+            return super().render(context, request)
+        finally:
+            # SQL из ленивых querysets в шаблоне уже учтён во времени базы
+            timing.template_time += (
+                time.perf_counter() - started - (timing.db_time - db_time)
+            )
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Шаблонизатор Django, замеряющий время отрисовки для Server-Timing"""
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
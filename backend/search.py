@@ -0,0 +1,120 @@
+import re
+
+from django.db import connection, transaction
+
+from .models import Bouquet, BouquetComponent, Component, Event
+
+
+SEARCH_TABLE = "backend_bouquet_search"
+# При большем числе изменённых букетов дешевле перестроить индекс целиком
+INCREMENTAL_UPDATE_LIMIT = 500
+SEARCH_WORD = re.compile(r"\w+")
+# Окончания русских слов: поиск идёт по основе как по префиксу,
+# поэтому «белые розы» находит «белая роза» и «розами»
+RUSSIAN_ENDING = re.compile(
+    r"(ами|ями|ого|его|ому|ему|ыми|ими|ая|яя|ое|ее|ые|ие|ый|ий|ой|ей|ых|их|ым|им"
+    r"|ов|ев|ам|ям|ах|ях|ом|ем|ую|юю|а|я|ы|и|у|ю|е|о|ь)$"
+)
+MIN_STEM_LENGTH = 3
+# Вес совпадений по колонкам (name, description, components, events):
+# название важнее состава, состав важнее описания
+BM25_WEIGHTS = (10.0, 2.0, 5.0, 3.0)
+
+BouquetEvent = Bouquet.events.through
+
+
+def normalize(text):
+    # unicode61 не приравнивает «ё» к «е»
+    return text.lower().replace("ё", "е")
+
+
+def get_stem(word):
+    stem = RUSSIAN_ENDING.sub("", word)
+    return stem if len(stem) >= MIN_STEM_LENGTH else word
+
+
+def build_match_query(text):
+    """Строка запроса FTS5: все слова обязательны, каждое ищется по префиксу"""
+    words = SEARCH_WORD.findall(normalize(text))
+    return " ".join(f'"{get_stem(word)}"*' for word in words)
+
+
+def search_bouquets(text, limit=30):
+    """Букеты, подходящие под запрос, от наиболее релевантных"""
+    match_query = build_match_query(text)
+    if not match_query:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"ORDER BY bm25({SEARCH_TABLE}, {', '.join(map(str, BM25_WEIGHTS))}) "
+            "LIMIT %s",
+            [match_query, limit],
+        )
+        bouquet_ids = [row[0] for row in cursor.fetchall()]
+    bouquets = Bouquet.objects.in_bulk(bouquet_ids)
+    return [bouquets[pk] for pk in bouquet_ids if pk in bouquets]
+
+
+def normalize_sql(expression):
+    # lower() в SQLite не работает с кириллицей, поэтому заменяются обе «ё»
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def get_document_sql():
+    """SELECT документов индекса: букет, названия его элементов и событий"""
+    return f"""
+        SELECT
+            bouquet.id,
+            {normalize_sql("bouquet.name")},
+            {normalize_sql("bouquet.description")},
+            (
+                SELECT {normalize_sql("group_concat(component.name, ' ')")}
+                FROM {BouquetComponent._meta.db_table} item
+                JOIN {Component._meta.db_table} component
+                    ON component.id = item.component_id
+                WHERE item.bouquet_id = bouquet.id
+            ),
+            (
+                SELECT {normalize_sql("group_concat(event.name, ' ')")}
+                FROM {BouquetEvent._meta.db_table} link
+                JOIN {Event._meta.db_table} event ON event.id = link.event_id
+                WHERE link.bouquet_id = bouquet.id
+            )
+        FROM {Bouquet._meta.db_table} bouquet
+    """
+
+
+def rebuild_search_index():
+    """Полностью перестраивает поисковый индекс"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE}(rowid, name, description, components, events) "
+            + get_document_sql()
+        )
+        count = cursor.rowcount
+        # Слияние сегментов индекса ускоряет последующие запросы
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def update_search_index(bouquet_ids):
+    """Переиндексирует букеты; удалённых букетов в индексе не остаётся"""
+    bouquet_ids = list(set(bouquet_ids))
+    if not bouquet_ids:
+        return
+    if len(bouquet_ids) > INCREMENTAL_UPDATE_LIMIT:
+        rebuild_search_index()
+        return
+    placeholders = ", ".join(["%s"] * len(bouquet_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", bouquet_ids
+        )
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE}(rowid, name, description, components, events) "
+            + get_document_sql()
+            + f" WHERE bouquet.id IN ({placeholders})",
+            bouquet_ids,
+        )
@@ -1,14 +1,176 @@
-import telegram
-from django.db.models.signals import post_save
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.db import transaction
+from django.db.models import F
 from django.dispatch import receiver
 
-from .models import Order, Consultation
-from FlowerShop.settings import TG_BOT_TOKEN, TG_CHAT_ID
+from .models import (
+    Bouquet,
+    BouquetComponent,
+    Component,
+    Event,
+    Order,
+    Consultation,
+    PriceRange,
+)
+from .availability import invalidate_buildable_counts
+from .metrics import NOTIFICATIONS_ENQUEUED
+from .notifications import enqueue_notification
+from .page_cache import invalidate_storefront
+from .quiz_index import rebuild_quiz_index, update_quiz_index
+from .search import update_search_index
+from .thumbnails import generate_derivatives
 
 
-bot = telegram.Bot(token=TG_BOT_TOKEN)
+@receiver(pre_save, sender=Bouquet)
+def update_bouquet_total_price(sender, instance, **kwargs):
+    instance.total_price = instance.get_price()
+    # Версия увеличивается в самом UPDATE: устаревшее значение в памяти
+    # не перезапишет версию, поднятую другими изменениями
+    if not instance._state.adding:
+        instance.version = F("version") + 1
 
 
+@receiver(post_save, sender=BouquetComponent)
+@receiver(post_delete, sender=BouquetComponent)
+def update_total_price_on_composition_change(sender, instance, **kwargs):
+    Bouquet.objects.filter(pk=instance.bouquet_id).update_total_prices()
+    update_quiz_index([instance.bouquet_id])
+    update_search_index([instance.bouquet_id])
+
+
+# Поля элемента, которые видны в карточке букета
+COMPONENT_CARD_FIELDS = {"name", "price"}
+
+
+@receiver(post_save, sender=Component)
+def update_total_price_on_component_change(sender, instance, update_fields, **kwargs):
+    if update_fields is not None and not COMPONENT_CARD_FIELDS & set(update_fields):
+        return
+    bouquet_ids = list(
+        Bouquet.objects.filter(components__component=instance).values_list(
+            "pk", flat=True
+        )
+    )
+    Bouquet.objects.filter(components__component=instance).update_total_prices()
+    update_quiz_index(bouquet_ids)
+    update_search_index(bouquet_ids)
+
+
+@receiver(post_save, sender=Component)
+def refresh_buildable_counts_on_stock_change(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "stock" not in update_fields:
+        return
+    invalidate_buildable_counts([instance.pk])
+
+
+@receiver(post_delete, sender=Component)
+@receiver(post_save, sender=BouquetComponent)
+@receiver(post_delete, sender=BouquetComponent)
+def refresh_buildable_counts_on_composition_change(sender, **kwargs):
+    invalidate_buildable_counts()
+
+
+@receiver(post_save, sender=Bouquet)
+def refresh_bouquet_version(sender, instance, created, **kwargs):
+    if not created:
+        instance.refresh_from_db(fields=["version"])
+
+
+@receiver(post_save, sender=Bouquet)
+def update_quiz_index_on_bouquet_save(sender, instance, **kwargs):
+    update_quiz_index([instance.pk])
+
+
+@receiver(pre_delete, sender=Bouquet)
+def remember_bouquet_events(sender, instance, **kwargs):
+    instance._quiz_event_ids = list(instance.events.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Bouquet)
+def update_quiz_index_on_bouquet_delete(sender, instance, **kwargs):
+    update_quiz_index([instance.pk], getattr(instance, "_quiz_event_ids", ()))
+
+
+@receiver(m2m_changed, sender=Bouquet.events.through)
+def update_quiz_index_on_events_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        related = instance.bouquets if reverse else instance.events
+        instance._quiz_cleared_ids = list(related.values_list("pk", flat=True))
+        return
+    if action == "post_clear":
+        pk_set = getattr(instance, "_quiz_cleared_ids", ())
+    elif action not in ("post_add", "post_remove"):
+        return
+    if reverse:
+        update_quiz_index(pk_set, [instance.pk])
+    else:
+        update_quiz_index([instance.pk], pk_set)
+
+
+@receiver(post_save, sender=Bouquet)
+@receiver(post_delete, sender=Bouquet)
+def update_search_index_on_bouquet_change(sender, instance, **kwargs):
+    update_search_index([instance.pk])
+
+
+@receiver(m2m_changed, sender=Bouquet.events.through)
+def update_search_index_on_events_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "post_clear":
+        # Связи запомнены перед очисткой в update_quiz_index_on_events_change
+        pk_set = getattr(instance, "_quiz_cleared_ids", ())
+    elif action not in ("post_add", "post_remove"):
+        return
+    update_search_index(pk_set if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Event)
+def update_search_index_on_event_rename(sender, instance, created, **kwargs):
+    if not created:
+        update_search_index(instance.bouquets.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Event)
+def remember_event_bouquets(sender, instance, **kwargs):
+    instance._search_bouquet_ids = list(instance.bouquets.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Event)
+def update_search_index_on_event_delete(sender, instance, **kwargs):
+    update_search_index(getattr(instance, "_search_bouquet_ids", ()))
+
+
+@receiver(post_save, sender=PriceRange)
+def rebuild_quiz_index_on_price_range_change(sender, instance, **kwargs):
+    rebuild_quiz_index()
+
+
+@receiver(post_save, sender=Bouquet)
+@receiver(post_delete, sender=Bouquet)
+@receiver(post_save, sender=BouquetComponent)
+@receiver(post_delete, sender=BouquetComponent)
+@receiver(post_save, sender=Component)
+@receiver(post_delete, sender=Component)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=PriceRange)
+@receiver(post_delete, sender=PriceRange)
+@receiver(m2m_changed, sender=Bouquet.events.through)
+def invalidate_storefront_pages(sender, **kwargs):
+    invalidate_storefront()
+
+
+@receiver(post_save, sender=Bouquet)
+@receiver(post_save, sender=Component)
+def generate_image_derivatives(sender, instance, **kwargs):
+    if instance.image:
+        generate_derivatives(instance.image.name, instance.image.storage)
+
 
 @receiver(post_save, sender=Order)
 def notify_telegram_order(sender, instance, created, **kwargs):
@@ -19,7 +181,10 @@ def notify_telegram_order(sender, instance, created, **kwargs):
             f"Адрес: {instance.delivery_address}\n"
             f"Букет: {instance.bouquet }"
         )
-        bot.send_message(chat_id=TG_CHAT_ID, text=message)
+        enqueue_notification(message)
+        # Счётчик в отдельной базе: заказ, откаченный из-за нехватки
+        # остатков, не должен попасть в метрики
+        transaction.on_commit(lambda: NOTIFICATIONS_ENQUEUED.inc(kind="order"))
 
 @receiver(post_save, sender=Consultation)
 def notify_telegram_consultation(sender, instance, created, **kwargs):
@@ -28,4 +193,5 @@ def notify_telegram_consultation(sender, instance, created, **kwargs):
             f"Клиент: {instance.name}\n "
             f"Телефон: {instance.phone}\n"
         )
-        bot.send_message(chat_id=TG_CHAT_ID, text=message)
\ No newline at end of file
+        enqueue_notification(message)
+        transaction.on_commit(lambda: NOTIFICATIONS_ENQUEUED.inc(kind="consultation"))
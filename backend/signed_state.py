@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core import signing
+
+
+# Состояние квиза и оформления заказа хранится в подписанных cookie, а не
+# в сессии: анонимные посетители не создают строк в django_session
+QUIZ_COOKIE = "quiz"
+ORDER_COOKIE = "order"
+STATE_MAX_AGE = 24 * 60 * 60
+
+
+def get_salt(name):
+    return f"backend.signed_state.{name}"
+
+
+def load_state(request, name):
+    """Состояние из cookie; пустой словарь, если его нет, подпись неверна
+    или срок истёк"""
+    value = request.COOKIES.get(name)
+    if value is None:
+        return {}
+    try:
+        return signing.loads(value, salt=get_salt(name), max_age=STATE_MAX_AGE)
+    except signing.BadSignature:
+        return {}
+
+
+def save_state(response, name, state):
+    response.set_cookie(
+        name,
+        signing.dumps(state, salt=get_salt(name), compress=True),
+        max_age=STATE_MAX_AGE,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite="Lax",
+    )
+    return response
+
+
+def clear_state(response, name):
+    response.delete_cookie(name, samesite="Lax")
+    return response
@@ -0,0 +1,119 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .availability import invalidate_buildable_counts
+from .db import retry_on_lock
+from .models import BouquetComponent, Component, Order, StockReservation
+
+
+class OutOfStock(Exception):
+    """Для заказа не хватает элементов на складе"""
+
+    def __init__(self, components):
+        self.components = components
+        super().__init__(", ".join(components))
+
+
+def get_requirements(bouquet):
+    """Сколько каждого элемента уходит на букет: [(id, название, количество)]"""
+    return list(
+        BouquetComponent.objects.filter(bouquet=bouquet).values_list(
+            "component_id", "component__name", "quantity"
+        )
+    )
+
+
+def reserve_stock(order, requirements):
+    """Списывает элементы под заказ; вызывается внутри транзакции.
+
+    Каждый элемент списывается условным UPDATE: остаток проверяется и
+    уменьшается одним запросом, поэтому параллельные заказы не уводят склад
+    в минус. Если чего-то не хватает, поднимается OutOfStock, и транзакция
+    откатывает уже сделанные списания.
+    """
+    short = [
+        name
+        for component_id, name, quantity in requirements
+        if not Component.objects.filter(pk=component_id, stock__gte=quantity).update(
+            stock=F("stock") - quantity
+        )
+    ]
+    if short:
+        raise OutOfStock(short)
+    StockReservation.objects.bulk_create(
+        StockReservation(order=order, component_id=component_id, quantity=quantity)
+        for component_id, _, quantity in requirements
+    )
+    invalidate_buildable_counts([component_id for component_id, _, _ in requirements])
+
+
+@retry_on_lock()
+def place_order(bouquet, **fields):
+    """Создаёт заказ и резервирует под него элементы букета"""
+    # Состав читается до транзакции: блокировка записи держится только
+    # на время самих записей
+    requirements = get_requirements(bouquet)
+    with transaction.atomic():
+        order = Order.objects.create(bouquet=bouquet, **fields)
+        reserve_stock(order, requirements)
+    return order
+
+
+def release_stock(order_ids):
+    """Возвращает на склад всё, что было зарезервировано под заказы"""
+    reservations = StockReservation.objects.filter(order_id__in=order_ids)
+    with transaction.atomic():
+        totals = list(
+            reservations.values("component_id")
+            .annotate(total=Sum("quantity"))
+            .values_list("component_id", "total")
+        )
+        for component_id, quantity in totals:
+            Component.objects.filter(pk=component_id).update(
+                stock=F("stock") + quantity
+            )
+        reservations.delete()
+        invalidate_buildable_counts([component_id for component_id, _ in totals])
+
+
+def cancel_orders(orders):
+    """Отменяет заказы и снимает их резервы; возвращает число отменённых.
+
+    Резерв снимается только тем вызовом, который сам перевёл заказ в
+    «Отменён»: повторная отмена не вернёт элементы на склад дважды. Условия
+    orders проверяются заново в самом UPDATE, поэтому заказ, изменившийся
+    после выборки, не отменяется.
+    """
+    canceled = 0
+    order_ids = orders.filter(
+        status__in=Order.STATUS_TRANSITIONS["canceled"]
+    ).values_list("pk", flat=True)
+    for order_id in list(order_ids):
+        with transaction.atomic():
+            if orders.filter(pk=order_id).move_to("canceled"):
+                release_stock([order_id])
+                canceled += 1
+    return canceled
+
+
+def get_payment_timeout():
+    return timedelta(seconds=getattr(settings, "ORDER_PAYMENT_TIMEOUT", 30 * 60))
+
+
+def cancel_expired_orders(now=None):
+    """Отменяет заказы, не оплаченные за ORDER_PAYMENT_TIMEOUT секунд.
+
+    Заказы, по которым уже создан платёж, не трогаются: покупатель может
+    быть на странице оплаты, а отменит их уведомление payment.canceled,
+    когда ЮKassa сама закроет неоплаченный платёж.
+    """
+    deadline = (now or timezone.now()) - get_payment_timeout()
+    return cancel_orders(
+        Order.objects.filter(
+            status="pending", created_at__lt=deadline, payment_id__isnull=True
+        )
+    )
@@ -0,0 +1,161 @@
+import gzip
+import hashlib
+import os
+import re
+import uuid
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Имена файлов, которые создаёт ContentAddressedStorage: "ab/ab12…ef.jpg",
+# и их уменьшенных копий: "ab/ab12…ef-400w.webp"
+CONTENT_ADDRESSED_NAME = re.compile(
+    r"^(?P<stem>[0-9a-f]{2}/[0-9a-f]{64})(-\d+w)?(\.[a-z0-9]+)?$"
+)
+
+
+def hash_file(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def get_content_addressed_name(digest, original_name):
+    suffix = PurePosixPath(original_name or "").suffix.lower()
+    return f"{digest[:2]}/{digest}{suffix}"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, называющее файлы по SHA-256 содержимого.
+
+    Одинаковые изображения хранятся на диске один раз: повторное сохранение
+    того же содержимого возвращает имя уже существующего файла.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        name = get_content_addressed_name(hash_file(content), name)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def save_derived(self, name, content, overwrite=False):
+        """Сохраняет файл, производный от оригинала, под заданным именем.
+
+        Существующий файл заменяется, только если передан overwrite.
+        """
+        if not overwrite and self.exists(name):
+            return name
+        return super().save(name, content)
+
+    def get_available_name(self, name, max_length=None):
+        if CONTENT_ADDRESSED_NAME.match(name):
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        # Файл пишется под временным именем и атомарно переименовывается:
+        # параллельные сохранения одного содержимого не мешают друг другу
+        temporary_name = super()._save(f"{name}.{uuid.uuid4().hex}.tmp", content)
+        os.replace(self.path(temporary_name), self.path(name))
+        return name
+
+
+def get_image_storage():
+    return ContentAddressedStorage()
+
+
+# Расширения текстовых файлов, для которых заранее готовятся сжатые копии
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".txt", ".html", ".xml", ".map"}
+# Сжатая копия сохраняется, только если она заметно меньше исходника
+MIN_COMPRESSION_RATIO = 0.95
+
+
+def compress_variants(data):
+    """Возвращает пары (суффикс, сжатое содержимое): gzip и, если есть модуль, brotli"""
+    variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(data, quality=11)))
+    return [
+        (suffix, compressed)
+        for suffix, compressed in variants
+        if len(compressed) < len(data) * MIN_COMPRESSION_RATIO
+    ]
+
+
+def recompress_image(data, suffix):
+    """Пережимает JPEG и PNG без потери качества; None, если выигрыша нет"""
+    try:
+        image = Image.open(BytesIO(data))
+        buffer = BytesIO()
+        if suffix in (".jpg", ".jpeg") and image.format == "JPEG":
+            # quality="keep" сохраняет таблицы квантования: повторный прогон
+            # не ухудшает изображение, а только оптимизирует кодирование
+            image.save(buffer, "JPEG", quality="keep", optimize=True, progressive=True)
+        elif suffix == ".png" and image.format == "PNG":
+            image.save(buffer, "PNG", optimize=True)
+        else:
+            return None
+    except (OSError, ValueError):
+        return None
+    if buffer.tell() >= len(data):
+        return None
+    return buffer.getvalue()
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Статика для продакшена: пережатые изображения, имена с хешем
+    содержимого и готовые gzip/brotli копии текстовых файлов.
+    """
+
+    def stored_name(self, name):
+        # Пока collectstatic не запускался, манифеста нет: ссылки ведут
+        # на исходные имена файлов
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        # Изображения пережимаются до хеширования, а хеш считается по уже
+        # собранным в STATIC_ROOT копиям: имя соответствует итоговому содержимому
+        for name in paths:
+            self.recompress(name)
+        paths = {name: (self, name) for name in paths}
+        yield from super().post_process(paths, dry_run, **options)
+        for name in sorted(set(paths) | set(self.hashed_files.values())):
+            self.compress(name)
+
+    def recompress(self, name):
+        suffix = PurePosixPath(name).suffix.lower()
+        if suffix not in (".jpg", ".jpeg", ".png"):
+            return
+        with self.open(name) as source:
+            data = source.read()
+        recompressed = recompress_image(data, suffix)
+        if recompressed is not None:
+            self.delete(name)
+            self._save(name, ContentFile(recompressed))
+
+    def compress(self, name):
+        if PurePosixPath(name).suffix.lower() not in COMPRESSIBLE_EXTENSIONS:
+            return
+        with self.open(name) as source:
+            data = source.read()
+        for suffix, compressed in compress_variants(data):
+            self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(compressed))
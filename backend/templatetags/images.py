@@ -0,0 +1,25 @@
+from django import template
+
+from backend.thumbnails import get_derivative_name, get_srcset
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(image, width, image_format="JPEG"):
+    if not image:
+        return ""
+    return image.storage.url(get_derivative_name(image.name, width, image_format))
+
+
+@register.simple_tag
+def srcset(image, image_format="JPEG"):
+    if not image:
+        return ""
+    return get_srcset(image, image_format)
+
+
+@register.inclusion_tag("picture.html")
+def picture(image, alt="", css_class="", sizes="100vw"):
+    return {"image": image, "alt": alt, "css_class": css_class, "sizes": sizes}
@@ -0,0 +1,36 @@
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+@contextmanager
+def temporary_metrics_db():
+    """Пишет метрики во временный файл и удаляет его на выходе.
+
+    Работает и как декоратор: так подключают бенчмарки, которые гоняют
+    views на тестовой базе.
+    """
+    directory = Path(tempfile.mkdtemp())
+    try:
+        with override_settings(METRICS_DB_PATH=str(directory / "metrics.sqlite3")):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    """Запускает тесты с метриками во временном файле: views, которые
+    считают заказы и шаги квиза, не пишут в рабочий METRICS_DB_PATH"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.metrics_db = temporary_metrics_db()
+        self.metrics_db.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self.metrics_db.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,1667 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import multiprocessing
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from pathlib import Path
+from decimal import Decimal
 
-# Create your tests here.
+import requests
+import telegram
+from asgiref.sync import sync_to_async
+from PIL import Image
+from yookassa.domain.exceptions import ApiError
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Bouquet,
+    BouquetComponent,
+    Component,
+    Consultation,
+    Event,
+    Notification,
+    Order,
+    PaymentEvent,
+    PriceRange,
+    QuizMatch,
+    StockReservation,
+)
+from . import payments, storage, views
+from .admin import EstimatedCountPaginator
+from .availability import BUILDABLE_COUNTS_KEY, compute_buildable_counts, get_buildable_counts
+from .db import retry_on_lock
+from .metrics import (
+    REGISTRY as METRICS_REGISTRY,
+    Counter,
+    Histogram,
+    MetricsStore,
+    render as render_metrics,
+)
+from .catalog_import import CatalogSyncImporter, iter_json_sections
+from .page_cache import CSRF_PLACEHOLDER, get_storefront_version
+from .notifications import RateLimiter, claim_notifications, deliver_notifications
+from .yookassa_stub import start_stub_server
+from .pricing import recalculate_total_prices
+from .search import search_bouquets
+from .signed_state import ORDER_COOKIE, QUIZ_COOKIE, get_salt
+from .stock import OutOfStock, cancel_expired_orders, cancel_orders, place_order
+from .views import filter_bouquets
+from .quiz_index import check_quiz_index, rebuild_quiz_index
+from .request_timing import RequestTiming, enable_query_timing
+from .thumbnails import THUMBNAIL_WIDTHS, generate_derivatives, get_derivative_name
+
+
+def create_bouquet(name, base_price="100.00", **kwargs):
+    return Bouquet.objects.create(
+        name=name,
+        base_price=Decimal(base_price),
+        description="Тестовый букет",
+        image="images/default.jpg",
+        **kwargs,
+    )
+
+
+def complete_quiz(client, event, budget):
+    client.post(reverse("quiz_1"), {"event": event})
+    client.post(reverse("quiz_2"), {"budget": budget})
+
+
+class BouquetTotalPriceTests(TestCase):
+    def setUp(self):
+        self.rose = Component.objects.create(
+            type="flower", name="Роза белая", price=Decimal("150.00")
+        )
+        self.ribbon = Component.objects.create(
+            type="accessory", name="Лента атласная", price=Decimal("50.00")
+        )
+        self.bouquet = create_bouquet("Романтический букет", base_price="500.00")
+
+    def assertTotalPrice(self, expected):
+        self.bouquet.refresh_from_db()
+        self.assertEqual(self.bouquet.total_price, Decimal(expected))
+
+    def test_new_bouquet_total_is_base_price(self):
+        self.assertTotalPrice("500.00")
+
+    def test_composition_changes_update_total(self):
+        item = BouquetComponent.objects.create(
+            bouquet=self.bouquet, component=self.rose, quantity=3
+        )
+        BouquetComponent.objects.create(
+            bouquet=self.bouquet, component=self.ribbon, quantity=1
+        )
+        self.assertTotalPrice("1000.00")
+
+        item.quantity = 5
+        item.save()
+        self.assertTotalPrice("1300.00")
+
+        item.delete()
+        self.assertTotalPrice("550.00")
+
+    def test_component_price_change_updates_total(self):
+        BouquetComponent.objects.create(
+            bouquet=self.bouquet, component=self.rose, quantity=2
+        )
+        self.rose.price = Decimal("200.00")
+        self.rose.save()
+        self.assertTotalPrice("900.00")
+
+    def test_component_delete_updates_total(self):
+        BouquetComponent.objects.create(
+            bouquet=self.bouquet, component=self.rose, quantity=2
+        )
+        self.rose.delete()
+        self.assertTotalPrice("500.00")
+
+    def test_base_price_change_updates_total(self):
+        BouquetComponent.objects.create(
+            bouquet=self.bouquet, component=self.rose, quantity=2
+        )
+        self.bouquet.refresh_from_db()
+        self.bouquet.base_price = Decimal("100.00")
+        self.bouquet.save()
+        self.assertTotalPrice("400.00")
+
+
+class RecalculateTotalPricesTests(TestCase):
+    def setUp(self):
+        self.rose = Component.objects.create(
+            type="flower", name="Роза белая", price=Decimal("150.00")
+        )
+        self.ribbon = Component.objects.create(
+            type="accessory", name="Лента атласная", price=Decimal("50.00")
+        )
+        self.with_rose = create_bouquet("С розами")
+        self.with_ribbon = create_bouquet("С лентой")
+        BouquetComponent.objects.create(
+            bouquet=self.with_rose, component=self.rose, quantity=2
+        )
+        BouquetComponent.objects.create(
+            bouquet=self.with_ribbon, component=self.ribbon, quantity=1
+        )
+        # Цены меняются в обход сигналов, как при массовом обновлении поставщика
+        Component.objects.update(price=Decimal("10.00"))
+
+    def test_dry_run_reports_drift_without_writing(self):
+        drift = recalculate_total_prices(dry_run=True)
+        self.assertEqual(
+            {(item.name, item.actual_price) for item in drift},
+            {("С розами", Decimal("120.00")), ("С лентой", Decimal("110.00"))},
+        )
+        self.with_rose.refresh_from_db()
+        self.assertEqual(self.with_rose.total_price, Decimal("400.00"))
+
+    def test_recalculates_only_bouquets_with_component(self):
+        drift = recalculate_total_prices(components=[self.rose], batch_size=1)
+        self.assertEqual([item.bouquet_id for item in drift], [self.with_rose.pk])
+        self.with_rose.refresh_from_db()
+        self.with_ribbon.refresh_from_db()
+        self.assertEqual(self.with_rose.total_price, Decimal("120.00"))
+        self.assertEqual(self.with_ribbon.total_price, Decimal("150.00"))
+        self.assertEqual(recalculate_total_prices(components=[self.rose]), [])
+
+
+class CatalogQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def add_bouquets(self, count):
+        rose = Component.objects.get_or_create(
+            type="flower", name="Роза белая", price=Decimal("150.00")
+        )[0]
+        start = Bouquet.objects.count()
+        for number in range(start, start + count):
+            bouquet = create_bouquet(f"Букет {number}")
+            BouquetComponent.objects.create(bouquet=bouquet, component=rose)
+
+    def count_catalog_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("catalog"))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_catalog_query_count_does_not_depend_on_catalog_size(self):
+        self.add_bouquets(1)
+        small_catalog = self.count_catalog_queries()
+        self.add_bouquets(10)
+        large_catalog = self.count_catalog_queries()
+        self.assertEqual(small_catalog, large_catalog)
+
+
+class CatalogPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bouquets = [create_bouquet(f"Букет {number}") for number in range(8)]
+
+    def test_catalog_shows_first_page_with_cursor(self):
+        response = self.client.get(reverse("catalog"))
+        shown = [bouquet for row in response.context["rows"] for bouquet in row]
+        self.assertEqual(shown, self.bouquets[:6])
+        self.assertEqual(response.context["next_cursor"], self.bouquets[5].pk)
+
+    def test_load_more_returns_next_page_fragment(self):
+        response = self.client.get(
+            reverse("catalog_more"), {"after": self.bouquets[5].pk}
+        )
+        self.assertContains(response, "Букет 7")
+        self.assertNotContains(response, "Букет 5")
+        self.assertNotIn("X-Next-Cursor", response)
+
+    def test_home_fetches_only_displayed_bouquets(self):
+        response = self.client.get(reverse("home"))
+        self.assertEqual(list(response.context["first_row"]), self.bouquets[:3])
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rose = Component.objects.create(
+            type="flower", name="Роза белая", price=Decimal("150.00"), stock=10
+        )
+        self.bouquet = create_bouquet("Букет", base_price="500.00")
+        BouquetComponent.objects.create(
+            bouquet=self.bouquet, component=self.rose, quantity=2
+        )
+        self.url = reverse("bouquet_detail", args=[self.bouquet.pk])
+
+    def test_repeat_visit_is_served_from_cache_with_own_csrf_token(self):
+        self.client.get(self.url)
+        visitor = self.client_class(enforce_csrf_checks=True)
+        with self.assertNumQueries(0):
+            response = visitor.get(self.url)
+        self.assertContains(response, "800")
+        self.assertNotContains(response, CSRF_PLACEHOLDER)
+        token = response.cookies["csrftoken"].value
+        self.assertEqual(
+            visitor.post(
+                reverse("consultation"),
+                {"fname": "Анна", "tel": "+79001234567", "csrfmiddlewaretoken": token},
+            ).status_code,
+            302,
+        )
+
+    def test_admin_edits_invalidate_cached_pages(self):
+        for url in (self.url, reverse("catalog"), reverse("home")):
+            self.assertContains(self.client.get(url), "800")
+        self.rose.price = Decimal("200.00")
+        self.rose.save()
+        for url in (self.url, reverse("catalog"), reverse("home")):
+            self.assertContains(self.client.get(url), "900")
+
+    def test_bulk_reprice_invalidates_cached_pages(self):
+        self.assertContains(self.client.get(self.url), "800")
+        Component.objects.filter(pk=self.rose.pk).update(price=Decimal("300.00"))
+        recalculate_total_prices()
+        self.assertContains(self.client.get(self.url), "1100")
+
+
+@override_settings(PAGE_CACHE_ENABLED=False)
+class BouquetCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rose = Component.objects.create(
+            type="flower", name="Роза белая", price=Decimal("150.00")
+        )
+        self.bouquet = create_bouquet("Букет", base_price="500.00")
+        self.item = BouquetComponent.objects.create(
+            bouquet=self.bouquet, component=self.rose, quantity=2
+        )
+        self.url = reverse("bouquet_detail", args=[self.bouquet.pk])
+
+    def test_card_is_reused_until_version_changes(self):
+        self.assertContains(self.client.get(reverse("catalog")), "Букет")
+        # Изменение в обход сигналов не меняет версию: карточка берётся из кеша
+        Bouquet.objects.filter(pk=self.bouquet.pk).update(name="Новое имя")
+        self.assertNotContains(self.client.get(reverse("catalog")), "Новое имя")
+        Bouquet.objects.filter(pk=self.bouquet.pk).update_total_prices()
+        self.assertContains(self.client.get(reverse("catalog")), "Новое имя")
+
+    def test_bouquet_and_component_changes_rerender_card(self):
+        self.assertContains(self.client.get(self.url), "Роза белая - 2 шт.")
+        self.rose.name = "Роза красная"
+        self.rose.save(update_fields=["name"])
+        self.assertContains(self.client.get(self.url), "Роза красная - 2 шт.")
+        self.item.quantity = 3
+        self.item.save()
+        self.assertContains(self.client.get(self.url), "950 руб")
+        self.bouquet.description = "Большой"
+        self.bouquet.save()
+        self.assertContains(self.client.get(self.url), "Большой")
+        self.bouquet.name = "Переименованный"
+        self.bouquet.save(update_fields=["name"])
+        self.assertContains(self.client.get(reverse("catalog")), "Переименованный")
+        self.bouquet.base_price = Decimal("600.00")
+        self.bouquet.save(update_fields=["base_price"])
+        self.assertContains(self.client.get(self.url), "1050 руб")
+
+
+class QuizIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.wedding = Event.objects.create(name="Свадьба")
+        self.birthday = Event.objects.create(name="День рождения")
+        self.cheap = PriceRange.objects.create(max_price=Decimal("1000"))
+        self.expensive = PriceRange.objects.create(min_price=Decimal("1000"))
+        self.rose = Component.objects.create(
+            type="flower", name="Роза белая", price=Decimal("150.00")
+        )
+        self.bouquet = create_bouquet("Свадебный", base_price="500.00")
+        self.bouquet.events.add(self.wedding)
+
+    def matched_ids(self, event, price_range):
+        match = QuizMatch.objects.filter(event=event, price_range=price_range).first()
+        return match.bouquet_ids if match else []
+
+    def test_index_follows_catalog_changes(self):
+        self.assertEqual(self.matched_ids(self.wedding, self.cheap), [self.bouquet.pk])
+
+        item = BouquetComponent.objects.create(
+            bouquet=self.bouquet, component=self.rose, quantity=4
+        )
+        self.assertEqual(self.matched_ids(self.wedding, self.cheap), [])
+        self.assertEqual(self.matched_ids(self.wedding, self.expensive), [self.bouquet.pk])
+
+        self.rose.price = Decimal("10.00")
+        self.rose.save()
+        self.assertEqual(self.matched_ids(self.wedding, self.cheap), [self.bouquet.pk])
+
+        self.birthday.bouquets.add(self.bouquet)
+        self.bouquet.events.remove(self.wedding)
+        self.assertEqual(self.matched_ids(self.wedding, self.cheap), [])
+        self.assertEqual(self.matched_ids(self.birthday, self.cheap), [self.bouquet.pk])
+
+        item.delete()
+        self.cheap.max_price = Decimal("100")
+        self.cheap.save()
+        self.assertEqual(check_quiz_index(), [])
+
+        self.bouquet.delete()
+        self.assertEqual(self.matched_ids(self.birthday, self.expensive), [])
+        self.assertEqual(check_quiz_index(), [])
+
+    def test_checker_reports_stale_index(self):
+        QuizMatch.objects.all().delete()
+        self.assertEqual(check_quiz_index(), [(self.wedding.pk, self.cheap.pk)])
+
+    def test_quiz_results_reads_index(self):
+        complete_quiz(self.client, self.wedding.name, self.cheap.name)
+        get_buildable_counts()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("result"))
+        self.assertEqual(response.context["bouquets"], [self.bouquet])
+
+    def test_quiz_results_are_read_in_batches(self):
+        second = create_bouquet("Свадебный второй", base_price="600.00")
+        second.events.add(self.wedding)
+        complete_quiz(self.client, self.wedding.name, self.cheap.name)
+        get_buildable_counts()
+        with mock.patch.object(views, "QUIZ_RESULTS_BATCH_SIZE", 1), self.assertNumQueries(3):
+            response = self.client.get(reverse("result"))
+        self.assertEqual(response.context["bouquets"], [self.bouquet, second])
+
+
+class SignedStateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.wedding = Event.objects.create(name="Свадьба")
+        self.cheap = PriceRange.objects.create(max_price=Decimal("1000"))
+        self.bouquet = create_bouquet("Свадебный", base_price="500.00")
+        self.bouquet.events.add(self.wedding)
+
+    def test_quiz_does_not_write_to_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("quiz_1"))
+            complete_quiz(self.client, self.wedding.name, self.cheap.name)
+            response = self.client.get(reverse("result"))
+        self.assertEqual(response.context["bouquets"], [self.bouquet])
+        writes = [query["sql"] for query in queries if not query["sql"].startswith("SELECT")]
+        self.assertEqual(writes, [])
+        self.assertFalse(Session.objects.exists())
+
+    def test_tampered_quiz_cookie_is_ignored(self):
+        complete_quiz(self.client, self.wedding.name, self.cheap.name)
+        self.client.cookies[QUIZ_COOKIE] = self.client.cookies[QUIZ_COOKIE].value + "x"
+        response = self.client.get(reverse("result"))
+        self.assertIsNone(response.context["event"])
+
+    def test_payment_requires_signed_order(self):
+        order = Order.objects.create(customer_name="Иван", bouquet=self.bouquet)
+        self.client.cookies[ORDER_COOKIE] = f'{{"order_id": {order.pk}}}'
+        self.assertEqual(self.client.get(reverse("payment")).status_code, 404)
+
+
+class FakeBot:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.messages = []
+
+    def send_message(self, chat_id, text):
+        if self.fail:
+            raise telegram.error.NetworkError("Telegram недоступен")
+        self.messages.append(text)
+
+
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        self.rate_limiter = RateLimiter(interval=0)
+
+    def deliver(self, bot):
+        return deliver_notifications(bot, "chat", rate_limiter=self.rate_limiter)
+
+    def test_order_and_consultation_are_queued_not_sent(self):
+        Order.objects.create(customer_name="Иван", customer_phone="+79990000000")
+        Consultation.objects.create(name="Мария", phone="+79990000001")
+        self.assertEqual(Notification.objects.filter(status="pending").count(), 2)
+
+    def test_burst_is_sent_as_one_message(self):
+        for number in range(5):
+            Order.objects.create(customer_name=f"Клиент {number}")
+        bot = FakeBot()
+        self.assertEqual(self.deliver(bot), (5, 0))
+        self.assertEqual(len(bot.messages), 1)
+        self.assertIn("Клиент 4", bot.messages[0])
+        self.assertFalse(Notification.objects.exclude(status="sent").exists())
+        self.assertEqual(self.deliver(bot), (0, 0))
+
+    def test_failed_send_is_retried_later(self):
+        Order.objects.create(customer_name="Иван")
+        self.assertEqual(self.deliver(FakeBot(fail=True)), (0, 1))
+        notification = Notification.objects.get()
+        self.assertEqual(notification.status, "pending")
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreater(notification.next_attempt_at, notification.created_at)
+        # До истечения задержки повторной отправки нет
+        self.assertEqual(self.deliver(FakeBot()), (0, 0))
+
+        Notification.objects.update(next_attempt_at=notification.created_at)
+        bot = FakeBot()
+        self.assertEqual(self.deliver(bot), (1, 0))
+        self.assertEqual(len(bot.messages), 1)
+
+    def test_claimed_notifications_are_not_sent_twice(self):
+        Order.objects.create(customer_name="Иван")
+        claimed = claim_notifications()
+        self.assertEqual(len(claimed), 1)
+        # Второй воркер, запущенный одновременно, пачку не получает
+        bot = FakeBot()
+        self.assertEqual(self.deliver(bot), (0, 0))
+        self.assertEqual(bot.messages, [])
+
+    def test_rate_limit_returns_unsent_claim_to_queue(self):
+        for letter in "ab":
+            Notification.objects.create(text=letter * 3000)
+
+        class RateLimitedBot:
+            def send_message(self, chat_id, text):
+                raise telegram.error.RetryAfter(30)
+
+        self.assertEqual(self.deliver(RateLimitedBot()), (0, 1))
+        self.assertEqual(
+            sorted(Notification.objects.values_list("status", "attempts")),
+            [("pending", 0), ("pending", 1)],
+        )
+        self.assertFalse(
+            Notification.objects.filter(next_attempt_at__lte=timezone.now()).exists()
+        )
+
+    def test_abandoned_claim_is_picked_up_later(self):
+        Order.objects.create(customer_name="Иван")
+        claim_notifications()
+        Notification.objects.update(next_attempt_at=timezone.now())
+        bot = FakeBot()
+        self.assertEqual(self.deliver(bot), (1, 0))
+        self.assertEqual(Notification.objects.get().status, "sent")
+
+
+class PaymentTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_stub_server()
+        cls.settings_override = override_settings(YOOKASSA_API_URL=cls.server.api_url)
+        cls.settings_override.enable()
+        payments._client = None
+
+    @classmethod
+    def tearDownClass(cls):
+        payments._client = None
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.payments.clear()
+        self.server.payments_by_key.clear()
+        self.bouquet = create_bouquet("Романтический букет", base_price="1500.00")
+
+    def test_order_redirects_to_payment_confirmation(self):
+        response = self.client.post(
+            reverse("create_order"),
+            {
+                "fname": "Иван",
+                "tel": "+79990000000",
+                "adres": "ул. Пушкинская, 69",
+                "orderTime": "Как можно скорее",
+                "bouquet_id": self.bouquet.pk,
+            },
+        )
+        self.assertRedirects(response, reverse("payment"), fetch_redirect_response=False)
+        response = self.client.get(reverse("payment"))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(f"{self.server.api_url}/checkout/"))
+        payment = self.server.payments[response.url.rsplit("/", 1)[-1]]
+        self.assertEqual(payment["amount"], {"value": "1500.00", "currency": "RUB"})
+
+    def test_retry_with_same_key_does_not_create_second_payment(self):
+        order = Order.objects.create(customer_name="Иван", bouquet=self.bouquet)
+        params = {
+            "amount": {"value": "1500.00", "currency": "RUB"},
+            "capture": True,
+            "confirmation": {"type": "redirect", "return_url": "http://testserver/"},
+        }
+        client = payments.get_payment_client()
+        first = client.create_payment(params, payments.get_idempotency_key(order))
+        second = client.create_payment(params, payments.get_idempotency_key(order))
+        self.assertEqual(first.id, second.id)
+
+    def test_non_json_error_becomes_api_error(self):
+        response = requests.Response()
+        response.status_code = 502
+        response._content = b"<html><body>502 Bad Gateway</body></html>"
+        with self.assertRaises(ApiError) as context:
+            payments.raise_api_error(response)
+        self.assertEqual(context.exception.content["code"], "502")
+        self.assertIn("Bad Gateway", context.exception.content["description"])
+
+    def create_paid_order(self):
+        order = Order.objects.create(customer_name="Иван", bouquet=self.bouquet)
+        payment = payments.get_payment_client().create_payment(
+            {"amount": {"value": "1500.00", "currency": "RUB"}},
+            payments.get_idempotency_key(order),
+        )
+        order.payment_id = payment.id
+        order.save()
+        return order
+
+    def post_webhook(self, event, payment_id):
+        return self.client.post(
+            reverse("payment_webhook"),
+            data=json.dumps(
+                {"type": "notification", "event": event, "object": {"id": payment_id}}
+            ),
+            content_type="application/json",
+        )
+
+    def test_webhook_marks_order_paid_once(self):
+        order = self.create_paid_order()
+        self.server.payments[order.payment_id]["status"] = "succeeded"
+        for _ in range(3):
+            response = self.post_webhook("payment.succeeded", order.payment_id)
+            self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual(order.status, "paid")
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+
+    def test_canceled_payment_releases_reserved_stock(self):
+        rose = Component.objects.create(name="Роза", type="flower", price=100, stock=5)
+        BouquetComponent.objects.create(bouquet=self.bouquet, component=rose, quantity=3)
+        order = place_order(self.bouquet, customer_name="Иван", payment_id="payment-1")
+        self.server.payments["payment-1"] = {"id": "payment-1", "status": "canceled"}
+        for _ in range(2):
+            self.assertEqual(self.post_webhook("payment.canceled", "payment-1").status_code, 200)
+        order.refresh_from_db()
+        rose.refresh_from_db()
+        self.assertEqual(order.status, "canceled")
+        self.assertEqual(rose.stock, 5)
+
+    def test_canceled_order_is_not_sent_to_payment(self):
+        self.client.post(
+            reverse("create_order"),
+            {
+                "fname": "Иван",
+                "tel": "+79990000000",
+                "adres": "ул. Пушкинская, 69",
+                "orderTime": "Как можно скорее",
+                "bouquet_id": self.bouquet.pk,
+            },
+        )
+        cancel_orders(Order.objects.all())
+        self.assertEqual(self.client.get(reverse("payment")).status_code, 404)
+        self.assertFalse(self.server.payments)
+
+    def test_payment_for_canceled_order_is_flagged(self):
+        order = self.create_paid_order()
+        cancel_orders(Order.objects.all())
+        self.server.payments[order.payment_id]["status"] = "succeeded"
+        with self.assertLogs("backend.views", "ERROR") as logs:
+            self.post_webhook("payment.succeeded", order.payment_id)
+        self.assertIn(order.payment_id, logs.output[0])
+        order.refresh_from_db()
+        self.assertEqual(order.status, "canceled")
+
+    def test_webhook_rejects_status_not_confirmed_by_provider(self):
+        order = self.create_paid_order()
+        response = self.post_webhook("payment.succeeded", order.payment_id)
+        self.assertEqual(response.status_code, 400)
+        order.refresh_from_db()
+        self.assertEqual(order.status, "pending")
+
+
+class ConcurrentPaymentTests(TransactionTestCase):
+    CLIENTS = 8
+    LATENCY = 0.3
+
+    def setUp(self):
+        self.server = start_stub_server(latency=self.LATENCY)
+        self.settings_override = override_settings(YOOKASSA_API_URL=self.server.api_url)
+        self.settings_override.enable()
+        payments._client = None
+
+    def tearDown(self):
+        payments._client = None
+        self.settings_override.disable()
+        self.server.shutdown()
+
+    def test_payments_are_created_concurrently(self):
+        bouquet = create_bouquet("Весенний")
+        orders = [place_order(bouquet, customer_name="Иван") for _ in range(self.CLIENTS)]
+
+        async def pay(order):
+            client = AsyncClient()
+            client.cookies[ORDER_COOKIE] = signing.dumps(
+                {"order_id": order.pk}, salt=get_salt(ORDER_COOKIE), compress=True
+            )
+            return await client.get(reverse("payment"))
+
+        async def pay_all():
+            return await asyncio.gather(*(pay(order) for order in orders))
+
+        started = time.perf_counter()
+        responses = asyncio.run(pay_all())
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual([response.status_code for response in responses], [302] * self.CLIENTS)
+        self.assertEqual(len(self.server.payments), self.CLIENTS)
+        # Последовательная обработка заняла бы не меньше CLIENTS * LATENCY
+        self.assertLess(elapsed, self.CLIENTS * self.LATENCY / 2)
+
+
+class OrderStatusTests(TestCase):
+    def test_orders_move_only_along_allowed_transitions(self):
+        order = Order.objects.create(customer_name="Иван")
+        orders = Order.objects.filter(pk=order.pk)
+        self.assertEqual(orders.move_to("assembled"), 0)
+        self.assertEqual(orders.move_to("paid"), 1)
+        self.assertEqual(orders.move_to("canceled"), 0)
+        self.assertEqual(orders.move_to("assembled"), 1)
+        self.assertEqual(orders.move_to("delivered"), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.status, "delivered")
+
+
+class MigrationTests(TransactionTestCase):
+    def migrate(self, target):
+        """Переводит схему backend на миграцию target и возвращает её модели"""
+        executor = MigrationExecutor(connection)
+        executor.migrate([("backend", target)])
+        executor.loader.build_graph()
+        return executor.loader.project_state([("backend", target)]).apps
+
+    def tearDown(self):
+        call_command("migrate", verbosity=0)
+
+    def test_quiz_index_is_built_for_existing_bouquets(self):
+        apps = self.migrate("0002_consultation_customer_event_pricerange_and_more")
+        event = apps.get_model("backend", "Event").objects.create(name="День рождения")
+        cheap = apps.get_model("backend", "PriceRange").objects.create(
+            name="До 1000 руб.", max_price=1000
+        )
+        apps.get_model("backend", "PriceRange").objects.create(name="От 5000 руб.", min_price=5000)
+        bouquet = apps.get_model("backend", "Bouquet").objects.create(
+            name="Весенний", description="", total_price=800
+        )
+        bouquet.events.add(event)
+        call_command("migrate", verbosity=0)
+        self.assertEqual(
+            list(QuizMatch.objects.values_list("event_id", "price_range_id", "bouquet_ids")),
+            [(event.pk, cheap.pk, [bouquet.pk])],
+        )
+
+    def test_orders_placed_before_statuses_are_not_expired(self):
+        apps = self.migrate("0004_notification")
+        order = apps.get_model("backend", "Order").objects.create(customer_name="Иван")
+        call_command("migrate", verbosity=0)
+        cancel_expired_orders(now=timezone.now() + timedelta(days=1))
+        self.assertEqual(Order.objects.get(pk=order.pk).status, "delivered")
+
+
+class SQLiteSettingsTests(TransactionTestCase):
+    def test_connection_uses_wal_and_immediate_transactions(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertGreater(cursor.fetchone()[0], 0)
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+
+    def test_retry_on_lock_repeats_short_transactions(self):
+        calls = []
+
+        @retry_on_lock(delay=0)
+        def write():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError("database is locked")
+            return "ok"
+
+        self.assertEqual(write(), "ok")
+        self.assertEqual(len(calls), 3)
+
+    def test_retry_on_lock_does_not_repeat_inside_outer_transaction(self):
+        calls = []
+
+        @retry_on_lock(delay=0)
+        def write():
+            calls.append(1)
+            raise OperationalError("database is locked")
+
+        with self.assertRaises(OperationalError), transaction.atomic():
+            write()
+        self.assertEqual(len(calls), 1)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.bouquet = create_bouquet("Весенний")
+        self.rose = Component.objects.create(name="Роза", type="flower", price=100, stock=5)
+        self.ribbon = Component.objects.create(
+            name="Лента", type="accessory", price=10, stock=1
+        )
+        BouquetComponent.objects.create(bouquet=self.bouquet, component=self.rose, quantity=3)
+        BouquetComponent.objects.create(bouquet=self.bouquet, component=self.ribbon, quantity=1)
+
+    def assertStock(self, rose, ribbon):
+        self.rose.refresh_from_db()
+        self.ribbon.refresh_from_db()
+        self.assertEqual((self.rose.stock, self.ribbon.stock), (rose, ribbon))
+
+    def test_order_reserves_components(self):
+        order = place_order(self.bouquet, customer_name="Иван")
+        self.assertStock(2, 0)
+        self.assertEqual(order.reservations.count(), 2)
+
+    def test_shortage_rolls_back_the_whole_order(self):
+        place_order(self.bouquet, customer_name="Иван")
+        with self.assertRaises(OutOfStock) as context:
+            place_order(self.bouquet, customer_name="Пётр")
+        self.assertEqual(context.exception.components, ["Роза", "Лента"])
+        self.assertStock(2, 0)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_order_form_reports_shortage(self):
+        self.rose.stock = 2
+        self.rose.save()
+        response = self.client.post(
+            reverse("create_order"),
+            {
+                "fname": "Иван",
+                "tel": "+79990000000",
+                "adres": "ул. Пушкинская, 69",
+                "orderTime": "Как можно скорее",
+                "bouquet_id": self.bouquet.pk,
+            },
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertContains(response, "Сейчас не хватает: Роза", status_code=409)
+        self.assertFalse(Order.objects.exists())
+
+    def test_cancel_releases_stock_once(self):
+        order = place_order(self.bouquet, customer_name="Иван")
+        orders = Order.objects.filter(pk=order.pk)
+        self.assertEqual(cancel_orders(orders), 1)
+        self.assertEqual(cancel_orders(orders), 0)
+        self.assertStock(5, 1)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_delivered_orders_are_not_canceled(self):
+        order = place_order(self.bouquet, customer_name="Иван")
+        Order.objects.filter(pk=order.pk).move_to("paid")
+        self.assertEqual(cancel_orders(Order.objects.all()), 0)
+        self.assertStock(2, 0)
+
+    @override_settings(ORDER_PAYMENT_TIMEOUT=60)
+    def test_unpaid_orders_expire(self):
+        order = place_order(self.bouquet, customer_name="Иван")
+        self.assertEqual(cancel_expired_orders(), 0)
+        self.assertEqual(
+            cancel_expired_orders(now=order.created_at + timedelta(seconds=61)), 1
+        )
+        self.assertStock(5, 1)
+
+    @override_settings(ORDER_PAYMENT_TIMEOUT=60)
+    def test_orders_with_started_payment_wait_for_provider(self):
+        order = place_order(self.bouquet, customer_name="Иван", payment_id="payment-1")
+        self.assertEqual(
+            cancel_expired_orders(now=order.created_at + timedelta(seconds=61)), 0
+        )
+        self.assertStock(2, 0)
+
+
+class BuildableCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rose = Component.objects.create(name="Роза", type="flower", price=100, stock=7)
+        self.ribbon = Component.objects.create(
+            name="Лента", type="accessory", price=10, stock=5
+        )
+        self.bouquet = create_bouquet("Весенний")
+        BouquetComponent.objects.create(bouquet=self.bouquet, component=self.rose, quantity=3)
+        BouquetComponent.objects.create(bouquet=self.bouquet, component=self.ribbon, quantity=1)
+        self.sold_out = create_bouquet("Летний")
+        BouquetComponent.objects.create(bouquet=self.sold_out, component=self.rose, quantity=8)
+        self.without_composition = create_bouquet("Осенний")
+
+    def test_counts_whole_catalog_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = compute_buildable_counts()
+        self.assertEqual(counts, {self.bouquet.pk: 2, self.sold_out.pk: 0})
+
+    def test_counts_are_cached(self):
+        get_buildable_counts()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_buildable_counts()[self.bouquet.pk], 2)
+
+    def test_stock_changes_refresh_counts_after_commit(self):
+        get_buildable_counts()
+        version = get_storefront_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.bouquet, customer_name="Иван")
+        self.assertEqual(get_buildable_counts()[self.bouquet.pk], 1)
+        # Ни один букет не закончился: витрина не сбрасывается
+        self.assertEqual(get_storefront_version(), version)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.bouquet, customer_name="Пётр")
+        self.assertEqual(get_buildable_counts()[self.bouquet.pk], 0)
+        self.assertNotEqual(get_storefront_version(), version)
+
+    def test_order_recounts_only_affected_bouquets(self):
+        tulip = Component.objects.create(name="Тюльпан", type="flower", price=50, stock=1)
+        other = create_bouquet("Зимний")
+        BouquetComponent.objects.create(bouquet=other, component=tulip, quantity=1)
+        # Метка в кеше: букет без общих элементов с заказом не пересчитывается
+        cache.set(BUILDABLE_COUNTS_KEY, {**compute_buildable_counts(), other.pk: 99})
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.bouquet, customer_name="Иван")
+        counts = get_buildable_counts()
+        self.assertEqual(counts[self.bouquet.pk], 1)
+        self.assertEqual(counts[self.sold_out.pk], 0)
+        self.assertEqual(counts[other.pk], 99)
+
+    def test_component_restock_refreshes_counts(self):
+        get_buildable_counts()
+        self.rose.stock = 8
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rose.save()
+        self.assertEqual(cache.get(BUILDABLE_COUNTS_KEY)[self.sold_out.pk], 1)
+
+    def test_catalog_flags_sold_out_bouquets(self):
+        response = self.client.get(reverse("catalog"))
+        available = {
+            bouquet.name: bouquet.is_available
+            for row in response.context["rows"]
+            for bouquet in row
+        }
+        self.assertEqual(available, {"Весенний": True, "Летний": False, "Осенний": True})
+        self.assertContains(response, "Нет в наличии", count=1)
+
+    def test_search_flags_sold_out_bouquets(self):
+        response = self.client.get(reverse("search"), {"q": "Летний"})
+        self.assertContains(response, "Нет в наличии", count=1)
+
+    def test_quiz_hides_sold_out_bouquets(self):
+        wedding = Event.objects.create(name="Свадьба")
+        for bouquet in (self.bouquet, self.sold_out):
+            bouquet.events.add(wedding)
+        PriceRange.objects.create(max_price=Decimal("100000"))
+        complete_quiz(self.client, "Свадьба", PriceRange.objects.get().name)
+        response = self.client.get(reverse("result"))
+        self.assertEqual(response.context["bouquets"], [self.bouquet])
+
+    def test_admin_shows_buildable_counts(self):
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "password")
+        )
+        response = self.client.get(reverse("admin:backend_bouquet_changelist"))
+        buildable = {
+            bouquet.name: bouquet.buildable
+            for bouquet in response.context["cl"].result_list
+        }
+        self.assertEqual(buildable, {"Весенний": 2, "Летний": 0, "Осенний": None})
+
+
+class ConcurrentStockReservationTests(TransactionTestCase):
+    THREADS = 8
+    ORDERS_PER_THREAD = 5
+    STOCK = 12
+
+    def test_parallel_orders_never_oversell(self):
+        bouquet = create_bouquet("Весенний")
+        rose = Component.objects.create(
+            name="Роза", type="flower", price=100, stock=self.STOCK
+        )
+        BouquetComponent.objects.create(bouquet=bouquet, component=rose, quantity=2)
+        results = []
+        errors = []
+
+        def checkout():
+            try:
+                for _ in range(self.ORDERS_PER_THREAD):
+                    try:
+                        place_order(bouquet, customer_name="Иван")
+                        results.append(True)
+                    except OutOfStock:
+                        results.append(False)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=checkout) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        rose.refresh_from_db()
+        self.assertEqual(results.count(True), self.STOCK // 2)
+        self.assertEqual(rose.stock, 0)
+        self.assertEqual(Order.objects.count(), self.STOCK // 2)
+        self.assertEqual(StockReservation.objects.count(), self.STOCK // 2)
+
+        cancel_orders(Order.objects.all())
+        rose.refresh_from_db()
+        self.assertEqual(rose.stock, self.STOCK)
+
+
+CATALOG = {
+    "components": [
+        {"type": "flower", "name": "Роза белая", "price": 150.00, "stock": 25},
+        {"type": "accessory", "name": "Лента атласная", "price": "50.00"},
+    ],
+    "bouquets": [
+        {
+            "name": "Романтический букет",
+            "base_price": 500.00,
+            "description": "Букет для романтического вечера",
+            "events": ["Свадьба", "Юбилей"],
+            "components": [
+                {"name": "Роза белая", "quantity": 25},
+                {"name": "Лента атласная", "quantity": 1},
+                {"name": "Упаковка полиэтилен", "quantity": 10},
+            ],
+        },
+    ],
+    "prices": [{"min_price": 10, "max_price": 5000}],
+}
+
+
+class UploadDataTests(TestCase):
+    def upload(self, catalog, **options):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", encoding="utf-8") as json_file:
+            json.dump(catalog, json_file, ensure_ascii=False)
+            json_file.flush()
+            call_command(
+                "upload_data", json_file.name, media_root="", stdout=io.StringIO(), **options
+            )
+
+    def test_bulk_mode_matches_row_by_row_import(self):
+        self.upload(CATALOG, bulk=True)
+        bouquet = Bouquet.objects.get(name="Романтический букет")
+        self.assertEqual(bouquet.total_price, Decimal("4300.00"))
+        self.assertEqual(
+            sorted(bouquet.events.values_list("name", flat=True)), ["Свадьба", "Юбилей"]
+        )
+        self.assertEqual(PriceRange.objects.get().name, "От 10 до 5000 руб.")
+        self.assertEqual(check_quiz_index(), [])
+        self.assertEqual(search_bouquets("юбилей белых роз"), [bouquet])
+
+    def test_bulk_mode_is_idempotent_and_updates_quantities(self):
+        self.upload(CATALOG, bulk=True)
+        catalog = json.loads(json.dumps(CATALOG))
+        catalog["bouquets"][0]["components"][0]["quantity"] = 5
+        self.upload(catalog, bulk=True, batch_size=1)
+        self.assertEqual(Component.objects.count(), 2)
+        self.assertEqual(BouquetComponent.objects.count(), 2)
+        self.assertEqual(
+            Bouquet.objects.get().total_price, Decimal("1300.00")
+        )
+
+    def test_bulk_mode_waits_for_components_listed_after_bouquets(self):
+        catalog = {
+            "bouquets": CATALOG["bouquets"] * 3,
+            "components": CATALOG["components"],
+            "prices": CATALOG["prices"],
+        }
+        self.upload(catalog, bulk=True, batch_size=1)
+        self.assertEqual(BouquetComponent.objects.count(), 2)
+        self.assertEqual(Bouquet.objects.get().total_price, Decimal("4300.00"))
+
+    def test_sync_updates_only_changed_records(self):
+        catalog = json.loads(json.dumps(CATALOG))
+        catalog["bouquets"].append(
+            {
+                "name": "Простой букет",
+                "base_price": "300.00",
+                "description": "Без роз",
+                "events": ["Юбилей"],
+                "components": [{"name": "Лента атласная", "quantity": 2}],
+            }
+        )
+        self.upload(catalog, sync=True)
+        simple = Bouquet.objects.get(name="Простой букет")
+        self.assertEqual(simple.total_price, Decimal("400.00"))
+
+        catalog["components"][0]["price"] = "100.00"
+        catalog["components"][0]["stock"] = 3
+        catalog["bouquets"][0]["events"] = ["Свадьба"]
+        catalog["bouquets"][0]["components"].pop(1)
+        with tempfile.NamedTemporaryFile("w", suffix=".json", encoding="utf-8") as json_file:
+            json.dump(catalog, json_file, ensure_ascii=False)
+            json_file.flush()
+            stats = CatalogSyncImporter().run(json_file.name)
+        self.assertEqual((stats["updated_components"], stats["updated_bouquets"]), (1, 1))
+        self.assertEqual(stats["bouquets"], 0)
+
+        rose = Component.objects.get(name="Роза белая")
+        self.assertEqual((rose.price, rose.stock), (Decimal("100.00"), 3))
+        romantic = Bouquet.objects.get(name="Романтический букет")
+        self.assertEqual(romantic.total_price, Decimal("3000.00"))
+        self.assertEqual(list(romantic.events.values_list("name", flat=True)), ["Свадьба"])
+        self.assertEqual(check_quiz_index(), [])
+
+    def test_sync_deletes_vanished_records(self):
+        self.upload(CATALOG, sync=True)
+        catalog = json.loads(json.dumps(CATALOG))
+        catalog["components"].pop(1)
+        self.upload(catalog, sync=True, delete_missing=True)
+        self.assertFalse(Component.objects.filter(name="Лента атласная").exists())
+        self.assertEqual(Bouquet.objects.get().total_price, Decimal("4250.00"))
+
+
+class GenerateDataTests(TestCase):
+    def generate(self, **options):
+        call_command(
+            "generate_data",
+            components=20,
+            bouquets=30,
+            customers=50,
+            orders=300,
+            consultations=40,
+            days=30,
+            stdout=io.StringIO(),
+            **options,
+        )
+        return list(
+            Order.objects.order_by("pk").values_list(
+                "customer_phone", "bouquet__name", "status", "created_at__date"
+            )
+        )
+
+    def test_generates_requested_volumes(self):
+        self.generate()
+        self.assertEqual(Component.objects.count(), 20)
+        self.assertEqual(Bouquet.objects.count(), 30)
+        self.assertEqual(Order.objects.count(), 300)
+        self.assertEqual(Consultation.objects.count(), 40)
+        self.assertEqual(PriceRange.objects.count(), 4)
+        self.assertFalse(Bouquet.objects.filter(components__isnull=True).exists())
+        self.assertFalse(Bouquet.objects.filter(total_price=0).exists())
+        first, last = Order.objects.order_by("created_at")[::299]
+        self.assertGreaterEqual((last.created_at - first.created_at).days, 29)
+
+    def test_same_seed_gives_same_data(self):
+        first = self.generate()
+        self.assertEqual(self.generate(flush=True), first)
+        self.assertNotEqual(self.generate(flush=True, seed=1), first)
+
+    def test_refuses_to_mix_with_existing_catalog(self):
+        create_bouquet("Букет")
+        with self.assertRaises(CommandError):
+            self.generate()
+
+
+class JsonStreamTests(TestCase):
+    def test_reads_sections_across_chunk_boundaries(self):
+        text = json.dumps(
+            {"version": 2, "prices": [{"min_price": 12345}], "components": [{"a": [1, 2]}, {}]}
+        )
+        items = list(iter_json_sections(io.StringIO(text), chunk_size=3))
+        self.assertEqual(
+            items,
+            [("prices", {"min_price": 12345}), ("components", {"a": [1, 2]}), ("components", {})],
+        )
+
+
+def make_jpeg(color, size=(1000, 500)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class ContentAddressedMediaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        (self.media_root / "images").mkdir()
+        (self.media_root / "images/default.jpg").write_bytes(b"default image")
+
+    def stored_files(self):
+        return sorted(
+            path.relative_to(self.media_root).as_posix()
+            for path in self.media_root.rglob("*")
+            if path.is_file() and path.parent.name != "images"
+        )
+
+    def test_identical_images_are_stored_once(self):
+        catalog = {
+            "bouquets": [
+                {
+                    "name": f"Букет {number}",
+                    "base_price": "100",
+                    "description": "",
+                    "image": f"missing-{number}.jpg",
+                }
+                for number in range(3)
+            ]
+        }
+        with tempfile.NamedTemporaryFile("w", suffix=".json", encoding="utf-8") as json_file:
+            json.dump(catalog, json_file, ensure_ascii=False)
+            json_file.flush()
+            for bulk in (True, False, True):
+                call_command(
+                    "upload_data",
+                    json_file.name,
+                    media_root=str(self.media_root),
+                    bulk=bulk,
+                    stdout=io.StringIO(),
+                )
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(
+            set(Bouquet.objects.values_list("image", flat=True)), set(self.stored_files())
+        )
+
+    def test_cleanup_removes_only_orphaned_files(self):
+        bouquet = create_bouquet("Букет")
+        bouquet.image.save("photo.jpg", ContentFile(b"photo"))
+        orphan = bouquet.image.storage.save("old.jpg", ContentFile(b"old photo"))
+        call_command("cleanup_media", stdout=io.StringIO())
+        self.assertEqual(self.stored_files(), [bouquet.image.name])
+        self.assertTrue((self.media_root / "images/default.jpg").exists())
+        self.assertNotIn(orphan, self.stored_files())
+
+    def test_saving_image_creates_thumbnails(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (1000, 500), "red").save(buffer, "JPEG")
+        bouquet = create_bouquet("Букет")
+        bouquet.image.save("photo.jpg", ContentFile(buffer.getvalue()))
+
+        storage = bouquet.image.storage
+        for width in THUMBNAIL_WIDTHS:
+            for image_format in ("WEBP", "JPEG"):
+                name = get_derivative_name(bouquet.image.name, width, image_format)
+                with storage.open(name) as thumbnail:
+                    self.assertEqual(Image.open(thumbnail).size, (width, width // 2))
+
+        response = self.client.get(reverse("bouquet_detail", args=[bouquet.pk]))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(
+            response, get_derivative_name(bouquet.image.name, 400, "WEBP")
+        )
+        # Копии остаются при очистке хранилища вместе с оригиналом
+        call_command("cleanup_media", stdout=io.StringIO())
+        self.assertEqual(len(self.stored_files()), 1 + 2 * len(THUMBNAIL_WIDTHS))
+
+    def test_force_regenerates_thumbnails(self):
+        name = storage.get_image_storage().save("photo.jpg", ContentFile(make_jpeg("red")))
+        generate_derivatives(name)
+        thumbnail = self.media_root / get_derivative_name(name, 200, "JPEG")
+        red = thumbnail.read_bytes()
+
+        (self.media_root / name).write_bytes(make_jpeg("blue"))
+        self.assertEqual(generate_derivatives(name), 0)
+        self.assertEqual(thumbnail.read_bytes(), red)
+        self.assertEqual(generate_derivatives(name, force=True), 2 * len(THUMBNAIL_WIDTHS))
+        self.assertNotEqual(thumbnail.read_bytes(), red)
+        self.assertEqual(len(self.stored_files()), 1 + 2 * len(THUMBNAIL_WIDTHS))
+
+
+@override_settings(
+    REQUEST_TIMING_SAMPLE_RATE=1, PAGE_CACHE_ENABLED=False, INTERNAL_IPS=["127.0.0.1"]
+)
+class RequestTimingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # AsyncClient загружает middleware в потоке event loop, а соединение
+        # теста открыто раньше и сигнал connection_created уже не получит
+        enable_query_timing()
+        for number in range(3):
+            create_bouquet(f"Букет {number}")
+
+    def test_server_timing_reports_queries(self):
+        client = self.client_class()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse("catalog"))
+        timing = response["Server-Timing"]
+        self.assertIn(f'desc="SQL x {len(queries)}"', timing)
+        for metric in ("db;dur=", "tpl;dur=", "view;dur=", "total;dur="):
+            self.assertIn(metric, timing)
+
+    @override_settings(INTERNAL_IPS=[], SLOW_REQUEST_THRESHOLD=0)
+    def test_visitors_do_not_see_timing(self):
+        client = self.client_class()
+        with self.assertLogs("backend.middleware", "WARNING"):
+            response = client.get(reverse("catalog"))
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(INTERNAL_IPS=[])
+    def test_staff_see_timing(self):
+        client = self.client_class()
+        client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        response = client.get(reverse("admin:backend_bouquet_changelist"))
+        self.assertIn("Server-Timing", response)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_requests_are_logged_with_their_sql(self):
+        client = self.client_class()
+        with self.assertLogs("backend.middleware", "WARNING") as logs:
+            client.get(reverse("bouquet_detail", args=[Bouquet.objects.first().pk]))
+        self.assertIn("Медленный запрос GET /bouquet/", logs.output[0])
+        self.assertIn("медленный SQL", logs.output[0])
+
+    def test_repeated_queries_are_detected(self):
+        timing = RequestTiming()
+        for _ in range(5):
+            timing.add_query('SELECT * FROM "backend_component" WHERE id = %s', 0.001)
+        timing.add_query('SELECT * FROM "backend_bouquet"', 0.01)
+        repeated = timing.get_repeated(threshold=5)
+        self.assertEqual(len(repeated), 1)
+        self.assertEqual(repeated[0][1], 5)
+        self.assertEqual(timing.get_slowest(1)[0][0], 'SELECT * FROM "backend_bouquet"')
+
+    @override_settings(INTERNAL_IPS=[])
+    async def test_async_requests_are_timed(self):
+        user = await sync_to_async(User.objects.create_superuser)(
+            "admin", "admin@example.com", "password"
+        )
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.get(reverse("catalog"))
+        match = re.search(r'desc="SQL x (\d+)"', response["Server-Timing"])
+        self.assertGreater(int(match.group(1)), 0)
+
+        await self.async_client.alogout()
+        self.assertNotIn("Server-Timing", await self.async_client.get(reverse("catalog")))
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=0)
+    def test_disabled_without_sampling(self):
+        self.assertNotIn("Server-Timing", self.client_class().get(reverse("catalog")))
+
+
+def get_sample(text, sample):
+    """Значение строки метрики из вывода /metrics; None, если строки нет"""
+    match = re.search(rf"^{re.escape(sample)} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def increment_in_process(path, times):
+    counter = Counter("flowershop_test_total", "Тестовый счётчик")
+    with override_settings(METRICS_DB_PATH=path):
+        for _ in range(times):
+            counter.inc()
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.metrics_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.metrics_dir)
+        self.path = str(self.metrics_dir / "metrics.sqlite3")
+        self.settings_override = override_settings(
+            METRICS_DB_PATH=self.path, METRICS_TOKEN="secret"
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def get_metrics(self, token="secret"):
+        return self.client.get(reverse("metrics"), HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_counter_and_histogram_exposition(self):
+        counter = Counter("flowershop_test_total", "Тестовый счётчик", ["kind"])
+        histogram = Histogram("flowershop_test_seconds", "Тестовое время", buckets=(0.1, 1))
+        for name in (counter.name, histogram.name):
+            self.addCleanup(METRICS_REGISTRY.pop, name)
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        text = render_metrics()
+        self.assertIn("# TYPE flowershop_test_total counter", text)
+        self.assertEqual(get_sample(text, 'flowershop_test_total{kind="a"}'), 3)
+        self.assertEqual(get_sample(text, 'flowershop_test_seconds_bucket{le="0.1"}'), 1)
+        self.assertEqual(get_sample(text, 'flowershop_test_seconds_bucket{le="1"}'), 2)
+        self.assertEqual(get_sample(text, 'flowershop_test_seconds_bucket{le="+Inf"}'), 2)
+        self.assertEqual(get_sample(text, "flowershop_test_seconds_count"), 2)
+        self.assertAlmostEqual(get_sample(text, "flowershop_test_seconds_sum"), 0.55)
+        with self.assertRaises(ValueError):
+            counter.inc()
+
+    def test_processes_share_counters(self):
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(target=increment_in_process, args=(self.path, 20)) for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        self.assertEqual(MetricsStore(self.path).read(), [("flowershop_test_total", "", 80.0)])
+
+    def test_order_and_quiz_views_are_counted(self):
+        bouquet = create_bouquet("Весенний")
+        rose = Component.objects.create(name="Роза", type="flower", price=100, stock=3)
+        BouquetComponent.objects.create(bouquet=bouquet, component=rose, quantity=3)
+        form = {
+            "fname": "Иван",
+            "tel": "+79990000000",
+            "adres": "ул. Пушкинская, 69",
+            "orderTime": "Как можно скорее",
+            "bouquet_id": bouquet.pk,
+        }
+        self.client.post(reverse("create_order"), form)
+        self.client.post(reverse("create_order"), form)
+        self.client.get(reverse("quiz_1"))
+        self.client.post(reverse("quiz_1"), {"event": "Свадьба"})
+
+        text = self.get_metrics().content.decode()
+        self.assertEqual(get_sample(text, 'flowershop_orders_total{result="created"}'), 1)
+        self.assertEqual(get_sample(text, 'flowershop_orders_total{result="out_of_stock"}'), 1)
+        self.assertEqual(get_sample(text, 'flowershop_quiz_steps_total{step="start"}'), 1)
+        self.assertEqual(get_sample(text, 'flowershop_quiz_steps_total{step="event"}'), 1)
+
+    def test_notifications_are_counted_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Consultation.objects.create(name="Мария", phone="+79990000001")
+        deliver_notifications(FakeBot(), "chat", rate_limiter=RateLimiter(interval=0))
+        text = render_metrics()
+        self.assertEqual(
+            get_sample(text, 'flowershop_notifications_enqueued_total{kind="consultation"}'), 1
+        )
+        self.assertEqual(
+            get_sample(text, 'flowershop_notifications_delivered_total{result="sent"}'), 1
+        )
+        self.assertEqual(get_sample(text, "flowershop_notification_send_seconds_count"), 1)
+
+    def test_token_protects_endpoint(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        self.assertEqual(self.get_metrics("wrong").status_code, 403)
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.get_metrics("").status_code, 404)
+        response = self.get_metrics()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+
+
+class StaticPipelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = Path(tempfile.mkdtemp())
+        cls.settings_override = override_settings(STATIC_ROOT=cls.static_root)
+        cls.settings_override.enable()
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.static_root)
+        super().tearDownClass()
+
+    def get_hashed_name(self, name):
+        manifest = json.loads((self.static_root / "staticfiles.json").read_text())
+        return manifest["paths"][name]
+
+    def test_pages_link_hashed_assets(self):
+        response = self.client.get(reverse("home"))
+        self.assertContains(response, self.get_hashed_name("styles/main.css"))
+
+    def test_serves_precompressed_variant_with_long_cache(self):
+        url = "/static/" + self.get_hashed_name("styles/main.css")
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br" if storage.brotli else "gzip")
+        self.assertEqual(response["Content-Type"], "text/css")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertIn(b"margin", b"".join(response.streaming_content))
+
+    def test_unhashed_names_get_short_cache(self):
+        response = self.client.get("/static/styles/main.css")
+        self.assertEqual(response["Cache-Control"], "public, max-age=60")
+        self.assertEqual(self.client.get("/static/missing.css").status_code, 404)
+
+    async def test_served_on_async_path(self):
+        url = "/static/" + self.get_hashed_name("styles/main.css")
+        response = await self.async_client.get(url, headers={"accept-encoding": "gzip"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual((await self.async_client.get("/static/missing.css")).status_code, 404)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "password")
+        )
+        self.rose = Component.objects.create(
+            type="flower", name="Роза белая", price=Decimal("150.00")
+        )
+        self.ribbon = Component.objects.create(
+            type="accessory", name="Лента атласная", price=Decimal("50.00")
+        )
+        self.wedding = Event.objects.create(name="Свадьба")
+        self.created = 0
+
+    def add_bouquets(self, count):
+        for _ in range(count):
+            self.created += 1
+            bouquet = create_bouquet(f"Букет {self.created}")
+            bouquet.events.add(self.wedding)
+            for component in (self.rose, self.ribbon):
+                BouquetComponent.objects.create(bouquet=bouquet, component=component)
+            Order.objects.create(customer_name=f"Клиент {self.created}", bouquet=bouquet)
+
+    def count_queries(self, url, **params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        for model in ("bouquet", "order"):
+            url = reverse(f"admin:backend_{model}_changelist")
+            self.add_bouquets(2)
+            small_page = self.count_queries(url)
+            self.add_bouquets(20)
+            self.assertEqual(self.count_queries(url), small_page, model)
+
+    def test_search_by_related_names(self):
+        self.add_bouquets(2)
+        response = self.client.get(
+            reverse("admin:backend_order_changelist"), {"q": "Букет 2"}
+        )
+        self.assertEqual(response.context["cl"].result_count, 1)
+        response = self.client.get(
+            reverse("admin:backend_bouquet_changelist"), {"q": "Свадьба"}
+        )
+        self.assertEqual(response.context["cl"].result_count, 2)
+
+    def test_search_by_phone_without_country_code(self):
+        Order.objects.create(customer_name="Иван", customer_phone="+79001234567")
+        Order.objects.create(customer_name="Пётр", customer_phone="+79005550000")
+        url = reverse("admin:backend_order_changelist")
+        for term in ("+79001234567", "9001234567", "89001234567", "79001234567"):
+            response = self.client.get(url, {"q": term})
+            self.assertEqual(response.context["cl"].result_count, 1, term)
+
+    def test_large_unfiltered_lists_use_estimated_count(self):
+        self.add_bouquets(3)
+        paginator = EstimatedCountPaginator(Bouquet.objects.order_by("pk"), 10)
+        paginator.exact_count_limit = 1
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, Bouquet.objects.last().pk)
+        self.assertNotIn("COUNT", queries[0]["sql"])
+        filtered = EstimatedCountPaginator(Bouquet.objects.filter(name="Букет 1").order_by("pk"), 10)
+        filtered.exact_count_limit = 1
+        self.assertEqual(filtered.count, 1)
+
+
+class QueryPlanTests(TestCase):
+    """Ключевые запросы витрины и админки не должны читать таблицы целиком"""
+
+    # Справочники и служебные таблицы Django малы, полный проход по ним допустим
+    SMALL_TABLES = re.compile(r"(backend_event|backend_pricerange|django_\w+|auth_\w+)\b")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = Event.objects.bulk_create(
+            Event(name=f"Событие {number}") for number in range(10)
+        )
+        PriceRange.objects.create(name="До 1000", max_price=Decimal("1000"))
+        PriceRange.objects.create(name="От 2900", min_price=Decimal("2900"))
+        bouquets = Bouquet.objects.bulk_create(
+            Bouquet(
+                name=f"Букет {number}",
+                base_price=Decimal(number % 3000),
+                total_price=Decimal(number % 3000),
+                description="",
+            )
+            for number in range(3000)
+        )
+        Bouquet.events.through.objects.bulk_create(
+            Bouquet.events.through(bouquet=bouquet, event=cls.events[number % 10])
+            for number, bouquet in enumerate(bouquets)
+        )
+        Order.objects.bulk_create(
+            Order(
+                customer_name=f"Клиент {number}",
+                customer_phone=f"+7900{number:07d}",
+                bouquet=bouquets[number],
+                status=Order.STATUS_CHOICES[number % 5][0],
+            )
+            for number in range(3000)
+        )
+        Consultation.objects.bulk_create(
+            Consultation(name=f"Клиент {number}", phone=f"+7900{number:07d}")
+            for number in range(3000)
+        )
+        rebuild_quiz_index()
+        cls.bouquet = bouquets[1500]
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        cache.clear()
+        # Остатки всего каталога считаются одним проходом по составам и
+        # кешируются; этот запрос проверяется отдельно
+        get_buildable_counts()
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "password")
+        )
+
+    def is_full_scan(self, detail, sql, plan):
+        if not detail.startswith("SCAN ") or self.SMALL_TABLES.match(detail[5:]):
+            return False
+        # Агрегаты (COUNT, MIN/MAX по дате) читают только узкий индекс
+        if "USING COVERING INDEX" in detail:
+            return False
+        # Первая страница без условий в порядке индекса читает только LIMIT строк
+        return not (
+            "WHERE" not in sql
+            and re.search(r"LIMIT \d+$", sql)
+            and not any("TEMP B-TREE FOR ORDER BY" in step for step in plan)
+        )
+
+    def assertNoFullScans(self, run):
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        scans = []
+        for query in queries:
+            if not query["sql"].startswith("SELECT"):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                plan = [row[-1] for row in cursor.fetchall()]
+            scans.extend(
+                (detail, query["sql"])
+                for detail in plan
+                if self.is_full_scan(detail, query["sql"], plan)
+            )
+        self.assertEqual(scans, [])
+
+    def test_storefront_queries(self):
+        self.assertNoFullScans(lambda: filter_bouquets("Событие 3", "До 1000"))
+        self.assertNoFullScans(lambda: filter_bouquets("", "От 2900"))
+        self.assertNoFullScans(
+            lambda: self.client.get(reverse("catalog_more"), {"after": self.bouquet.pk})
+        )
+        self.assertNoFullScans(
+            lambda: self.client.get(reverse("bouquet_detail", args=[self.bouquet.pk]))
+        )
+        complete_quiz(self.client, "Событие 3", "До 1000")
+        self.assertNoFullScans(lambda: self.client.get(reverse("result")))
+
+    def test_admin_changelist_queries(self):
+        orders = reverse("admin:backend_order_changelist")
+        consultations = reverse("admin:backend_consultation_changelist")
+        year = Order.objects.first().created_at.year
+        for url, params in [
+            (orders, {}),
+            (orders, {"status__exact": "paid"}),
+            (orders, {"created_at__year": year}),
+            (orders, {"q": "+79000001500"}),
+            (consultations, {}),
+            (consultations, {"created_at__year": year}),
+            (reverse("admin:backend_bouquet_changelist"), {}),
+        ]:
+            with self.subTest(url=url, params=params):
+                self.assertNoFullScans(lambda: self.client.get(url, params))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rose = Component.objects.create(
+            type="flower", name="Роза белая", price=Decimal("150.00")
+        )
+        self.white = create_bouquet("Белое облако")
+        self.mixed = create_bouquet("Весенний микс")
+        self.mixed.description = "С розами и тюльпанами"
+        self.mixed.save()
+        BouquetComponent.objects.create(bouquet=self.white, component=self.rose)
+
+    def test_matches_word_forms_and_ranks_name_and_composition_first(self):
+        self.assertEqual(search_bouquets("белые розы"), [self.white])
+        self.assertEqual(search_bouquets("розами"), [self.white, self.mixed])
+        self.assertEqual(search_bouquets("вес"), [self.mixed])
+        self.assertEqual(search_bouquets("орхидеи"), [])
+        self.assertEqual(search_bouquets("*) OR (\""), [])
+
+    def test_index_follows_catalog_changes(self):
+        self.rose.name = "Пион розовый"
+        self.rose.save()
+        self.assertEqual(search_bouquets("пионы"), [self.white])
+
+        wedding = Event.objects.create(name="Свадьба")
+        wedding.bouquets.add(self.mixed)
+        self.assertEqual(search_bouquets("свадьбу"), [self.mixed])
+        wedding.name = "Выпускной"
+        wedding.save()
+        self.assertEqual(search_bouquets("выпускной"), [self.mixed])
+        wedding.delete()
+        self.assertEqual(search_bouquets("выпускной"), [])
+
+        self.white.delete()
+        self.assertEqual(search_bouquets("пион"), [])
+
+    def test_search_page(self):
+        response = self.client.get(reverse("search"), {"q": "ёлочные розы"})
+        self.assertContains(response, "По запросу")
+        response = self.client.get(reverse("search"), {"q": "облако"})
+        self.assertContains(response, "Белое облако")
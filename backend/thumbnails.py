@@ -0,0 +1,82 @@
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .storage import get_image_storage
+
+
+THUMBNAIL_WIDTHS = (200, 400, 800)
+# Формат файла -> (расширение, параметры сохранения Pillow)
+THUMBNAIL_FORMATS = {
+    "WEBP": ("webp", {"quality": 80, "method": 4}),
+    "JPEG": ("jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def get_derivative_name(name, width, image_format):
+    """Имя уменьшенной копии: рядом с оригиналом, с шириной и форматом в имени.
+
+    Оригиналы называются по хешу содержимого, поэтому имя копии тоже
+    однозначно определяется содержимым.
+    """
+    path = PurePosixPath(name)
+    extension = THUMBNAIL_FORMATS[image_format][0]
+    return str(path.with_name(f"{path.stem}-{width}w.{extension}"))
+
+
+def resize_to_width(image, width):
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def generate_derivatives(name, storage=None, force=False):
+    """Создаёт уменьшенные копии изображения во всех ширинах и форматах.
+
+    Уже существующие копии пропускаются, с force пересоздаются. Возвращает число созданных файлов;
+    если исходный файл отсутствует или не является изображением, возвращает 0.
+    """
+    storage = storage or get_image_storage()
+    targets = [
+        (width, image_format)
+        for width in THUMBNAIL_WIDTHS
+        for image_format in THUMBNAIL_FORMATS
+        if force or not storage.exists(get_derivative_name(name, width, image_format))
+    ]
+    if not targets:
+        return 0
+    try:
+        with storage.open(name) as source:
+            image = ImageOps.exif_transpose(Image.open(source))
+            image.load()
+    except (OSError, UnidentifiedImageError):
+        return 0
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+    resized = {}
+    for width, image_format in targets:
+        if width not in resized:
+            resized[width] = resize_to_width(image, width)
+        derivative = resized[width]
+        if image_format == "JPEG" and derivative.mode != "RGB":
+            derivative = derivative.convert("RGB")
+        buffer = BytesIO()
+        derivative.save(buffer, image_format, **THUMBNAIL_FORMATS[image_format][1])
+        storage.save_derived(
+            get_derivative_name(name, width, image_format),
+            ContentFile(buffer.getvalue()),
+            overwrite=force,
+        )
+    return len(targets)
+
+
+def get_srcset(image, image_format="JPEG"):
+    storage = image.storage
+    return ", ".join(
+        f"{storage.url(get_derivative_name(image.name, width, image_format))} {width}w"
+        for width in THUMBNAIL_WIDTHS
+    )
@@ -5,6 +5,8 @@ urlpatterns = [
     path('', views.home, name='home'),
 
     path('catalog/', views.get_catalog, name='catalog'),
+    path('catalog/more/', views.get_catalog_page, name='catalog_more'),
+    path('search/', views.search, name='search'),
     # path('recommendation/', views.get_recommendations, name='recommendation'),
     path('quiz/', views.get_quiz_first, name='quiz_1'),
     path('quiz/2', views.get_quiz_second, name='quiz_2'),
@@ -13,5 +15,7 @@ urlpatterns = [
 
     path('make_order/', views.quiz_results, name='result'),
     path('payment/', views.create_payment, name='payment'),
-    path('bouquet/<int:pk>/', views.BouquetDetailView.as_view(), name='bouquet_detail')
+    path('payment/webhook/', views.payment_webhook, name='payment_webhook'),
+    path('bouquet/<int:pk>/', views.BouquetDetailView.as_view(), name='bouquet_detail'),
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -1,49 +1,184 @@
 
+import hmac
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_POST
 from django.views.generic import DetailView
+from yookassa.domain.exceptions import ApiError
 
-from FlowerShop import settings
-from .models import Bouquet, Consultation, Order, PriceRange, Event
+from .availability import exclude_unavailable, mark_availability
+from .db import retry_on_lock
+from .metrics import (
+    CONSULTATIONS,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    ORDERS,
+    PAYMENT_CREATE_SECONDS,
+    PAYMENT_NOTIFICATIONS,
+    QUIZ_STEPS,
+    render as render_metrics,
+)
+from .models import (
+    Bouquet,
+    Consultation,
+    Event,
+    Order,
+    PaymentEvent,
+    PriceRange,
+    QuizMatch,
+)
+from .page_cache import cache_storefront_page
+from .payments import PAYMENT_EVENTS, get_idempotency_key, get_payment_client
+from .search import search_bouquets
+from .signed_state import ORDER_COOKIE, QUIZ_COOKIE, clear_state, load_state, save_state
+from .stock import OutOfStock, cancel_orders, place_order
 
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 
 
-from yookassa import Configuration, Payment
+logger = logging.getLogger(__name__)
 
 
-def create_payment(request):
-    Configuration.account_id = settings.YOOKASSA_SHOP_ID
-    Configuration.secret_key = settings.YOOKASSA_SECRET_KEY
-    bouquet_id = request.session.get('bouquet_id')
-    bouquet = get_object_or_404(Bouquet, id=bouquet_id)
-    amount = bouquet.get_price()
-    payment = Payment.create({
-        "amount": {
-            "value": str(amount),
-            "currency": "RUB"
-        },
-        "capture_mode": "AUTOMATIC",
-        "confirmation": {
-            "type": "redirect",
-            "return_url": f"http://{request.get_host()}/"
-        },
-        "description": f"Оплата заказа на сумму {amount} руб."
-    })
-    if 'bouquet_id' in request.session:
-        del request.session['bouquet_id']
+async def create_payment(request):
+    order_id = load_state(request, ORDER_COOKIE).get('order_id')
+    # Отменённый заказ оплатить нельзя: его элементы уже вернулись на склад
+    order = await aget_object_or_404(
+        Order.objects.select_related('bouquet'),
+        id=order_id,
+        bouquet__isnull=False,
+        status='pending',
+    )
+    amount = order.bouquet.total_price
+    # Запрос к ЮKassa выполняется в пуле потоков и не блокирует event loop
+    started = time.perf_counter()
+    try:
+        payment = await sync_to_async(
+            get_payment_client().create_payment, thread_sensitive=False
+        )({
+            "amount": {
+                "value": str(amount),
+                "currency": "RUB"
+            },
+            "capture": True,
+            "confirmation": {
+                "type": "redirect",
+                "return_url": f"http://{request.get_host()}/"
+            },
+            "description": f"Оплата заказа на сумму {amount} руб."
+        }, get_idempotency_key(order))
+    except Exception:
+        PAYMENT_CREATE_SECONDS.observe(time.perf_counter() - started, result="error")
+        raise
+    PAYMENT_CREATE_SECONDS.observe(time.perf_counter() - started, result="ok")
+    # Заказ мог истечь, пока создавался платёж: тогда покупатель не
+    # отправляется на оплату, а неоплаченный платёж ЮKassa закроет сама
+    if not await Order.objects.filter(
+        pk=order.pk, status='pending'
+    ).aupdate(payment_id=payment.id):
+        return clear_state(HttpResponse(status=409), ORDER_COOKIE)
+
+    return clear_state(redirect(payment.confirmation.confirmation_url), ORDER_COOKIE)
+
+
+@csrf_exempt
+@require_POST
+def payment_webhook(request):
+    try:
+        notification = json.loads(request.body)
+        event = notification['event']
+        payment_id = str(notification['object']['id'])
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest()
+    if event not in PAYMENT_EVENTS:
+        return HttpResponse()
+    if PaymentEvent.objects.filter(payment_id=payment_id, event=event).exists():
+        return HttpResponse()
+
+    # Тело уведомления не подписано, поэтому статус сверяется с API ЮKassa
+    payment_status, order_status = PAYMENT_EVENTS[event]
+    try:
+        payment = get_payment_client().get_payment(payment_id)
+    except ApiError:
+        return HttpResponseBadRequest()
+    if payment.status != payment_status:
+        return HttpResponseBadRequest()
+
+    with transaction.atomic():
+        PaymentEvent.objects.bulk_create(
+            [PaymentEvent(payment_id=payment_id, event=event)],
+            ignore_conflicts=True,
+        )
+        orders = Order.objects.filter(payment_id=payment_id)
+        if order_status == "canceled":
+            cancel_orders(orders)
+        elif not orders.move_to(order_status) and orders.filter(status="canceled").exists():
+            # Заказ отменён (например, из админки), а покупатель успел
+            # оплатить: элементы уже на складе, деньги нужно вернуть вручную
+            logger.error("Оплачен отменённый заказ, нужен возврат: платёж %s", payment_id)
+    PAYMENT_NOTIFICATIONS.inc(event=event)
+    return HttpResponse()
+
+
+def metrics(request):
+    """Метрики всех процессов сервера в текстовом формате Prometheus"""
+    token = settings.METRICS_TOKEN
+    # Объёмы заказов и платежей не публикуются: без токена эндпоинта нет
+    if not token:
+        raise Http404
+    if not hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+
+CATALOG_ROW_SIZE = 3
+CATALOG_PAGE_SIZE = 6
+
+
+def get_bouquets_page(after=None, page_size=CATALOG_PAGE_SIZE):
+    """Страница каталога с keyset-пагинацией по id.
+
+    Возвращает букеты страницы и курсор следующей страницы (None, если
+    это последняя страница).
+    """
+    bouquets = Bouquet.objects.order_by('pk')
+    if after is not None:
+        bouquets = bouquets.filter(pk__gt=after)
+    page = mark_availability(list(bouquets[:page_size + 1]))
+    if len(page) > page_size:
+        return page[:page_size], page[page_size - 1].pk
+    return page, None
+
+
+def split_into_rows(bouquets, row_size=CATALOG_ROW_SIZE):
+    return [bouquets[i:i + row_size] for i in range(0, len(bouquets), row_size)]
+
 
-    return redirect(payment.confirmation.confirmation_url)
+def get_cursor(request):
+    after = request.GET.get('after', '')
+    return int(after) if after.isdigit() else None
 
 
+@cache_storefront_page
 def home(request):
-    bouquets = list(Bouquet.objects.all())
-    first_row = bouquets[:3]
+    first_row = mark_availability(list(Bouquet.objects.order_by('pk')[:CATALOG_ROW_SIZE]))
     return render(request, 'index.html', {'first_row': first_row})
 
 
+@method_decorator(cache_storefront_page, name='dispatch')
 class BouquetDetailView(DetailView):
     model = Bouquet
     template_name = 'card.html'
     context_object_name = 'bouquet'
+    queryset = Bouquet.objects.prefetch_related('components__component')
 
 
 def create_order(request, ):
@@ -56,39 +191,67 @@ def create_order(request, ):
         bouquet_id = request.POST.get('bouquet_id')
         bouquet = get_object_or_404(Bouquet, id=bouquet_id)
 
-        Order.objects.create(
-            customer_name=name,
-            customer_phone=phone,
-            delivery_address=address,
-            delivery_time=delivery_time,
-            bouquet=bouquet,
-
-        )
-        request.session['bouquet_id'] = bouquet_id
-        return redirect('payment')
+        try:
+            order = place_order(
+                bouquet,
+                customer_name=name,
+                customer_phone=phone,
+                delivery_address=address,
+                delivery_time=delivery_time,
+            )
+        except OutOfStock as error:
+            ORDERS.inc(result='out_of_stock')
+            return render(request, 'order.html', {
+                'bouquet_id': bouquet_id,
+                'out_of_stock': error.components,
+            }, status=409)
+        ORDERS.inc(result='created')
+        return save_state(redirect('payment'), ORDER_COOKIE, {'order_id': order.pk})
     bouquet_id = request.GET.get('bouquet_id')
     return render(request, 'order.html', {'bouquet_id': bouquet_id})
 
 
+@cache_storefront_page
 def get_catalog(request):
-    bouquets = list(Bouquet.objects.all())
-    first_row = bouquets[:3]
-    second_row = bouquets[3:6] if len(bouquets) > 3 else None
+    bouquets, next_cursor = get_bouquets_page(get_cursor(request))
 
     return render(request, 'catalog.html', {
-        'first_row': first_row,
-        'second_row': second_row
+        'rows': split_into_rows(bouquets),
+        'next_cursor': next_cursor,
+    })
+
+
+def get_catalog_page(request):
+    bouquets, next_cursor = get_bouquets_page(get_cursor(request))
+    response = render(request, 'catalog-rows.html', {
+        'rows': split_into_rows(bouquets),
     })
+    if next_cursor:
+        response['X-Next-Cursor'] = next_cursor
+    return response
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    bouquets = mark_availability(search_bouquets(query)) if query else []
+    return render(request, 'search.html', {
+        'query': query,
+        'rows': split_into_rows(bouquets),
+    })
+
+
+@retry_on_lock()
+def create_consultation(name, phone):
+    with transaction.atomic():
+        return Consultation.objects.create(name=name, phone=phone)
 
 
 def get_consultation(request):
     if request.method == 'POST':
         name = request.POST.get('fname')
         phone = request.POST.get('tel')
-        Consultation.objects.create(
-            name=name,
-            phone=phone,
-        )
+        create_consultation(name, phone)
+        CONSULTATIONS.inc()
 
         return redirect('home')
 
@@ -98,33 +261,26 @@ def get_consultation(request):
 def get_quiz_first(request):
     if request.method == 'POST':
         event = request.POST.get('event')
-        request.session['event'] = event
-        return redirect('quiz_2')
+        QUIZ_STEPS.inc(step='event')
+        return save_state(redirect('quiz_2'), QUIZ_COOKIE, {'event': event})
+    QUIZ_STEPS.inc(step='start')
     events = Event.objects.all()
     return render(request, 'quiz.html',{'events': events})
 
 
 def get_quiz_second(request):
     if request.method == 'POST':
-        budget = request.POST.get('budget')
-        request.session['budget'] = budget
-        return redirect('result')
+        state = load_state(request, QUIZ_COOKIE)
+        state['budget'] = request.POST.get('budget')
+        QUIZ_STEPS.inc(step='budget')
+        return save_state(redirect('result'), QUIZ_COOKIE, state)
     price_ranges = PriceRange.objects.all()
-    print(price_ranges)
     return render(request, 'quiz-step.html', {'price_ranges': price_ranges})
 
 
-def quiz_results(request):
-    event_name = request.session.get('event')
-    budget = request.session.get('budget')
+def filter_bouquets(event_name, budget):
+    """Подбор букетов без индекса — когда событие или бюджет не выбраны"""
     bouquets = Bouquet.objects.all()
-    # event_display = {
-    #     "wedding": 'Свадьба',
-    #     "no_occasion": 'Без повода',
-    #     "birthday": 'День рождения',
-    #
-    # }.get(event, event)
-    price_range = None
     event = Event.objects.filter(name=event_name).first()
     if event:
         bouquets = bouquets.filter(events=event)
@@ -138,11 +294,40 @@ def quiz_results(request):
                 bouquets = bouquets.filter(
                     total_price__lte=price_range.max_price)
         else:
-            bouquets.objects.none()
-    is_there_any_fower = bouquets.exists()
+            bouquets = bouquets.none()
+    # Сортировка в Python: с ORDER BY id SQLite предпочитает полный проход
+    # по таблице индексу по цене
+    return sorted(bouquets, key=lambda bouquet: bouquet.pk)
+
+
+QUIZ_RESULTS_BATCH_SIZE = 500
+
+
+def quiz_results(request):
+    state = load_state(request, QUIZ_COOKIE)
+    event_name = state.get('event')
+    budget = state.get('budget')
+    if event_name and budget:
+        bouquet_ids = QuizMatch.objects.filter(
+            event__name=event_name, price_range__name=budget
+        ).values_list('bouquet_ids', flat=True).first() or []
+        # id отсортированы, поэтому пачки склеиваются без пересортировки;
+        # одним IN на широком диапазоне можно упереться в лимит параметров SQLite
+        bouquets = [
+            bouquet
+            for start in range(0, len(bouquet_ids), QUIZ_RESULTS_BATCH_SIZE)
+            for bouquet in Bouquet.objects.filter(
+                pk__in=bouquet_ids[start:start + QUIZ_RESULTS_BATCH_SIZE]
+            ).order_by('pk')
+        ]
+    else:
+        bouquets = filter_bouquets(event_name, budget)
+    # Квиз предлагает только букеты, которые можно собрать прямо сейчас
+    bouquets = exclude_unavailable(bouquets)
+    QUIZ_STEPS.inc(step='results' if bouquets else 'no_results')
     return render(request, 'result.html', {
-        'is_there_any_flower': is_there_any_fower,
-        'event': event.name,
+        'is_there_any_flower': bool(bouquets),
+        'event': event_name,
         'budget': budget,
         'bouquets': bouquets,
     })
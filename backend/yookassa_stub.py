@@ -0,0 +1,93 @@
+"""Локальная заглушка API ЮKassa для нагрузочных тестов.
+
+Поддерживает создание и получение платежей с учётом Idempotence-Key и
+может имитировать задержку ответа платёжного провайдера.
+"""
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class YooKassaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.endswith("/payments"):
+            self.send_json(404, {"type": "error", "code": "not_found"})
+            return
+        key = self.headers.get("Idempotence-Key")
+        if not key:
+            self.send_json(400, {"type": "error", "code": "invalid_request"})
+            return
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            payment = self.server.payments_by_key.get(key)
+            if payment is None:
+                payment = self.server.build_payment(json.loads(body))
+                self.server.payments_by_key[key] = payment
+                self.server.payments[payment["id"]] = payment
+        self.send_json(200, payment)
+
+    def do_GET(self):
+        payment_id = self.path.rstrip("/").rsplit("/", 1)[-1]
+        payment = self.server.payments.get(payment_id)
+        if payment is None:
+            self.send_json(404, {"type": "error", "code": "not_found"})
+            return
+        self.send_json(200, payment)
+
+
+class YooKassaStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0):
+        super().__init__(address, YooKassaStubHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.payments = {}
+        self.payments_by_key = {}
+
+    @property
+    def api_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v3"
+
+    def build_payment(self, request):
+        payment_id = str(uuid.uuid4())
+        return {
+            "id": payment_id,
+            "status": "pending",
+            "paid": False,
+            "test": True,
+            "refundable": False,
+            "amount": request["amount"],
+            "description": request.get("description", ""),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "recipient": {"account_id": "stub", "gateway_id": "stub"},
+            "confirmation": {
+                "type": "redirect",
+                "confirmation_url": f"{self.api_url}/checkout/{payment_id}",
+            },
+        }
+
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0):
+    """Запускает заглушку в фоновом потоке и возвращает сервер"""
+    server = YooKassaStubServer((host, port), latency=latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server